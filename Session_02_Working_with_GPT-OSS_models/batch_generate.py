@@ -0,0 +1,45 @@
+"""
+Run every prompt of a JSONL file through a model with batched generation.
+
+Each input line is a JSON object such as {"id": "q1", "prompt": "...", "system": "..."}.
+Results are appended to the output file as they finish, so rerunning the same
+command after an interruption continues where it stopped.
+
+    uv run python batch_generate.py prompts.jsonl results.jsonl
+    uv run python batch_generate.py prompts.jsonl results.jsonl --model qwen --max-tokens 512 --batch-size 16
+"""
+
+import argparse
+
+from utilities import get_model, run_batch
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("input", help="JSONL file of prompts")
+parser.add_argument("output", help="JSONL file of results (appended to)")
+parser.add_argument("--model", default="gpt", help="Model alias, ModelType name or model ID")
+parser.add_argument("--prompt-field", default="prompt", help="Key of the prompt in each record")
+parser.add_argument("--reasoning-level", default="low", choices=["low", "medium", "high"])
+parser.add_argument("--max-tokens", type=int, default=None)
+parser.add_argument("--temperature", type=float, default=0.0)
+parser.add_argument("--top-p", type=float, default=1.0)
+parser.add_argument("--batch-size", type=int, default=32)
+parser.add_argument("--window", type=int, default=512, help="Records read and sorted by length at a time")
+parser.add_argument("--keep-raw", action="store_true", help="Also write the unextracted model output")
+args = parser.parse_args()
+
+model, tokenizer, model_id = get_model(args.model)
+run_batch(
+    model,
+    tokenizer,
+    args.input,
+    args.output,
+    model_id=model_id,
+    prompt_field=args.prompt_field,
+    reasoning_level=args.reasoning_level,
+    max_tokens=args.max_tokens,
+    temperature=args.temperature,
+    top_p=args.top_p,
+    batch_size=args.batch_size,
+    window=args.window,
+    keep_raw=args.keep_raw,
+)
@@ -1,6 +1,36 @@
 from .utils import generate_response, generate_response_with_system
+from .async_generation import agenerate_response, astream_response
 from .create_cache import create_cache
 from .get_model import get_model, ModelType, list_available_models
+from .sampling import Completion, sample_n, benchmark_parallel_sampling
+from .eviction import ImportanceKVCache, make_eviction_cache, benchmark_eviction
+from .session_cache import SessionCacheManager, benchmark_session_cache
+from .batch_runner import run_batch
+from .constrained import (
+    TokenFSM,
+    ConstrainedLogitsProcessor,
+    json_schema_to_regex,
+    constraint_processor,
+    benchmark_constrained,
+)
+from .chat_template import IncrementalChatRenderer, get_renderer, validate_chat_templates
+from .tracing import Tracer, trace
+from .scheduler import (
+    PriorityClass,
+    DEFAULT_CLASSES,
+    Request,
+    Scheduler,
+    benchmark_chunked_prefill,
+    benchmark_priorities,
+)
+from .variants import MODEL_VARIANTS, list_variants, select_variant, benchmark_variants
+from .adapters import (
+    AdapterRegistry,
+    MultiLoRALinear,
+    get_adapter_registry,
+    generate_batch,
+    benchmark_adapters,
+)
 from .harmony_tools import (
     print_harmony_messages,
     display_harmony_response,
@@ -15,10 +45,46 @@ from .harmony_tools import (
 __all__ = [
     'generate_response',
     'generate_response_with_system',
+    'agenerate_response',
+    'astream_response',
     'create_cache', 
     'get_model',
     'ModelType',
     'list_available_models',
+    'Completion',
+    'sample_n',
+    'benchmark_parallel_sampling',
+    'ImportanceKVCache',
+    'make_eviction_cache',
+    'benchmark_eviction',
+    'SessionCacheManager',
+    'benchmark_session_cache',
+    'run_batch',
+    'TokenFSM',
+    'ConstrainedLogitsProcessor',
+    'json_schema_to_regex',
+    'constraint_processor',
+    'benchmark_constrained',
+    'IncrementalChatRenderer',
+    'get_renderer',
+    'validate_chat_templates',
+    'Tracer',
+    'trace',
+    'PriorityClass',
+    'DEFAULT_CLASSES',
+    'Request',
+    'Scheduler',
+    'benchmark_chunked_prefill',
+    'benchmark_priorities',
+    'MODEL_VARIANTS',
+    'list_variants',
+    'select_variant',
+    'benchmark_variants',
+    'AdapterRegistry',
+    'MultiLoRALinear',
+    'get_adapter_registry',
+    'generate_batch',
+    'benchmark_adapters',
     'print_harmony_messages',
     'display_harmony_response',
     'display_response_raw',
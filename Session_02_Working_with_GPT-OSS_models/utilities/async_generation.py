@@ -0,0 +1,203 @@
+"""
+Coroutine versions of ``generate_response`` that never block the event loop.
+
+Calling ``generate_response`` from async code (a web handler, or a notebook
+that needs ``nest_asyncio``) blocks the event loop for the whole generation.
+Here the MLX work runs on one dedicated thread per model, which owns the model
+from then on: requests from any number of coroutines queue up for that thread
+and run one after another, so MLX is never used from two threads at once.
+Tokens travel back to the awaiting coroutine through an ``asyncio.Queue``.
+
+Cancelling the awaiting task (or leaving an ``async for`` early) stops decoding
+at the next token; a request that has not started yet is dropped from the queue.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
+
+from .adapters import adapter_scope
+from .tracing import traced_stream_generate
+from .utils import _build_prompt, _extract_harmony_final
+
+_FINAL_MARKER = "<|channel|>final<|message|>"
+_END_MARKERS = ("<|end|>", "<|return|>")
+_DONE = object()
+
+
+async def astream_response(
+    model,
+    tokenizer,
+    user_message: str,
+    system_message: Optional[str] = None,
+    model_id: str = None,
+    prompt_cache=None,
+    reasoning_level: str = "low",
+    adapter: Optional[str] = None,
+    final_only: bool = True,
+    **kwargs
+) -> AsyncIterator[str]:
+    """
+    Stream a response as text pieces, generating on the model's own thread.
+
+    Args:
+        model: The loaded MLX model
+        tokenizer: The tokenizer for the model
+        user_message: The user's input message
+        system_message: Optional system-level instructions
+        model_id: The model identifier (used to determine prompt format)
+        prompt_cache: Optional prompt cache for multi-turn conversations
+        reasoning_level: For GPT-OSS models: "low", "medium" or "high"
+        adapter: Name of a loaded LoRA adapter; None uses the base model
+        final_only: For GPT-OSS models, stream only the final channel instead
+                    of the raw Harmony output
+        **kwargs: Additional arguments for ``mlx_lm.stream_generate``
+                  (e.g., max_tokens, sampler)
+
+    Yields:
+        Text pieces as they are decoded
+
+    Example:
+        >>> async for text in astream_response(model, tokenizer, "Tell me a joke.", model_id=MODEL_ID):
+        ...     print(text, end="", flush=True)
+    """
+    is_gpt_oss = model_id and ("gpt-oss" in model_id.lower() or "oss-gpt" in model_id.lower())
+    prompt = _build_prompt(tokenizer, user_message, system_message, is_gpt_oss, reasoning_level)
+    if is_gpt_oss:
+        kwargs.setdefault("max_tokens", 2048)
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The event loop is gone; nobody is listening any more
+            cancelled.set()
+
+    def work():
+        try:
+            with adapter_scope(model, adapter):
+                for response in traced_stream_generate(model, tokenizer, prompt, prompt_cache=prompt_cache, **kwargs):
+                    if cancelled.is_set():
+                        break
+                    put(response.text)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    future = _executor(model).submit(work)
+    final = _FinalChannelFilter() if is_gpt_oss and final_only else None
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            text = final.feed(item) if final else item
+            if text:
+                yield text
+        if final:
+            text = final.flush()
+            if text:
+                yield text
+    finally:
+        cancelled.set()
+        future.cancel()
+
+
+async def agenerate_response(
+    model,
+    tokenizer,
+    user_message: str,
+    system_message: Optional[str] = None,
+    model_id: str = None,
+    prompt_cache=None,
+    reasoning_level: str = "low",
+    adapter: Optional[str] = None,
+    **kwargs
+) -> str:
+    """
+    Generate a response without blocking the event loop.
+
+    Takes the same arguments as ``astream_response``.  Many calls can be
+    awaited at once (e.g. with ``asyncio.gather``); they run one after another
+    on the model's thread.
+
+    Returns:
+        The response text (the final channel for GPT-OSS models)
+
+    Example:
+        >>> answers = await asyncio.gather(*(
+        ...     agenerate_response(model, tokenizer, q, model_id=MODEL_ID) for q in questions
+        ... ))
+    """
+    is_gpt_oss = model_id and ("gpt-oss" in model_id.lower() or "oss-gpt" in model_id.lower())
+    stream = astream_response(
+        model, tokenizer, user_message, system_message, model_id, prompt_cache,
+        reasoning_level, adapter, final_only=False, **kwargs
+    )
+    # aclosing stops the generation thread promptly if this task is cancelled
+    async with aclosing(stream):
+        response = "".join([text async for text in stream])
+    return _extract_harmony_final(response) if is_gpt_oss else response
+
+
+def _executor(model) -> ThreadPoolExecutor:
+    """The single thread that runs all generation for ``model``."""
+    executor = getattr(model, "_generation_executor", None)
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mlx-generate")
+        model._generation_executor = executor
+    return executor
+
+
+class _FinalChannelFilter:
+    """Pass through only the text of the Harmony final channel, as it streams."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_final = False
+        self._ended = False
+        self._emitted = False
+
+    def feed(self, text: str) -> str:
+        if self._ended:
+            return ""
+        self._buffer += text
+        if not self._in_final:
+            start = self._buffer.find(_FINAL_MARKER)
+            if start < 0:
+                # Keep only what could be the start of the marker
+                self._buffer = self._buffer[-len(_FINAL_MARKER):]
+                return ""
+            self._in_final = True
+            self._buffer = self._buffer[start + len(_FINAL_MARKER):]
+        for marker in _END_MARKERS:
+            end = self._buffer.find(marker)
+            if end >= 0:
+                self._ended = True
+                out, self._buffer = self._buffer[:end].rstrip(), ""
+                return self._emit(out)
+        # Hold back a tail that could be the start of an end marker
+        hold = max(len(m) for m in _END_MARKERS) - 1
+        out, self._buffer = self._buffer[:-hold], self._buffer[-hold:]
+        return self._emit(out)
+
+    def _emit(self, text: str) -> str:
+        # Like _extract_harmony_final, drop whitespace before the answer
+        if not self._emitted:
+            text = text.lstrip()
+            self._emitted = bool(text)
+        return text
+
+    def flush(self) -> str:
+        out = self._buffer.rstrip() if self._in_final and not self._ended else ""
+        self._buffer = ""
+        return self._emit(out)
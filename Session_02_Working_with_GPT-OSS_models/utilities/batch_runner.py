@@ -0,0 +1,202 @@
+"""
+Offline batch generation from a JSONL file of prompts, resumable after a crash.
+
+``generate_response`` answers one prompt at a time, so running a whole prompt
+set through it leaves the GPU mostly idle and loses everything when the job is
+killed.  ``run_batch`` streams the input file, formats each prompt the way
+``generate_response`` does (Harmony for GPT-OSS, the chat template otherwise)
+and feeds ``mlx_lm``'s ``BatchGenerator``:
+
+- Prompts are read ``window`` records at a time.  ``BatchGenerator`` keeps its
+  queue sorted by length, so prompts of similar length are prefilled together
+  with little padding, and finished sequences are replaced by queued ones
+  without waiting for the whole batch (continuous batching).
+- Every finished prompt is appended to the output file at once.  The output
+  is the checkpoint: on restart, records whose ``id`` is already in the output
+  are skipped, and a line cut off by the crash is discarded.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from mlx_lm.generate import BatchGenerator
+from mlx_lm.sample_utils import make_sampler
+
+from .utils import _build_prompt, _extract_harmony_final
+
+
+def run_batch(
+    model,
+    tokenizer,
+    input_path: str,
+    output_path: str,
+    model_id: str = None,
+    prompt_field: str = "prompt",
+    reasoning_level: str = "low",
+    max_tokens: Optional[int] = None,
+    temperature: float = 0.0,
+    top_p: float = 1.0,
+    batch_size: int = 32,
+    window: int = 512,
+    keep_raw: bool = False,
+    report_every: float = 10.0,
+) -> Dict:
+    """
+    Generate a response for every record of a JSONL file, appending to another.
+
+    Each input line is a JSON object with the prompt in ``prompt_field``, an
+    optional ``"system"`` message and an optional ``"id"`` (default: the line
+    number).  Each output line has "id", "response", "finish_reason",
+    "prompt_tokens" and "generation_tokens", plus "raw" with ``keep_raw``.
+    For GPT-OSS models "response" is the Harmony final channel.
+
+    Args:
+        model: The loaded MLX model
+        tokenizer: The tokenizer for the model
+        input_path: JSONL file of prompts
+        output_path: JSONL file of results; existing results are kept and skipped
+        model_id: The model identifier (used to determine prompt format)
+        prompt_field: Key of the prompt in each input record
+        reasoning_level: For GPT-OSS models: "low", "medium" or "high"
+        max_tokens: Maximum tokens per response (default: 2048 for GPT-OSS, else 256)
+        temperature: Sampling temperature; 0 is greedy
+        top_p: Nucleus sampling threshold
+        batch_size: Sequences decoded together
+        window: Records read and length-sorted at a time
+        keep_raw: Also write the unextracted model output
+        report_every: Seconds between progress lines
+
+    Returns:
+        Dictionary with "completed", "skipped", "seconds", "prompts_per_second"
+        and "generation_tps" for this run
+
+    Example:
+        >>> run_batch(model, tokenizer, "prompts.jsonl", "results.jsonl", model_id=MODEL_ID)
+    """
+    is_gpt_oss = model_id and ("gpt-oss" in model_id.lower() or "oss-gpt" in model_id.lower())
+    if max_tokens is None:
+        max_tokens = 2048 if is_gpt_oss else 256
+
+    done = _completed_ids(output_path)
+    total = sum(1 for _ in _read_records(input_path, prompt_field)) - len(done)
+    print(f"📄 {input_path}: {total} prompts to run, {len(done)} already in {output_path}")
+
+    gen = BatchGenerator(
+        model,
+        max_tokens=max_tokens,
+        stop_tokens=tokenizer.eos_token_ids,
+        sampler=make_sampler(temp=temperature, top_p=top_p),
+        completion_batch_size=batch_size,
+        prefill_batch_size=min(8, batch_size),
+    )
+    records = (
+        (record_id, record) for record_id, record in _read_records(input_path, prompt_field)
+        if str(record_id) not in done
+    )
+    pending: Dict[int, dict] = {}  # uid -> record id, prompt length and tokens so far
+    completed = generated = 0
+    start = last_report = time.perf_counter()
+
+    with open(output_path, "a") as out:
+        exhausted = False
+        while True:
+            # Top the queue up before it runs dry so the batch stays full
+            if not exhausted and len(gen.unprocessed_prompts) < batch_size:
+                chunk = []
+                for record_id, record in records:
+                    chunk.append((record_id, _format_prompt(tokenizer, record, prompt_field, is_gpt_oss, reasoning_level)))
+                    if len(chunk) == window:
+                        break
+                exhausted = len(chunk) < window
+                if chunk:
+                    uids = gen.insert([tokens for _, tokens in chunk])
+                    for uid, (record_id, tokens) in zip(uids, chunk):
+                        pending[uid] = {"id": record_id, "prompt_tokens": len(tokens), "tokens": []}
+            if not pending:
+                break
+
+            for r in gen.next():
+                entry = pending[r.uid]
+                if r.finish_reason != "stop":
+                    entry["tokens"].append(r.token)
+                if r.finish_reason is None:
+                    continue
+                del pending[r.uid]
+                raw = tokenizer.decode(entry["tokens"])
+                result = {
+                    "id": entry["id"],
+                    "response": _extract_harmony_final(raw) if is_gpt_oss else raw,
+                    "finish_reason": r.finish_reason,
+                    "prompt_tokens": entry["prompt_tokens"],
+                    "generation_tokens": len(entry["tokens"]),
+                }
+                if keep_raw:
+                    result["raw"] = raw
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                completed += 1
+                generated += len(entry["tokens"])
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                os.fsync(out.fileno())
+                _report(completed, total, generated, now - start)
+                last_report = now
+
+    gen.close()
+    seconds = time.perf_counter() - start
+    _report(completed, total, generated, seconds)
+    print(f"✓ Wrote {completed} results to {output_path}")
+    return {
+        "completed": completed,
+        "skipped": len(done),
+        "seconds": seconds,
+        "prompts_per_second": completed / seconds if seconds else 0.0,
+        "generation_tps": generated / seconds if seconds else 0.0,
+    }
+
+
+def _read_records(input_path: str, prompt_field: str) -> Iterator[Tuple[object, dict]]:
+    with open(input_path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if prompt_field not in record:
+                raise ValueError(f"{input_path}:{line_number} has no '{prompt_field}' field")
+            yield record.get("id", line_number), record
+
+
+def _completed_ids(output_path: str) -> set:
+    path = Path(output_path)
+    if not path.exists():
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        # A crash can leave a half-written last line; drop it
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    return {str(json.loads(line)["id"]) for line in data[:end].splitlines() if line.strip()}
+
+
+def _format_prompt(tokenizer, record: dict, prompt_field: str, is_gpt_oss: bool, reasoning_level: str) -> list:
+    prompt = _build_prompt(tokenizer, record[prompt_field], record.get("system"), is_gpt_oss, reasoning_level)
+    add_special_tokens = tokenizer.bos_token is None or not prompt.startswith(tokenizer.bos_token)
+    return tokenizer.encode(prompt, add_special_tokens=add_special_tokens)
+
+
+def _report(completed: int, total: int, generated: int, seconds: float) -> None:
+    rate = completed / seconds if seconds else 0.0
+    if rate:
+        minutes, secs = divmod(int((total - completed) / rate), 60)
+        eta_text = f"{minutes // 60}:{minutes % 60:02d}:{secs:02d}"
+    else:
+        eta_text = "--:--:--"
+    print(
+        f"[{completed}/{total}] {rate:.2f} prompts/s, {generated / seconds if seconds else 0.0:.1f} tok/s, "
+        f"ETA {eta_text}"
+    )
@@ -0,0 +1,356 @@
+"""
+Incremental chat-template rendering: each message is rendered and tokenized once.
+
+``tokenizer.apply_chat_template`` renders the Jinja template over the whole
+message list and the result is then tokenized from the start, so every turn of
+a growing conversation redoes the work of all previous turns.
+
+``IncrementalChatRenderer`` memoizes each message's rendered and tokenized span,
+keyed by the template hash, the previous message's role, the message's role and
+a hash of its content.  A new message's span is cut out of a short probe
+conversation rendered around it, so its cost does not depend on the
+conversation's length, and only the new messages' tokens are encoded.  The
+generation prompt is memoized per last role in the same way.  The memo is an
+LRU of ``max_spans`` spans, so a long-running app's memory stays bounded.
+
+With a ``prompt_cache`` that holds the earlier turns, ``render_delta`` returns
+only the tokens the cache is missing, so the history is not prefilled again.
+
+This relies on the template rendering each message independently of the
+messages further back.  The first conversation that uses each (previous role,
+role) context, and each way of ending it, is compared against a full
+``apply_chat_template`` once.  A context that does not match, or a message with
+fields other than role and content, falls back to a full render.
+``validate_chat_templates`` runs the comparison for every ``ModelType``.
+"""
+
+import hashlib
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .tracing import traced
+
+# Short conversations placed before a new message so the template renders it
+# in the right context; keyed by the previous message's role
+_PROBE_PREFIXES = {
+    None: [],
+    "system": [{"role": "system", "content": "You are a helpful assistant."}],
+    "user": [{"role": "user", "content": "Hello."}],
+    "assistant": [{"role": "user", "content": "Hello."}, {"role": "assistant", "content": "Hi there."}],
+    "tool": [{"role": "user", "content": "Hello."}, {"role": "tool", "content": "{}"}],
+}
+# Placed after a new message, because some templates render the last message
+# differently (e.g. Qwen3 adds an empty think block to a trailing assistant turn)
+_FOLLOW_UP = {"role": "user", "content": "Go on."}
+
+
+class IncrementalChatRenderer:
+    """
+    Renders chat messages to prompt tokens, reusing the spans of messages seen before.
+
+    Example:
+        >>> renderer = get_renderer(tokenizer)
+        >>> prompt_tokens = renderer.render(history + [{"role": "user", "content": "And then?"}])
+        >>> renderer.last_new_tokens  # tokens actually rendered for this call
+        >>> new_tokens = renderer.render_delta(messages, prompt_cache)  # only what the cache lacks
+    """
+
+    def __init__(self, tokenizer, max_spans: int = 4096):
+        """
+        Args:
+            tokenizer: The tokenizer whose chat template is rendered
+            max_spans: Message spans kept; the least recently used are evicted
+        """
+        self.tokenizer = tokenizer
+        self.template_hash = hashlib.sha256((tokenizer.chat_template or "").encode()).hexdigest()[:16]
+        self.max_spans = max_spans
+        self._spans: "OrderedDict[tuple, Tuple[str, List[int]]]" = OrderedDict()
+        # Prompt tokens last rendered into each prompt cache, keyed by its first layer
+        self._cache_prompts = weakref.WeakKeyDictionary()
+        self._generation_prompts: Dict[Optional[str], Tuple[str, List[int]]] = {}
+        self._follow_up_text: Optional[str] = None
+        # (previous role, role) and ending contexts checked against a full render, or found to need one
+        self._verified = set()
+        self._unsupported = set()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.last_new_tokens = 0
+
+    def render(self, messages: Sequence[Dict[str, str]], add_generation_prompt: bool = True) -> List[int]:
+        """Token IDs of the prompt, equal to tokenizing ``apply_chat_template``'s text."""
+        return self._render(messages, add_generation_prompt)[1]
+
+    def render_text(self, messages: Sequence[Dict[str, str]], add_generation_prompt: bool = True) -> str:
+        """The prompt text, byte-identical to ``apply_chat_template(..., tokenize=False)``."""
+        return self._render(messages, add_generation_prompt)[0]
+
+    def render_delta(
+        self,
+        messages: Sequence[Dict[str, str]],
+        prompt_cache: list,
+        add_generation_prompt: bool = True,
+    ) -> List[int]:
+        """
+        The prompt tokens ``prompt_cache`` does not hold yet, for a conversation that grows turn by turn.
+
+        The cache holds the previous prompt and the generated reply, but the
+        template renders that reply in its own way (e.g. with an end-of-turn
+        marker), so the cache is trimmed back to where this render and the
+        previous one part and the tokens from there on are returned.  Feed
+        them to the model with ``prompt_cache`` as usual.
+
+        ``prompt_cache`` must start empty and be extended only by generating
+        from this method's output.
+
+        Raises:
+            ValueError: If the cache holds tokens this renderer did not render
+                into it, or it would need trimming and cannot be trimmed
+                (e.g. a full rotating or eviction cache)
+        """
+        from mlx_lm.models.cache import can_trim_prompt_cache, trim_prompt_cache
+
+        tokens = self.render(messages, add_generation_prompt)
+        layer = prompt_cache[0]
+        previous = self._cache_prompts.get(layer)
+        start = 0
+        if layer.offset > 0:
+            if previous is None or layer.offset < len(previous):
+                raise ValueError("prompt_cache holds tokens that were not rendered by render_delta")
+            for a, b in zip(previous, tokens):
+                if a != b:
+                    break
+                start += 1
+            # At least one token has to be fed to produce the next logits
+            start = min(start, len(tokens) - 1)
+            if layer.offset > start:
+                if not can_trim_prompt_cache(prompt_cache):
+                    raise ValueError("prompt_cache cannot be trimmed back to the previous prompt")
+                trim_prompt_cache(prompt_cache, layer.offset - start)
+        self._cache_prompts[layer] = tokens
+        return tokens[start:]
+
+    def validate(self, messages: Sequence[Dict[str, str]], add_generation_prompt: bool = True) -> bool:
+        """Whether the incremental text and tokens match a full render of ``messages``."""
+        text, tokens = self._render(messages, add_generation_prompt)
+        expected = self._full_text(messages, add_generation_prompt)
+        return text == expected and tokens == self._encode(expected)
+
+    def stats(self) -> Dict[str, int]:
+        return {"spans": len(self._spans), "hits": self.hits, "misses": self.misses, "fallbacks": self.fallbacks}
+
+    @traced("chat template")
+    def _render(self, messages, add_generation_prompt) -> Tuple[str, List[int]]:
+        texts, tokens = [], []
+        new_tokens = 0
+        contexts = set()
+        previous = None
+        for message in messages:
+            role, content = message["role"], message.get("content") or ""
+            context = (previous, role)
+            if set(message) - {"role", "content"} or context in self._unsupported:
+                return self._fallback(messages, add_generation_prompt)
+            key = (self.template_hash, previous, role, hashlib.sha256(content.encode()).hexdigest())
+            span = self._spans.get(key)
+            if span is None:
+                span = self._span(previous, message)
+                if span is None:
+                    self._unsupported.add(context)
+                    return self._fallback(messages, add_generation_prompt)
+                self._spans[key] = span
+                if len(self._spans) > self.max_spans:
+                    self._spans.popitem(last=False)
+                self.misses += 1
+                new_tokens += len(span[1])
+            else:
+                self._spans.move_to_end(key)
+                self.hits += 1
+            texts.append(span[0])
+            tokens.extend(span[1])
+            contexts.add(context)
+            previous = role
+
+        # How the conversation ends is a context of its own: some templates
+        # render the last message differently (e.g. Qwen3's trailing assistant turn)
+        ending = ("end", context if messages else None, add_generation_prompt)
+        if ending in self._unsupported:
+            return self._fallback(messages, add_generation_prompt)
+        if add_generation_prompt:
+            if previous not in self._generation_prompts:
+                prompt = self._generation_prompt(previous)
+                if prompt is None:
+                    self._unsupported.add(ending)
+                    return self._fallback(messages, add_generation_prompt)
+                self._generation_prompts[previous] = prompt
+            texts.append(self._generation_prompts[previous][0])
+            tokens.extend(self._generation_prompts[previous][1])
+        contexts.add(ending)
+        text = "".join(texts)
+
+        # The first conversation that uses a context is checked against a full
+        # render once, which catches templates that look further back than one message
+        unchecked = contexts - self._verified
+        if unchecked:
+            expected = self._full_text(messages, add_generation_prompt)
+            if text != expected or tokens != self._encode(expected):
+                self._unsupported |= unchecked
+                return self._fallback(messages, add_generation_prompt)
+            self._verified |= unchecked
+        self.last_new_tokens = new_tokens
+        return text, tokens
+
+    def _span(self, previous: Optional[str], message: dict) -> Optional[Tuple[str, List[int]]]:
+        prefix = _PROBE_PREFIXES.get(previous)
+        if prefix is None:
+            return None
+        before = self._followed_up(prefix) if prefix else ""
+        after = self._followed_up(prefix + [message])
+        if before is None or after is None or not after.startswith(before):
+            return None
+        text = after[len(before):]
+        return text, self._encode(text)
+
+    def _followed_up(self, messages) -> Optional[str]:
+        """The text of ``messages`` as rendered when more of the conversation follows."""
+        follow_up = self._follow_up()
+        if follow_up is None:
+            return None
+        try:
+            text = self._full_text(messages + [_FOLLOW_UP], False)
+        except Exception:
+            # e.g. a template that only allows alternating user/assistant roles
+            return None
+        return text[:-len(follow_up)] if text.endswith(follow_up) else None
+
+    def _follow_up(self) -> Optional[str]:
+        """How ``_FOLLOW_UP`` renders after a system message."""
+        if self._follow_up_text is None:
+            prefix = _PROBE_PREFIXES["system"]
+            try:
+                before = self._full_text(prefix, False)
+                after = self._full_text(prefix + [_FOLLOW_UP], False)
+            except Exception:
+                return None
+            if not after.startswith(before):
+                return None
+            self._follow_up_text = after[len(before):]
+        return self._follow_up_text
+
+    def _generation_prompt(self, last_role: Optional[str]) -> Optional[Tuple[str, List[int]]]:
+        probe = _PROBE_PREFIXES.get(last_role)
+        if not probe:
+            return None
+        try:
+            without = self._full_text(probe, False)
+            with_prompt = self._full_text(probe, True)
+        except Exception:
+            return None
+        if not with_prompt.startswith(without):
+            return None
+        text = with_prompt[len(without):]
+        return text, self._encode(text)
+
+    def _fallback(self, messages, add_generation_prompt) -> Tuple[str, List[int]]:
+        self.fallbacks += 1
+        text = self._full_text(messages, add_generation_prompt)
+        tokens = self._encode(text)
+        self.last_new_tokens = len(tokens)
+        return text, tokens
+
+    def _full_text(self, messages, add_generation_prompt) -> str:
+        return self.tokenizer.apply_chat_template(
+            list(messages), add_generation_prompt=add_generation_prompt, tokenize=False
+        )
+
+    def _encode(self, text: str) -> List[int]:
+        # The rendered text already holds any BOS token
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+
+def get_renderer(tokenizer) -> IncrementalChatRenderer:
+    """The tokenizer's shared ``IncrementalChatRenderer``, created on first use."""
+    renderer = getattr(tokenizer, "_chat_renderer", None)
+    if renderer is None:
+        renderer = IncrementalChatRenderer(tokenizer)
+        tokenizer._chat_renderer = renderer
+    return renderer
+
+
+def validate_chat_templates(
+    model_types: Optional[Sequence] = None,
+    turns: int = 20,
+    hf_token: Optional[str] = None,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Check the incremental renderer against ``apply_chat_template`` for each model's tokenizer.
+
+    A conversation of ``turns`` user/assistant exchanges (after a system
+    message) is rendered after every turn, both ways.  Text and tokens must be
+    identical; the time per turn of each way is reported as well.
+
+    Args:
+        model_types: ``ModelType`` members to check (default: all)
+        turns: Conversation length
+        hf_token: Hugging Face token for gated repos
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "model", "identical", "fallbacks",
+        "full_ms_per_turn", "incremental_ms_per_turn" and "speedup"
+
+    Example:
+        >>> validate_chat_templates(turns=50)
+    """
+    import os
+
+    from transformers import AutoTokenizer
+
+    from .eviction import synthetic_conversation
+    from .get_model import ModelType
+
+    conversation, _ = synthetic_conversation(turns)
+    token = hf_token or os.getenv("HF_TOKEN")
+    rows = []
+    for model_type in model_types or list(ModelType):
+        tokenizer = AutoTokenizer.from_pretrained(model_type.value, token=token)
+        renderer = IncrementalChatRenderer(tokenizer)
+        messages = [{"role": "system", "content": "You are a concise assistant."}]
+        identical = True
+        full_seconds = incremental_seconds = 0.0
+        for user, assistant in conversation:
+            messages.append({"role": "user", "content": user})
+
+            start = time.perf_counter()
+            text = tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=False)
+            expected = tokenizer.encode(text, add_special_tokens=False)
+            full_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            rendered_text, tokens = renderer._render(messages, True)
+            incremental_seconds += time.perf_counter() - start
+
+            identical &= rendered_text.encode() == text.encode() and tokens == expected
+            messages.append({"role": "assistant", "content": assistant})
+
+        rows.append({
+            "model": model_type.short_name,
+            "identical": identical,
+            "fallbacks": renderer.fallbacks,
+            "full_ms_per_turn": 1000 * full_seconds / turns,
+            "incremental_ms_per_turn": 1000 * incremental_seconds / turns,
+            "speedup": full_seconds / incremental_seconds if incremental_seconds else 0.0,
+        })
+
+    if verbose:
+        print(f"{turns}-turn conversations")
+        print(f"{'Model':<14} {'Identical':>9} {'Fallbacks':>10} {'Full ms':>8} {'Incr. ms':>9} {'Speedup':>8}")
+        print("-" * 63)
+        for r in rows:
+            print(
+                f"{r['model']:<14} {'✓' if r['identical'] else '❌':>9} {r['fallbacks']:>10} "
+                f"{r['full_ms_per_turn']:>8.2f} {r['incremental_ms_per_turn']:>9.2f} {r['speedup']:>7.1f}x"
+            )
+    return rows
@@ -0,0 +1,663 @@
+"""
+Constrained decoding: only let the model produce text matching a regex or JSON schema.
+
+Tool-call arguments and answer formats are free-form today, and a malformed
+output costs a whole new generation.  ``TokenFSM.compile`` turns a regular
+expression (or a JSON schema, via ``json_schema_to_regex``) into a finite-state
+machine over the tokenizer's vocabulary, in the style of Willard & Louf (2023):
+
+1. The regex becomes a character-level automaton (Thompson NFA, determinized
+   on the fly).
+2. For every automaton state reachable at a token boundary, each vocabulary
+   token is run through the automaton.  The tokens that stay alive are that
+   state's allowed tokens, and where they end up is the next state.
+
+Step 2 is the slow part, so the result is cached on disk per tokenizer
+fingerprint and pattern.  While generating, ``ConstrainedLogitsProcessor``
+only looks up the current state's mask and next state, which costs the same
+whatever the pattern.
+
+The regex dialect is a subset of Python's: literals and escapes, ``.``,
+classes (``[a-z]``, ``[^"]``, ``\\d``, ``\\w``, ``\\s``), groups, ``|`` and the
+quantifiers ``* + ? {m} {m,} {m,n}``.  The whole output must match.  Lazy
+quantifiers are accepted and behave like greedy ones, which matches the same
+strings.  Tokens that decode to an incomplete UTF-8 character are never allowed.
+"""
+
+import hashlib
+import json
+import re
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import mlx.core as mx
+import numpy as np
+
+# The final channel of a Harmony response; GPT-OSS reasons freely before it
+HARMONY_FINAL_TRIGGER = "<|channel|>final<|message|>"
+
+_JSON_STRING = r'"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"'
+_JSON_INTEGER = r"-?(?:0|[1-9][0-9]*)"
+_JSON_NUMBER = r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?"
+
+
+def json_schema_to_regex(schema: dict) -> str:
+    """
+    Translate a JSON schema into a regex matching the JSON it allows.
+
+    Supported: "type" (object, array, string, integer, number, boolean, null,
+    or a list of these), "properties" with "required", "items", "minItems",
+    "maxItems", "enum", "const", "anyOf"/"oneOf", and "minLength",
+    "maxLength" and "pattern" for strings.  Object properties appear in the
+    schema's order, and a single space is allowed after ":" and ",".
+
+    Raises:
+        ValueError: For schema features outside that subset (e.g. "$ref")
+    """
+    if "$ref" in schema:
+        raise ValueError("$ref is not supported; inline the referenced schema")
+    if "const" in schema:
+        return _escape(json.dumps(schema["const"]))
+    if "enum" in schema:
+        return "(?:" + "|".join(_escape(json.dumps(v)) for v in schema["enum"]) + ")"
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            return "(?:" + "|".join(json_schema_to_regex(s) for s in schema[key]) + ")"
+
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        return "(?:" + "|".join(json_schema_to_regex({**schema, "type": k}) for k in kind) + ")"
+    if kind == "string":
+        if "pattern" in schema:
+            return '"' + schema["pattern"].removeprefix("^").removesuffix("$") + '"'
+        if "minLength" in schema or "maxLength" in schema:
+            char = _JSON_STRING[1:-2]
+            return f'"{char}{{{schema.get("minLength", 0)},{schema.get("maxLength", "")}}}"'
+        return _JSON_STRING
+    if kind == "integer":
+        return _JSON_INTEGER
+    if kind == "number":
+        return _JSON_NUMBER
+    if kind == "boolean":
+        return "(?:true|false)"
+    if kind == "null":
+        return "null"
+    if kind == "array":
+        item = json_schema_to_regex(schema.get("items", {"type": "string"}))
+        low, high = schema.get("minItems", 0), schema.get("maxItems")
+        if high == 0:
+            return r"\[ ?\]"
+        rest = f"(?:, ?{item}){{{max(low - 1, 0)},{'' if high is None else high - 1}}}"
+        items = f"{item}{rest}"
+        return rf"\[ ?{items} ?\]" if low > 0 else rf"\[ ?(?:{items})? ?\]"
+    if kind == "object" or "properties" in schema:
+        required = set(schema.get("required", []))
+        members = [
+            (_escape(json.dumps(name)) + ": ?" + json_schema_to_regex(sub), name not in required)
+            for name, sub in schema.get("properties", {}).items()
+        ]
+        return r"\{ ?" + _members(members, 0, True, {}) + r" ?\}"
+    raise ValueError(f"Unsupported JSON schema: {schema}")
+
+
+class TokenFSM:
+    """
+    Allowed tokens and next states of a pattern over one tokenizer's vocabulary.
+
+    State 0 is the start.  ``allowed(state)`` lists the token IDs that keep the
+    output matchable from ``state``, and ``next_state(state, token)`` follows one.
+    """
+
+    def __init__(self, pattern: str, tokens: List[np.ndarray], targets: List[np.ndarray], accepting: Iterable[int]):
+        self.pattern = pattern
+        self._tokens = tokens
+        self._targets = targets
+        self.accepting = set(accepting)
+        self._next: Dict[int, Dict[int, int]] = {}
+        self._masks: Dict[tuple, mx.array] = {}
+
+    @property
+    def num_states(self) -> int:
+        return len(self._tokens)
+
+    @classmethod
+    def compile(
+        cls,
+        tokenizer,
+        constraint: Union[str, dict],
+        cache_dir: str = "constraint_cache",
+        verbose: bool = True,
+    ) -> "TokenFSM":
+        """
+        Compile a regex (str) or JSON schema (dict) for a tokenizer, using the disk cache.
+
+        Args:
+            tokenizer: The tokenizer for the model
+            constraint: Regex the whole output must match, or a JSON schema
+            cache_dir: Directory of compiled indexes, one subdirectory per tokenizer
+            verbose: Whether to print compile time
+
+        Returns:
+            The compiled ``TokenFSM``
+
+        Example:
+            >>> fsm = TokenFSM.compile(tokenizer, {"type": "object", "properties": {"city": {"type": "string"}}})
+        """
+        pattern = json_schema_to_regex(constraint) if isinstance(constraint, dict) else constraint
+        start = time.perf_counter()
+        vocab, directory = _vocabulary(tokenizer, Path(cache_dir))
+        path = directory / f"{hashlib.sha256(pattern.encode()).hexdigest()[:16]}.npz"
+        if path.exists():
+            data = np.load(path)
+            offsets = data["offsets"]
+            fsm = cls(
+                pattern,
+                np.split(data["tokens"], offsets[1:-1]),
+                np.split(data["targets"], offsets[1:-1]),
+                data["accepting"].tolist(),
+            )
+            if verbose:
+                print(f"✓ Loaded constraint index ({fsm.num_states} states) in {time.perf_counter() - start:.2f}s")
+            return fsm
+
+        dfa = _DFA(_parse(pattern))
+        order = sorted(vocab, key=lambda item: item[0])
+        ids = {0: 0}  # DFA state -> FSM state, in discovery order
+        queue = deque([0])
+        tokens, targets = [], []
+        while queue:
+            state = queue.popleft()
+            allowed, reached = _walk(dfa, state, order)
+            for s in reached:
+                if s not in ids:
+                    ids[s] = len(ids)
+                    queue.append(s)
+            tokens.append(np.array(allowed, dtype=np.int32))
+            targets.append(np.array([ids[s] for s in reached], dtype=np.int32))
+        accepting = [fsm_state for dfa_state, fsm_state in ids.items() if dfa.accepting(dfa_state)]
+
+        offsets = np.cumsum([0] + [len(t) for t in tokens])
+        np.savez(
+            path,
+            tokens=np.concatenate(tokens),
+            targets=np.concatenate(targets),
+            offsets=offsets,
+            accepting=np.array(accepting, dtype=np.int32),
+        )
+        if verbose:
+            print(f"⚙️  Compiled constraint index ({len(tokens)} states) in {time.perf_counter() - start:.1f}s")
+        return cls(pattern, tokens, targets, accepting)
+
+    def allowed(self, state: int) -> np.ndarray:
+        return self._tokens[state]
+
+    def next_state(self, state: int, token: int) -> Optional[int]:
+        """The state after ``token``, or None if the token is not allowed."""
+        table = self._next.get(state)
+        if table is None:
+            table = self._next[state] = dict(zip(self._tokens[state].tolist(), self._targets[state].tolist()))
+        return table.get(token)
+
+    def mask(self, state: int, size: int, end_tokens: Sequence[int]) -> mx.array:
+        """Boolean mask over ``size`` logits: allowed tokens, plus ``end_tokens`` where the match may stop."""
+        key = (state, size)
+        mask = self._masks.get(key)
+        if mask is None:
+            allowed = np.zeros(size, dtype=bool)
+            allowed[self._tokens[state][self._tokens[state] < size]] = True
+            if state in self.accepting or not allowed.any():
+                allowed[list(end_tokens)] = True
+            mask = self._masks[key] = mx.array(allowed)
+        return mask
+
+
+class ConstrainedLogitsProcessor:
+    """
+    ``logits_processors`` entry for ``mlx_lm.generate`` that enforces a ``TokenFSM``.
+
+    With a ``trigger`` the constraint starts only once the output contains
+    the trigger text (or the prompt ends with it), e.g. ``HARMONY_FINAL_TRIGGER``
+    to let GPT-OSS reason freely and constrain its final answer.
+    """
+
+    def __init__(self, fsm: TokenFSM, tokenizer, trigger: Optional[str] = None, prompt: Optional[str] = None):
+        self.fsm = fsm
+        self.end_tokens = sorted(tokenizer.eos_token_ids)
+        self.trigger = tokenizer.encode(trigger, add_special_tokens=False) if trigger else []
+        self.state = 0
+        self.active = not trigger or (prompt is not None and prompt.endswith(trigger))
+        self.steps = 0
+        self.seconds = 0.0
+        self._tail: List[int] = []
+        self._started = False
+
+    def __call__(self, tokens: mx.array, logits: mx.array) -> mx.array:
+        start = time.perf_counter()
+        if not self._started:
+            # The first call ends the prompt; later calls add one generated token
+            self._started = True
+        else:
+            token = tokens[-1].item()
+            if self.active:
+                self.state = self.fsm.next_state(self.state, token)
+                if self.state is None:  # only an end token could get here
+                    self.state = 0
+            else:
+                self._tail = (self._tail + [token])[-len(self.trigger):]
+        if not self.active and self._tail == self.trigger:
+            self.active = True
+        if self.active:
+            mask = self.fsm.mask(self.state, logits.shape[-1], self.end_tokens)
+            logits = mx.where(mask, logits, -mx.inf)
+            self.steps += 1
+        self.seconds += time.perf_counter() - start
+        return logits
+
+
+def constraint_processor(
+    tokenizer,
+    constraint,
+    trigger: Optional[str] = None,
+    prompt: Optional[str] = None,
+    cache_dir: str = "constraint_cache",
+) -> ConstrainedLogitsProcessor:
+    """
+    Build a ``ConstrainedLogitsProcessor`` from a regex, JSON schema or compiled ``TokenFSM``.
+
+    Example:
+        >>> processor = constraint_processor(tokenizer, r"<reasoning>\\n[\\s\\S]*\\n</reasoning>\\n<answer>\\n.*\\n</answer>")
+        >>> generate(model, tokenizer, prompt, logits_processors=[processor])
+    """
+    fsm = constraint if isinstance(constraint, TokenFSM) else TokenFSM.compile(tokenizer, constraint, cache_dir)
+    return ConstrainedLogitsProcessor(fsm, tokenizer, trigger, prompt)
+
+
+def benchmark_constrained(
+    model,
+    tokenizer,
+    prompt: str,
+    constraint: Union[str, dict],
+    attempts: int = 8,
+    max_tokens: int = 256,
+    temperature: float = 0.7,
+    trigger: Optional[str] = None,
+    cache_dir: str = "constraint_cache",
+    verbose: bool = True,
+) -> Dict:
+    """
+    Compare free and constrained sampling of a formatted prompt.
+
+    Each mode samples ``attempts`` completions.  A completion is valid when
+    the text after ``trigger`` (or all of it) matches the pattern, so
+    "expected tries" is how many generations a retry loop needs per valid one.
+
+    Args:
+        model: The loaded MLX model
+        tokenizer: The tokenizer for the model
+        prompt: Formatted prompt (e.g. from ``_build_prompt``)
+        constraint: Regex or JSON schema
+        attempts: Completions sampled per mode
+        max_tokens: Maximum tokens per completion
+        temperature: Sampling temperature
+        trigger: Text after which the constraint applies (e.g. ``HARMONY_FINAL_TRIGGER``)
+        cache_dir: Directory of compiled indexes
+        verbose: Whether to print a summary table
+
+    Returns:
+        Dictionary of mode ("free", "constrained") -> "valid", "expected_tries",
+        "tokens_per_second" and "overhead_ms_per_token", plus "compile_seconds"
+        (cold) and "load_seconds" (from the disk cache)
+    """
+    from mlx_lm import stream_generate
+    from mlx_lm.sample_utils import make_sampler
+
+    pattern = json_schema_to_regex(constraint) if isinstance(constraint, dict) else constraint
+    start = time.perf_counter()
+    fsm = TokenFSM.compile(tokenizer, pattern, cache_dir, verbose=False)
+    compile_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    TokenFSM.compile(tokenizer, pattern, cache_dir, verbose=False)
+    load_seconds = time.perf_counter() - start
+
+    results = {"compile_seconds": compile_seconds, "load_seconds": load_seconds}
+    for mode in ("free", "constrained"):
+        valid = generated = 0
+        seconds = overhead = 0.0
+        for _ in range(attempts):
+            processors = [ConstrainedLogitsProcessor(fsm, tokenizer, trigger, prompt)] if mode == "constrained" else []
+            text = ""
+            for response in stream_generate(
+                model, tokenizer, prompt, max_tokens=max_tokens,
+                sampler=make_sampler(temp=temperature), logits_processors=processors,
+            ):
+                text += response.text
+            generated += response.generation_tokens
+            seconds += response.generation_tokens / response.generation_tps if response.generation_tps else 0.0
+            overhead += processors[0].seconds if processors else 0.0
+            if trigger and not prompt.endswith(trigger):
+                text = text.split(trigger)[-1] if trigger in text else None
+            valid += text is not None and re.fullmatch(pattern, text.strip()) is not None
+        results[mode] = {
+            "valid": valid / attempts,
+            "expected_tries": attempts / valid if valid else float("inf"),
+            "tokens_per_second": generated / seconds if seconds else 0.0,
+            "overhead_ms_per_token": 1000 * overhead / generated if generated else 0.0,
+        }
+
+    if verbose:
+        print(f"Index: {fsm.num_states} states, compiled in {compile_seconds:.1f}s, loaded from cache in {load_seconds:.2f}s")
+        print(f"{'Mode':<12} {'Valid':>6} {'Tries/valid':>12} {'Tok/s':>8} {'Overhead ms/tok':>16}")
+        print("-" * 58)
+        for mode in ("free", "constrained"):
+            r = results[mode]
+            print(
+                f"{mode:<12} {r['valid']:>6.0%} {r['expected_tries']:>12.2f} {r['tokens_per_second']:>8.1f} "
+                f"{r['overhead_ms_per_token']:>16.3f}"
+            )
+    return results
+
+
+# JSON schema helpers
+
+def _escape(text: str) -> str:
+    return re.sub(r"([\\.^$|?*+()\[\]{}])", r"\\\1", text)
+
+
+def _members(members: list, i: int, first: bool, memo: dict) -> str:
+    # Regex for members[i:], where optional members may be left out
+    if i == len(members):
+        return ""
+    if (i, first) not in memo:
+        member, optional = members[i]
+        present = ("" if first else ", ?") + member + _members(members, i + 1, False, memo)
+        if optional:
+            absent = _members(members, i + 1, first, memo)
+            memo[i, first] = f"(?:{present}|{absent})" if absent else f"(?:{present})?"
+        else:
+            memo[i, first] = present
+    return memo[i, first]
+
+
+# Regex -> character automaton
+
+class _CharSet:
+    def __init__(self, chars: str = "", ranges=(), parts=(), negated: bool = False):
+        self.chars = frozenset(chars)
+        self.ranges = tuple(ranges)
+        self.parts = tuple(parts)
+        self.negated = negated
+
+    def match(self, ch: str) -> bool:
+        hit = (
+            ch in self.chars
+            or any(lo <= ch <= hi for lo, hi in self.ranges)
+            or any(p.match(ch) for p in self.parts)
+        )
+        return hit != self.negated
+
+
+_CLASS_ESCAPES = {
+    "d": _CharSet(ranges=[("0", "9")]),
+    "w": _CharSet("_", ranges=[("a", "z"), ("A", "Z"), ("0", "9")]),
+    "s": _CharSet(" \t\n\r\f\v"),
+}
+_CLASS_ESCAPES.update({k.upper(): _CharSet(parts=[v], negated=True) for k, v in list(_CLASS_ESCAPES.items())})
+_CHAR_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v", "0": "\0"}
+
+
+class _NFA:
+    def __init__(self):
+        self.eps: List[List[int]] = []
+        self.edges: List[List[tuple]] = []
+
+    def new(self) -> int:
+        self.eps.append([])
+        self.edges.append([])
+        return len(self.eps) - 1
+
+
+def _parse(pattern: str):
+    """Parse a regex into an NFA; returns (nfa, start, accept)."""
+    nfa = _NFA()
+    pos = 0
+
+    def peek():
+        return pattern[pos] if pos < len(pattern) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return pattern[pos - 1]
+
+    def escape(in_class: bool):
+        ch = take()
+        if ch in _CLASS_ESCAPES:
+            return _CLASS_ESCAPES[ch]
+        if ch == "x":
+            return _CharSet(chr(int(take() + take(), 16)))
+        if ch == "u":
+            return _CharSet(chr(int("".join(take() for _ in range(4)), 16)))
+        if ch == "b" and in_class:
+            return _CharSet("\b")
+        return _CharSet(_CHAR_ESCAPES.get(ch, ch))
+
+    def char_class():
+        negated = peek() == "^"
+        if negated:
+            take()
+        parts, first = [], True
+        while first or peek() != "]":
+            if peek() is None:
+                raise ValueError(f"Unterminated character class in {pattern!r}")
+            first = False
+            item = escape(True) if take() == "\\" else _CharSet(pattern[pos - 1])
+            if peek() == "-" and pos + 1 < len(pattern) and pattern[pos + 1] != "]" and len(item.chars) == 1:
+                take()
+                high = escape(True) if take() == "\\" else _CharSet(pattern[pos - 1])
+                item = _CharSet(ranges=[(next(iter(item.chars)), next(iter(high.chars)))])
+            parts.append(item)
+        take()
+        return _CharSet(parts=parts, negated=negated)
+
+    def fragment(charset):
+        s, e = nfa.new(), nfa.new()
+        nfa.edges[s].append((charset, e))
+        return s, e
+
+    def empty():
+        s = nfa.new()
+        return s, s
+
+    def pair():
+        return nfa.new(), nfa.new()
+
+    def atom():
+        ch = take()
+        if ch == "(":
+            if pattern.startswith("?:", pos):
+                take(), take()
+            frag = alternation()
+            if take() != ")":
+                raise ValueError(f"Unbalanced parenthesis in {pattern!r}")
+            return frag
+        if ch == "[":
+            return fragment(char_class())
+        if ch == ".":
+            return fragment(_CharSet("\n", negated=True))
+        if ch == "\\":
+            return fragment(escape(False))
+        return fragment(_CharSet(ch))
+
+    def repeat():
+        nonlocal pos
+        begin = pos
+        frag = atom()
+        end = pos
+        while peek() in ("*", "+", "?", "{"):
+            q = take()
+            low, high = {"*": (0, None), "+": (1, None), "?": (0, 1)}.get(q, (None, None))
+            if q == "{":
+                close = pattern.index("}", pos)
+                spec = pattern[pos:close]
+                pos = close + 1
+                low_text, _, high_text = spec.partition(",")
+                low = int(low_text or 0)
+                high = low if "," not in spec else (int(high_text) if high_text else None)
+            if peek() == "?":
+                take()  # lazy matches the same strings
+            frag = quantify(frag, begin, end, low, high)
+        return frag
+
+    def reparse(begin, end):
+        nonlocal pos
+        saved, pos = pos, begin
+        frag = atom()
+        assert pos == end
+        pos = saved
+        return frag
+
+    def quantify(frag, begin, end, low, high):
+        # Every repetition needs its own NFA states, so the atom is parsed again
+        copies = iter([frag])
+
+        def copy():
+            return next(copies, None) or reparse(begin, end)
+
+        s, e = pair()
+        current = s
+        for _ in range(low):
+            c = copy()
+            nfa.eps[current].append(c[0])
+            current = c[1]
+        if high is None:
+            c = copy()
+            hub = nfa.new()
+            nfa.eps[current].append(hub)
+            nfa.eps[hub].append(c[0])
+            nfa.eps[c[1]].append(hub)
+            current = hub
+        else:
+            for _ in range(high - low):
+                c = copy()
+                nfa.eps[current].append(c[0])
+                nfa.eps[current].append(e)
+                current = c[1]
+        nfa.eps[current].append(e)
+        return s, e
+
+    def concatenation():
+        s, e = empty()
+        while peek() is not None and peek() not in "|)":
+            frag = repeat()
+            nfa.eps[e].append(frag[0])
+            e = frag[1]
+        return s, e
+
+    def alternation():
+        branches = [concatenation()]
+        while peek() == "|":
+            take()
+            branches.append(concatenation())
+        if len(branches) == 1:
+            return branches[0]
+        s, e = pair()
+        for b in branches:
+            nfa.eps[s].append(b[0])
+            nfa.eps[b[1]].append(e)
+        return s, e
+
+    pattern = pattern.removeprefix("^")
+    if pattern.endswith("$") and not pattern.endswith("\\$"):
+        pattern = pattern[:-1]
+    start, accept = alternation()
+    if pos != len(pattern):
+        raise ValueError(f"Unbalanced parenthesis in {pattern!r}")
+    return nfa, start, accept
+
+
+class _DFA:
+    """Subset construction of the NFA, built lazily one character at a time."""
+
+    def __init__(self, parsed):
+        self.nfa, start, self.accept = parsed
+        self.sets: List[frozenset] = []
+        self.ids: Dict[frozenset, int] = {}
+        self._steps: Dict[tuple, int] = {}
+        self._id(self._closure({start}))
+
+    def _closure(self, states) -> frozenset:
+        stack, seen = list(states), set(states)
+        while stack:
+            for t in self.nfa.eps[stack.pop()]:
+                if t not in seen:
+                    seen.add(t)
+                    stack.append(t)
+        return frozenset(seen)
+
+    def _id(self, states: frozenset) -> int:
+        if states not in self.ids:
+            self.ids[states] = len(self.sets)
+            self.sets.append(states)
+        return self.ids[states]
+
+    def step(self, state: int, ch: str) -> int:
+        """Next state after ``ch``, or -1 if no match is possible any more."""
+        key = (state, ch)
+        if key not in self._steps:
+            reached = {t for s in self.sets[state] for charset, t in self.nfa.edges[s] if charset.match(ch)}
+            self._steps[key] = self._id(self._closure(reached)) if reached else -1
+        return self._steps[key]
+
+    def accepting(self, state: int) -> bool:
+        return self.accept in self.sets[state]
+
+
+def _walk(dfa: _DFA, state: int, vocab: list) -> tuple:
+    """Tokens that keep ``state`` alive and where they lead; ``vocab`` is sorted by text."""
+    allowed, reached = [], []
+    stack = [state]  # stack[k]: DFA state after the first k characters of ``previous``
+    previous = ""
+    for text, token in vocab:
+        common = 0
+        limit = min(len(previous), len(text), len(stack) - 1)
+        while common < limit and previous[common] == text[common]:
+            common += 1
+        del stack[common + 1:]
+        s = stack[-1]
+        for ch in text[common:]:
+            s = dfa.step(s, ch) if s >= 0 else -1
+            stack.append(s)
+        previous = text
+        if s >= 0:
+            allowed.append(token)
+            reached.append(s)
+    return allowed, reached
+
+
+def _vocabulary(tokenizer, cache_dir: Path) -> tuple:
+    """Decoded text of every ordinary token, and the tokenizer's cache directory."""
+    vocab = tokenizer.get_vocab()
+    fingerprint = hashlib.sha256(json.dumps(sorted(vocab.items()), ensure_ascii=False).encode()).hexdigest()[:16]
+    directory = cache_dir / fingerprint
+    path = directory / "vocab.json"
+    if path.exists():
+        with open(path) as f:
+            return [tuple(item) for item in json.load(f)], directory
+
+    special = set(getattr(tokenizer, "all_special_ids", []))
+    special.update(i for i, t in getattr(tokenizer, "added_tokens_decoder", {}).items() if t.special)
+    # Decoding after an anchor token keeps the leading space that
+    # SentencePiece tokenizers drop from a token decoded on its own
+    anchor = tokenizer.encode("a", add_special_tokens=False)[-1:]
+    offset = len(tokenizer.decode(anchor))
+    entries = []
+    for token in sorted(set(vocab.values()) - special):
+        text = tokenizer.decode(anchor + [token])[offset:]
+        if text and "�" not in text:
+            entries.append((text, token))
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    return entries, directory
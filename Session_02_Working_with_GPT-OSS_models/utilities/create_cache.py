@@ -1,8 +1,16 @@
-from mlx_lm.models.cache import make_prompt_cache
 from pathlib import Path
 
+from .eviction import make_eviction_cache
 
-def create_cache(model, model_id, cache_dir_name="cache_files"):
+
+def create_cache(
+    model,
+    model_id,
+    cache_dir_name="cache_files",
+    eviction=None,
+    max_kv_size=4096,
+    sink_tokens=4,
+):
     """
     Create a prompt cache for the model and set up the cache directory.
     
@@ -10,6 +18,13 @@ def create_cache(model, model_id, cache_dir_name="cache_files"):
         model: The loaded MLX model
         model_id: The model identifier (e.g., "mlx-community/Qwen3-4B-Instruct-2507-4bit")
         cache_dir_name: Name of the directory to store cache files (default: "cache_files")
+        eviction: None keeps every token (default). "sink" keeps the first
+                  ``sink_tokens`` tokens plus a sliding window; "importance" also
+                  keeps the older tokens with the smallest key norms. Both hold
+                  at most ``max_kv_size`` tokens per layer, so long conversations
+                  run in constant memory instead of overflowing the context
+        max_kv_size: Tokens per layer kept by an eviction policy
+        sink_tokens: Initial tokens an eviction policy never drops
     
     Returns:
         tuple: (prompt_cache, cache_file_path)
@@ -17,7 +32,7 @@ def create_cache(model, model_id, cache_dir_name="cache_files"):
             - cache_file_path: Path object pointing to the cache file
     """
     # Make the initial prompt cache for the model
-    prompt_cache = make_prompt_cache(model)
+    prompt_cache = make_eviction_cache(model, eviction, max_kv_size, sink_tokens)
     
     # Create the cache files directory 
     cache_dir = Path(cache_dir_name)
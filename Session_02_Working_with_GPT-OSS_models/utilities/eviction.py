@@ -0,0 +1,313 @@
+"""
+Bounded-memory prompt caches for conversations that outgrow the context.
+
+The session pattern in app.py appends every turn to one ``prompt_cache``, so
+its memory grows with the conversation until the model's context overflows.
+``make_eviction_cache`` builds a cache that holds at most ``max_kv_size``
+tokens per layer with one of two policies:
+
+- ``"sink"``: attention sinks plus a sliding window (StreamingLLM, Xiao et al.,
+  2023).  The first ``sink_tokens`` tokens are never evicted, because models
+  put a large share of attention on them, and the rest is the most recent
+  tokens.  This is ``mlx_lm``'s ``RotatingKVCache`` with ``keep=sink_tokens``.
+- ``"importance"``: ``ImportanceKVCache`` keeps the sinks and a window of recent
+  tokens, and from the older middle keeps the tokens it expects to matter most.
+  The fused attention kernel does not expose attention weights, so importance
+  uses the L2 norm of each cached key instead: keys with a small norm receive
+  high attention (Devoto et al., 2024), so the largest-norm keys are evicted first.
+
+Either way positions keep counting up, so RoPE offsets stay correct for new
+tokens.  Layers that already use a sliding window (e.g. half of GPT-OSS's
+layers) keep their own cache.
+"""
+
+import math
+import random
+import time
+from typing import Dict, List, Optional, Sequence
+
+import mlx.core as mx
+from mlx.utils import tree_flatten, tree_map
+from mlx_lm.models.cache import KVCache, RotatingKVCache, _BaseCache, create_attention_mask, make_prompt_cache
+
+EVICTION_POLICIES = ("sink", "importance")
+
+
+class ImportanceKVCache(_BaseCache):
+    """
+    KV cache that evicts the middle tokens with the largest key norms.
+
+    The first ``keep`` tokens and the last ``recent`` tokens are always kept.
+    Eviction runs when an update takes the cache past ``max_size`` and frees
+    ``evict_batch`` more slots than needed, so its sorting cost is paid once
+    per batch of new tokens.  A long prefill chunk is attended to in full and
+    evicted right after, so at most ``max_size`` tokens are held between steps.
+    """
+
+    step = 256
+
+    def __init__(self, max_size: int, keep: int = 4, recent: int = 256, evict_batch: int = 64):
+        if keep + recent + evict_batch > max_size:
+            raise ValueError("max_size must exceed keep + recent + evict_batch")
+        self.keys = None
+        self.values = None
+        self.offset = 0  # tokens seen, used for positions
+        self._idx = 0  # tokens stored
+        self.max_size = max_size
+        self.keep = keep
+        self.recent = recent
+        self.evict_batch = evict_batch
+
+    def update_and_fetch(self, keys, values):
+        S = keys.shape[2]
+        prev = self._idx
+        if self.keys is None or prev + S > self.keys.shape[2]:
+            B, n_kv_heads, _, k_head_dim = keys.shape
+            n_steps = (self.step + S - 1) // self.step
+            new_k = mx.zeros((B, n_kv_heads, n_steps * self.step, k_head_dim), keys.dtype)
+            new_v = mx.zeros((B, n_kv_heads, n_steps * self.step, values.shape[3]), values.dtype)
+            if self.keys is not None:
+                self.keys = mx.concatenate([self.keys[..., :prev, :], new_k], axis=2)
+                self.values = mx.concatenate([self.values[..., :prev, :], new_v], axis=2)
+            else:
+                self.keys, self.values = new_k, new_v
+
+        self.keys[..., prev:prev + S, :] = keys
+        self.values[..., prev:prev + S, :] = values
+        self._idx += S
+        self.offset += S
+        keys, values = self.keys[..., :self._idx, :], self.values[..., :self._idx, :]
+        if self._idx > self.max_size:
+            # Evict once this step's queries have what they attend to (the mask
+            # was built for all of it), so between steps, whatever the prefill
+            # chunk size, at most max_size tokens are held
+            self._evict(self.max_size - self.evict_batch)
+        return keys, values
+
+    def _evict(self, target: int) -> None:
+        n = self._idx
+        middle_end = n - self.recent
+        drop = n - target
+        if drop <= 0 or middle_end <= self.keep:
+            return
+        # Mean key norm over batch and heads for each middle position
+        norms = mx.linalg.norm(self.keys[..., self.keep:middle_end, :].astype(mx.float32), axis=-1).mean(axis=(0, 1))
+        drop = min(drop, middle_end - self.keep)
+        # Keep the smallest-norm middle tokens, in their original order
+        kept_middle = mx.sort(mx.argsort(norms)[: middle_end - self.keep - drop]) + self.keep
+        index = mx.concatenate([mx.arange(self.keep), kept_middle, mx.arange(middle_end, n)])
+        self.keys = self.keys[..., :n, :][:, :, index]
+        self.values = self.values[..., :n, :][:, :, index]
+        self._idx = self.keys.shape[2]
+        mx.eval(self.keys, self.values)
+
+    def __len__(self):
+        return self._idx
+
+    @property
+    def state(self):
+        return self.keys[..., :self._idx, :], self.values[..., :self._idx, :]
+
+    @state.setter
+    def state(self, v):
+        self.keys, self.values = v
+        self._idx = self.keys.shape[2]
+
+    @property
+    def meta_state(self):
+        return tuple(map(str, (self.max_size, self.keep, self.recent, self.evict_batch, self.offset)))
+
+    @meta_state.setter
+    def meta_state(self, v):
+        self.max_size, self.keep, self.recent, self.evict_batch, self.offset = map(int, v)
+
+    def make_mask(self, *args, **kwargs):
+        # Masks cover the stored tokens, not every position seen
+        return create_attention_mask(*args, offset=self._idx, **kwargs)
+
+
+def make_eviction_cache(
+    model,
+    eviction: Optional[str] = None,
+    max_kv_size: int = 4096,
+    sink_tokens: int = 4,
+    recent_tokens: int = 1024,
+) -> List:
+    """
+    Build a prompt cache whose memory stays bounded by ``max_kv_size`` tokens.
+
+    Args:
+        model: The loaded MLX model
+        eviction: None (full cache), "sink" or "importance"
+        max_kv_size: Maximum tokens held per layer
+        sink_tokens: Initial tokens that are never evicted
+        recent_tokens: Recent tokens always kept by the "importance" policy
+
+    Returns:
+        A list of per-layer caches, usable wherever ``make_prompt_cache``'s is
+
+    Example:
+        >>> prompt_cache = make_eviction_cache(model, "sink", max_kv_size=2048)
+    """
+    cache = make_prompt_cache(model)
+    if eviction is None:
+        return cache
+    if eviction not in EVICTION_POLICIES:
+        raise ValueError(f"Unknown eviction policy '{eviction}'. Choose from {EVICTION_POLICIES}")
+
+    def bounded():
+        if eviction == "sink":
+            return RotatingKVCache(max_size=max_kv_size, keep=sink_tokens)
+        return ImportanceKVCache(
+            max_kv_size,
+            keep=sink_tokens,
+            recent=min(recent_tokens, max_kv_size // 2),
+            evict_batch=max(1, max_kv_size // 16),
+        )
+
+    # Only unbounded layers are replaced; sliding-window layers already are bounded
+    return [bounded() if type(c) is KVCache else c for c in cache]
+
+
+def cache_nbytes(cache: List) -> int:
+    """Bytes held by a prompt cache's keys and values."""
+    return sum(v.nbytes for c in cache if c.keys is not None for _, v in tree_flatten(c.state))
+
+
+def synthetic_conversation(turns: int = 100, seed: int = 0) -> tuple:
+    """
+    A deterministic multi-turn chat in which some turns plant code words.
+
+    Returns:
+        tuple: (turns, probes)
+            - turns: List of (user, assistant) text pairs
+            - probes: List of (question, expected answer) about planted code words
+    """
+    rng = random.Random(seed)
+    words = ["falcon", "harbor", "quartz", "meadow", "cobalt", "lantern", "juniper", "saffron", "glacier", "ember"]
+    topics = ["cooking rice", "tide pools", "bicycle repair", "sourdough", "star charts", "knot tying", "tea", "maps"]
+    conversation, planted = [], []
+    for t in range(turns):
+        if t % 10 == 0:
+            word = words[(t // 10) % len(words)]
+            planted.append((t, word))
+            user = f"Please remember this: the code word for turn {t} is {word}."
+            assistant = f"Got it. The code word for turn {t} is {word}."
+        else:
+            topic = rng.choice(topics)
+            user = f"Tell me one short fact about {topic}."
+            assistant = (
+                f"Here is a fact about {topic}: it rewards patience, and small adjustments "
+                f"make a big difference over time, especially on attempt number {rng.randint(2, 99)}."
+            )
+        conversation.append((user, assistant))
+    probes = [(f"What was the code word for turn {t}?", word) for t, word in (planted[0], planted[len(planted) // 2], planted[-1])]
+    return conversation, probes
+
+
+def benchmark_eviction(
+    model,
+    tokenizer,
+    turns: int = 100,
+    policies: Sequence[Optional[str]] = (None, "sink", "importance"),
+    max_kv_size: int = 1024,
+    sink_tokens: int = 4,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Compare eviction policies with the full cache on a synthetic long conversation.
+
+    The conversation from ``synthetic_conversation`` is fed turn by turn into
+    one cache per policy.  Quality is the perplexity of the assistant replies
+    (teacher-forced), measured over the second half of the conversation where
+    bounded caches are full, and recall of code words planted early, midway
+    and late.
+
+    Args:
+        model: The loaded MLX model
+        tokenizer: The tokenizer for the model
+        turns: Conversation length
+        policies: Policies to compare; None is the full cache
+        max_kv_size: Token budget of the bounded caches
+        sink_tokens: Initial tokens never evicted
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "policy", "cache_mb", "peak_memory_gb",
+        "tokens_per_second", "perplexity" and "recall"
+
+    Example:
+        >>> benchmark_eviction(model, tokenizer, turns=100, max_kv_size=1024)
+    """
+    conversation, probes = synthetic_conversation(turns)
+    encoded = [
+        (tokenizer.encode(f"User: {user}\nAssistant:", add_special_tokens=False),
+         tokenizer.encode(f" {assistant}\n", add_special_tokens=False))
+        for user, assistant in conversation
+    ]
+
+    rows = []
+    for policy in policies:
+        mx.clear_cache()
+        mx.reset_peak_memory()
+        cache = make_eviction_cache(model, policy, max_kv_size, sink_tokens)
+        nll, scored, processed = 0.0, 0, 0
+        start = time.perf_counter()
+        for t, (user, assistant) in enumerate(encoded):
+            tokens = user + assistant
+            logits = model(mx.array(tokens)[None], cache=cache)[0]
+            if t >= turns // 2:
+                # Position i predicts token i + 1; score the assistant tokens only
+                logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
+                targets = mx.array(tokens[len(user):])
+                picked = mx.take_along_axis(logprobs[len(user) - 1:-1], targets[:, None], axis=-1)
+                nll -= picked.sum().item()
+                scored += len(assistant)
+            mx.eval([c.state for c in cache])
+            processed += len(tokens)
+        seconds = time.perf_counter() - start
+        cache_mb = cache_nbytes(cache) / 1e6
+
+        recalled = 0
+        for question, answer in probes:
+            probe_cache = [_copy_cache(c) for c in cache]
+            reply = _greedy_reply(model, tokenizer, f"User: {question}\nAssistant:", probe_cache)
+            recalled += answer in reply.lower()
+
+        rows.append({
+            "policy": policy or "full",
+            "cache_mb": cache_mb,
+            "peak_memory_gb": mx.get_peak_memory() / 1e9,
+            "tokens_per_second": processed / seconds,
+            "perplexity": math.exp(nll / max(scored, 1)),
+            "recall": f"{recalled}/{len(probes)}",
+        })
+
+    if verbose:
+        print(f"{turns}-turn conversation, bounded caches hold {max_kv_size} tokens per layer")
+        print(f"{'Policy':<11} {'Cache MB':>9} {'Peak GB':>8} {'Tok/s':>8} {'Perplexity':>11} {'Recall':>7}")
+        print("-" * 59)
+        for r in rows:
+            print(
+                f"{r['policy']:<11} {r['cache_mb']:>9.1f} {r['peak_memory_gb']:>8.2f} {r['tokens_per_second']:>8.0f} "
+                f"{r['perplexity']:>11.2f} {r['recall']:>7}"
+            )
+    return rows
+
+
+def _copy_cache(c):
+    # Caches write into their arrays in place; probes must not change the benchmark's cache
+    return type(c).from_state(tree_map(mx.array, c.state), c.meta_state)
+
+
+def _greedy_reply(model, tokenizer, prompt: str, cache: List, max_tokens: int = 16) -> str:
+    tokens = tokenizer.encode(prompt, add_special_tokens=False)
+    logits = model(mx.array(tokens)[None], cache=cache)
+    reply = []
+    for _ in range(max_tokens):
+        token = mx.argmax(logits[0, -1]).item()
+        if token in tokenizer.eos_token_ids:
+            break
+        reply.append(token)
+        logits = model(mx.array([[token]]), cache=cache)
+    return tokenizer.decode(reply)
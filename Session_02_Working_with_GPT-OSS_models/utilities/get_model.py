@@ -1,8 +1,10 @@
 from enum import Enum
 from mlx_lm import load
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
 import os
 
+from .adapters import get_adapter_registry
+
 
 class ModelType(Enum):
     """Enumeration of available models with their full MLX identifiers."""
@@ -39,7 +41,10 @@ MODEL_ALIASES = {
 def get_model(
     model: str | ModelType = ModelType.QWEN3_4B, 
     verbose: bool = True,
-    hf_token: Optional[str] = None
+    hf_token: Optional[str] = None,
+    adapters: Optional[Dict[str, str]] = None,
+    memory_budget_bytes: Optional[int] = None,
+    kv_tokens: int = 8192
 ) -> Tuple:
     """
     Load a model and tokenizer.
@@ -50,6 +55,13 @@ def get_model(
         verbose: Whether to print loading message
         hf_token: Hugging Face token for gated models. If None, will try to get 
                   from HF_TOKEN environment variable
+        adapters: Optional mapping of adapter name -> LoRA adapter directory.
+                  Adapters share the base weights; pick one per request with
+                  ``generate_response(..., adapter=name)``
+        memory_budget_bytes: If set, load the largest quantization of the model's
+                  family whose weights plus ``kv_tokens`` of KV cache fit this
+                  many bytes, converting it locally if needed (see ``select_variant``)
+        kv_tokens: Context length reserved for the KV cache when a budget is set
     
     Returns:
         tuple: (model, tokenizer, model_id)
@@ -66,6 +78,12 @@ def get_model(
         
         # Token from environment
         model, tokenizer, model_id = get_model("gpt-120b")
+        
+        # Base model plus LoRA adapters
+        model, tokenizer, model_id = get_model("qwen", adapters={"pirate": "adapters/pirate"})
+        
+        # Largest Llama quantization that fits in 12 GB
+        model, tokenizer, model_id = get_model("llama", memory_budget_bytes=12 * 1024**3)
     """
     # Determine the model ID
     if isinstance(model, ModelType):
@@ -84,6 +102,10 @@ def get_model(
     # Get token from parameter or environment
     token = hf_token or os.getenv("HF_TOKEN")
     
+    if memory_budget_bytes is not None:
+        from .variants import select_variant  # imported here: variants imports this module
+        model_id, _ = select_variant(model, memory_budget_bytes, kv_tokens, hf_token=token, verbose=verbose)
+    
     if verbose:
         print(f"Loading model: {model_id}")
         if token:
@@ -100,6 +122,11 @@ def get_model(
         if verbose:
             print("✓ Model loaded successfully!")
         
+        if adapters:
+            registry = get_adapter_registry(loaded_model)
+            for name, path in adapters.items():
+                registry.load(name, path, verbose=verbose)
+        
         return loaded_model, loaded_tokenizer, model_id
     
     except Exception as e:
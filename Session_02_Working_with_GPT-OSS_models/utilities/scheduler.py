@@ -0,0 +1,667 @@
+"""
+A generation scheduler that interleaves chunked prefill with batched decoding.
+
+``mlx_lm.generate`` processes a whole prompt before producing the first token.
+With several users sharing one model, a long pasted document (or a long resumed
+conversation) therefore stalls every other stream for the full prefill and
+holds the activations of the longest prefill pass in memory at once.
+
+``Scheduler`` keeps every decoding sequence in one batch and prefills at most
+one request at a time, ``prefill_chunk_size`` tokens per scheduler step:
+
+1. Decode one token for every running sequence (one batched forward pass).
+2. Process the next prompt chunk of the request being prefilled.
+3. When a prompt is complete, sample its first token and add the sequence to
+   the decode batch.
+
+So running streams wait for at most one chunk between tokens instead of a whole
+prompt.  With ``prefill_chunk_size=None`` the whole prompt is processed in one
+step (in ``mlx_lm``'s 2048-token passes), which is how ``generate`` behaves.
+
+Requests belong to priority classes (``DEFAULT_CLASSES``: "interactive" and
+"batch").  Waiting requests are admitted in priority order, and classes of equal
+priority share admission in proportion to their weights (by tokens processed so
+far).  When a higher-priority request is waiting and there is no room for it, a
+preemptible lower-priority sequence is paused and requeued.  With
+``preempt_mode="keep"`` its KV cache is set aside and it resumes where it
+stopped; with ``"recompute"`` the cache is freed and the prompt plus the tokens
+generated so far are prefilled again on resume.
+
+Any thread may call ``Scheduler.generate``; whichever caller holds the driver
+lock runs steps for everyone until its own request is done.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import mlx.core as mx
+import numpy as np
+from mlx_lm.models.cache import (
+    BatchKVCache,
+    BatchRotatingKVCache,
+    KVCache,
+    RotatingKVCache,
+    make_prompt_cache,
+)
+
+PREEMPT_MODES = ("keep", "recompute")
+# Cache types the decode batch can hold, and their batched counterparts
+_BATCH_CACHES = {KVCache: BatchKVCache, RotatingKVCache: BatchRotatingKVCache}
+
+
+@dataclass
+class PriorityClass:
+    """How the scheduler treats one class of requests."""
+    priority: int = 0  # lower is served first and may preempt higher
+    weight: float = 1.0  # admission share among classes of equal priority
+    preemptible: bool = False
+
+
+DEFAULT_CLASSES = {
+    "interactive": PriorityClass(priority=0),
+    "batch": PriorityClass(priority=1, preemptible=True),
+}
+
+
+@dataclass
+class Request:
+    """A generation request and its progress through the scheduler."""
+    uid: int
+    prompt: List[int] = field(repr=False)
+    max_tokens: int
+    sampler: Callable = field(repr=False)
+    prompt_cache: Optional[list] = field(default=None, repr=False)
+    on_token: Optional[Callable[[int], None]] = field(default=None, repr=False)
+    tokens: List[int] = field(default_factory=list, repr=False)
+    finish_reason: Optional[str] = None
+    submitted_at: float = 0.0
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    token_times: List[float] = field(default_factory=list, repr=False)
+    prefilled: int = 0
+    cache: Optional[list] = field(default=None, repr=False)
+    priority: str = "interactive"
+    preemptions: int = 0
+    queue_seconds: float = 0.0
+    enqueued_at: float = 0.0
+    next_input: Optional[mx.array] = field(default=None, repr=False)  # set while paused with its KV kept
+    error: Optional[Exception] = None  # why the request failed (finish_reason "error")
+
+    @property
+    def done(self) -> bool:
+        return self.finish_reason is not None
+
+    @property
+    def inter_token_latencies(self) -> List[float]:
+        """Seconds between consecutive tokens of this request."""
+        return [b - a for a, b in zip(self.token_times, self.token_times[1:])]
+
+
+class Scheduler:
+    """
+    Continuous batching with chunked prefill for one model.
+
+    Example:
+        >>> scheduler = Scheduler(model, tokenizer, prefill_chunk_size=512)
+        >>> generate_response(model, tokenizer, long_document, model_id=MODEL_ID, scheduler=scheduler)
+        >>> generate_response(model, tokenizer, question, model_id=MODEL_ID, scheduler=scheduler, priority="batch")
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        prefill_chunk_size: Optional[int] = 512,
+        max_batch_size: int = 32,
+        prefill_step_size: int = 2048,
+        classes: Optional[Dict[str, PriorityClass]] = None,
+        preempt_mode: str = "keep",
+    ):
+        """
+        Args:
+            model: The loaded MLX model
+            tokenizer: The tokenizer for the model
+            prefill_chunk_size: Prompt tokens processed per scheduler step; None
+                prefills each prompt in a single step
+            max_batch_size: Maximum sequences decoded together
+            prefill_step_size: Tokens per forward pass when ``prefill_chunk_size`` is None
+            classes: Priority classes by name (default: ``DEFAULT_CLASSES``)
+            preempt_mode: "keep" holds a preempted sequence's KV cache until it
+                resumes; "recompute" frees it and prefills again on resume
+        """
+        if preempt_mode not in PREEMPT_MODES:
+            raise ValueError(f"Unknown preempt_mode '{preempt_mode}'. Choose from {PREEMPT_MODES}")
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefill_chunk_size = prefill_chunk_size
+        self.max_batch_size = max_batch_size
+        self.prefill_step_size = prefill_step_size
+        self.stop_tokens = set(tokenizer.eos_token_ids)
+        self.classes = dict(classes or DEFAULT_CLASSES)
+        self.preempt_mode = preempt_mode
+
+        self.queues: Dict[str, deque] = {name: deque() for name in self.classes}
+        self._served = dict.fromkeys(self.classes, 0.0)  # tokens processed / weight
+        self.metrics: Dict[str, Dict[str, List[float]]] = {
+            name: {"queue_wait": [], "ttft": [], "itl": [], "latency": []} for name in self.classes
+        }
+        self.preemptions = dict.fromkeys(self.classes, 0)
+        self.prefilling: Optional[Request] = None
+        self.running: List[Request] = []  # one per decode batch row, in row order
+        self._batch_cache = None
+        self._y = None  # next input token of each running row
+        self._uid = 0
+        self._queue_lock = threading.Lock()
+        self._driver = threading.Lock()
+        self._progress = threading.Condition()
+
+    def submit(
+        self,
+        prompt: Union[str, List[int]],
+        max_tokens: int = 256,
+        sampler: Optional[Callable] = None,
+        prompt_cache: Optional[list] = None,
+        on_token: Optional[Callable[[int], None]] = None,
+        priority: str = "interactive",
+    ) -> Request:
+        """
+        Queue a request without waiting for it.
+
+        Args:
+            prompt: Formatted prompt string or token IDs
+            max_tokens: Maximum tokens to generate
+            sampler: Optional ``mlx_lm.sample_utils`` sampler (default: greedy)
+            prompt_cache: Optional prompt cache; like ``generate``, it is
+                extended with the prompt and the completion
+            on_token: Called with each generated token ID, from the driving thread
+            priority: Name of the request's priority class
+
+        Returns:
+            The queued ``Request``
+
+        Raises:
+            ValueError: For an unknown priority class, an empty prompt, or a
+                prompt_cache the decode batch cannot hold (e.g. quantized or
+                ``ImportanceKVCache`` layers)
+        """
+        if priority not in self.classes:
+            raise ValueError(f"Unknown priority class '{priority}'. Choose from {list(self.classes)}")
+        if isinstance(prompt, str):
+            add_special_tokens = self.tokenizer.bos_token is None or not prompt.startswith(self.tokenizer.bos_token)
+            prompt = self.tokenizer.encode(prompt, add_special_tokens=add_special_tokens)
+        if len(prompt) == 0:
+            raise ValueError("prompt is empty")
+        if prompt_cache is not None:
+            unbatchable = sorted({type(c).__name__ for c in prompt_cache if type(c) not in _BATCH_CACHES})
+            if unbatchable:
+                raise ValueError(f"prompt_cache layers of type {', '.join(unbatchable)} cannot be batched")
+        with self._queue_lock:
+            request = Request(
+                uid=self._uid,
+                prompt=list(prompt),
+                max_tokens=max_tokens,
+                sampler=sampler or _greedy,
+                prompt_cache=prompt_cache,
+                on_token=on_token,
+                submitted_at=time.perf_counter(),
+                priority=priority,
+            )
+            self._uid += 1
+            active = self._active_classes()
+            if priority not in active and active:
+                # A class returning from idle starts level with the others
+                # instead of claiming the share it did not use
+                self._served[priority] = max(self._served[priority], min(self._served[c] for c in active))
+            self._enqueue(request)
+        return request
+
+    def has_work(self) -> bool:
+        return bool(self.running or self.prefilling or any(self.queues.values()))
+
+    def step(self) -> None:
+        """
+        Preempt if needed, decode one token for every running sequence, then prefill one chunk.
+
+        An error fails only the requests it concerns (every running sequence
+        for a decode pass); they finish with ``finish_reason="error"`` and
+        ``wait`` raises it in their submitter's thread.
+        """
+        self._preempt()
+        if self.running:
+            try:
+                self._decode()
+            except Exception as e:
+                for request in self.running:
+                    self._fail(request, e)
+                self._batch_cache = self._y = None
+                self.running = []
+        if self.prefilling is None and len(self.running) < self.max_batch_size:
+            with self._queue_lock:
+                request = self._dequeue()
+            if request is not None and request.next_input is not None:
+                try:
+                    self._join(request, request.next_input)
+                except Exception as e:
+                    self._fail(request, e)
+                request.next_input = None
+            elif request is not None:
+                self._start_prefill(request)
+        if self.prefilling is not None:
+            request = self.prefilling
+            try:
+                self._prefill()
+            except Exception as e:
+                self.prefilling = None
+                self._fail(request, e)
+        with self._progress:
+            self._progress.notify_all()
+
+    def run(self) -> None:
+        """Step until every submitted request is finished."""
+        with self._driver:
+            while self.has_work():
+                self.step()
+
+    def wait(self, request: Request) -> Request:
+        """
+        Block until ``request`` is finished, driving the scheduler when no other
+        thread is.  Raises the request's error if it failed.
+        """
+        while not request.done:
+            if self._driver.acquire(blocking=False):
+                try:
+                    while not request.done and self.has_work():
+                        self.step()
+                finally:
+                    self._driver.release()
+                with self._progress:
+                    self._progress.notify_all()
+            else:
+                with self._progress:
+                    self._progress.wait(timeout=0.05)
+        if request.error is not None:
+            raise request.error
+        return request
+
+    def generate(self, prompt: Union[str, List[int]], **kwargs) -> str:
+        """Submit a request, wait for it and return the completion text."""
+        request = self.wait(self.submit(prompt, **kwargs))
+        return self.tokenizer.decode(request.tokens)
+
+    def class_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Latency percentiles of finished requests for each priority class.
+
+        Returns:
+            Dictionary of class name -> "requests", "preemptions" and p50/p95/p99
+            in milliseconds of "queue_wait", "ttft", "itl" and "latency"
+            (e.g. "ttft_p99_ms")
+        """
+        stats = {}
+        for name, metrics in self.metrics.items():
+            row = {"requests": len(metrics["latency"]), "preemptions": self.preemptions[name]}
+            for key, values in metrics.items():
+                ms = 1000 * np.array(values or [0.0])
+                for p in (50, 95, 99):
+                    row[f"{key}_p{p}_ms"] = float(np.percentile(ms, p))
+            stats[name] = row
+        return stats
+
+    def print_class_stats(self) -> None:
+        print(
+            f"{'Class':<12} {'Reqs':>5} {'Preempt':>8} {'Wait p50':>9} {'Wait p99':>9} "
+            f"{'TTFT p50':>9} {'TTFT p99':>9} {'ITL p50':>8} {'ITL p99':>8} {'E2E p99':>9}"
+        )
+        print("-" * 95)
+        for name, r in self.class_stats().items():
+            print(
+                f"{name:<12} {r['requests']:>5} {r['preemptions']:>8} {r['queue_wait_p50_ms']:>9.0f} "
+                f"{r['queue_wait_p99_ms']:>9.0f} {r['ttft_p50_ms']:>9.0f} {r['ttft_p99_ms']:>9.0f} "
+                f"{r['itl_p50_ms']:>8.1f} {r['itl_p99_ms']:>8.1f} {r['latency_p99_ms']:>9.0f}"
+            )
+        print("(milliseconds)")
+
+    # Queues and preemption
+
+    def _enqueue(self, request: Request, front: bool = False) -> None:
+        request.enqueued_at = time.perf_counter()
+        queue = self.queues[request.priority]
+        queue.appendleft(request) if front else queue.append(request)
+
+    def _dequeue(self) -> Optional[Request]:
+        names = [name for name, queue in self.queues.items() if queue]
+        if not names:
+            return None
+        name = min(names, key=lambda n: (self.classes[n].priority, self._served[n]))
+        request = self.queues[name].popleft()
+        request.queue_seconds += time.perf_counter() - request.enqueued_at
+        return request
+
+    def _active_classes(self) -> set:
+        active = {name for name, queue in self.queues.items() if queue}
+        active.update(r.priority for r in self.running)
+        if self.prefilling is not None:
+            active.add(self.prefilling.priority)
+        return active
+
+    def _preemptible(self, request: Request, priority: int) -> bool:
+        cls = self.classes[request.priority]
+        return cls.preemptible and cls.priority > priority
+
+    def _preempt(self) -> None:
+        with self._queue_lock:
+            waiting = [self.classes[name].priority for name, queue in self.queues.items() if queue]
+        if not waiting:
+            return
+        best = min(waiting)
+        # Free the prefill slot first, then a decode row if the batch is full
+        if self.prefilling is not None and self._preemptible(self.prefilling, best):
+            request, self.prefilling = self.prefilling, None
+            self._pause(request, row=None)
+        if self.prefilling is None and len(self.running) >= self.max_batch_size:
+            rows = [row for row, r in enumerate(self.running) if self._preemptible(r, best)]
+            if rows:
+                # Lowest priority first; among equals the most recently admitted
+                row = max(rows, key=lambda r: (self.classes[self.running[r].priority].priority, r))
+                self._pause(self.running[row], row)
+
+    def _pause(self, request: Request, row: Optional[int]) -> None:
+        # A caller's prompt_cache already holds part of the prompt, so it is always kept
+        keep = self.preempt_mode == "keep" or request.prompt_cache is not None
+        if row is not None:
+            if keep:
+                request.cache = [c.extract(row) for c in self._batch_cache]
+                request.next_input = self._y[row:row + 1]
+            self._keep_rows([r for r in range(len(self.running)) if r != row])
+        if not keep:
+            request.cache = None
+            request.prefilled = 0
+            mx.clear_cache()
+        request.preemptions += 1
+        self.preemptions[request.priority] += 1
+        with self._queue_lock:
+            self._enqueue(request, front=True)
+
+    # Prefill
+
+    def _start_prefill(self, request: Request) -> None:
+        if request.cache is None:
+            request.cache = request.prompt_cache if request.prompt_cache is not None else make_prompt_cache(self.model)
+        self.prefilling = request
+
+    def _prefill(self) -> None:
+        request = self.prefilling
+        # After a recomputing preemption the generated tokens are prefilled too
+        tokens = request.prompt + request.tokens if request.tokens else request.prompt
+        end = len(tokens) - 1  # the last token is fed by the first decode pass
+        budget = self.prefill_chunk_size or end
+        step_size = self.prefill_chunk_size or self.prefill_step_size
+        while budget > 0 and request.prefilled < end:
+            stop = min(request.prefilled + step_size, end, request.prefilled + budget)
+            self.model(mx.array(tokens[request.prefilled:stop])[None], cache=request.cache)
+            mx.eval([c.state for c in request.cache])
+            budget -= stop - request.prefilled
+            self._served[request.priority] += (stop - request.prefilled) / self.classes[request.priority].weight
+            request.prefilled = stop
+            mx.clear_cache()
+        if request.prefilled < end:
+            return
+
+        # Feeding the last token alone also brings rotating caches back to
+        # their window size, which batching them requires
+        logits = self.model(mx.array(tokens[-1:])[None], cache=request.cache)[:, -1, :]
+        y = request.sampler(logits - mx.logsumexp(logits, axis=-1, keepdims=True))
+        mx.eval(y)
+        self.prefilling = None
+        self._emit(request, y.item())
+        if request.done:
+            self._finish(request, request.cache)
+            return
+        self._join(request, y)
+
+    def _join(self, request: Request, y: mx.array) -> None:
+        batch_cache = [_to_batch_cache(c) for c in request.cache]
+        request.cache = None
+        if self._batch_cache is None:
+            self._batch_cache, self._y = batch_cache, y
+        else:
+            for running, new in zip(self._batch_cache, batch_cache):
+                running.extend(new)
+            self._y = mx.concatenate([self._y, y])
+        self.running.append(request)
+
+    # Decode
+
+    def _decode(self) -> None:
+        logits = self.model(self._y[:, None], cache=self._batch_cache)[:, -1, :]
+        logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
+        y = self._sample(logprobs)
+        mx.eval(y)
+
+        keep = []
+        for row, (request, token) in enumerate(zip(self.running, y.tolist())):
+            self._emit(request, token)
+            if request.done:
+                self._finish(request, [c.extract(row) for c in self._batch_cache] if request.prompt_cache is not None else None)
+            else:
+                keep.append(row)
+        self._y = y
+        self._keep_rows(keep)
+
+    def _keep_rows(self, keep: List[int]) -> None:
+        if len(keep) == len(self.running):
+            return
+        if keep:
+            index = mx.array(keep)
+            for c in self._batch_cache:
+                c.filter(index)
+            self._y = self._y[index]
+            self.running = [self.running[row] for row in keep]
+        else:
+            self._batch_cache = self._y = None
+            self.running = []
+
+    def _sample(self, logprobs: mx.array) -> mx.array:
+        groups: Dict[int, tuple] = {}
+        for row, request in enumerate(self.running):
+            groups.setdefault(id(request.sampler), (request.sampler, []))[1].append(row)
+        if len(groups) == 1:
+            return next(iter(groups.values()))[0](logprobs)
+        order, parts = [], []
+        for sampler, rows in groups.values():
+            order.extend(rows)
+            parts.append(sampler(logprobs[mx.array(rows)]))
+        return mx.concatenate(parts)[mx.array(np.argsort(order))]
+
+    def _emit(self, request: Request, token: int) -> None:
+        now = time.perf_counter()
+        if request.first_token_at is None:
+            request.first_token_at = now
+        if token in self.stop_tokens:
+            request.finish_reason = "stop"
+            return
+        request.tokens.append(token)
+        request.token_times.append(now)
+        self._served[request.priority] += 1 / self.classes[request.priority].weight
+        if request.on_token is not None:
+            try:
+                request.on_token(token)
+            except Exception as e:
+                self._fail(request, e)
+                return
+        if len(request.tokens) >= request.max_tokens:
+            request.finish_reason = "length"
+
+    def _finish(self, request: Request, cache: Optional[list]) -> None:
+        request.finished_at = time.perf_counter()
+        if request.error is not None:
+            return
+        metrics = self.metrics[request.priority]
+        metrics["queue_wait"].append(request.queue_seconds)
+        metrics["ttft"].append(request.first_token_at - request.submitted_at)
+        metrics["itl"].extend(request.inter_token_latencies)
+        metrics["latency"].append(request.finished_at - request.submitted_at)
+        if request.prompt_cache is not None and cache is not None and cache is not request.prompt_cache:
+            request.prompt_cache[:] = cache
+
+    def _fail(self, request: Request, error: Exception) -> None:
+        request.error = error
+        request.finish_reason = "error"
+        request.finished_at = time.perf_counter()
+        request.cache = request.next_input = None
+
+
+def benchmark_chunked_prefill(
+    model,
+    tokenizer,
+    stream_prompts: Sequence[Union[str, List[int]]],
+    long_prompt: Union[str, List[int]],
+    chunk_sizes: Sequence[Optional[int]] = (None, 512, 128),
+    max_tokens: int = 64,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Measure how a long prefill disturbs running streams, with and without chunking.
+
+    The ``stream_prompts`` requests start decoding first; then ``long_prompt``
+    arrives.  Inter-token latency is measured over the running streams and peak
+    memory from the moment the long prompt arrives.
+
+    Args:
+        model: The loaded MLX model
+        tokenizer: The tokenizer for the model
+        stream_prompts: Prompts of the concurrently decoding streams
+        long_prompt: The long prompt (e.g. a pasted document)
+        chunk_sizes: Prefill chunk sizes to compare; None is unchunked
+        max_tokens: Tokens generated per stream
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "chunk_size", "itl_p50_ms", "itl_p99_ms",
+        "itl_max_ms", "long_ttft_s" and "peak_memory_gb"
+
+    Example:
+        >>> benchmark_chunked_prefill(model, tokenizer, ["Tell me a joke."] * 4, document)
+    """
+    rows = []
+    for chunk_size in chunk_sizes:
+        scheduler = Scheduler(model, tokenizer, prefill_chunk_size=chunk_size)
+        streams = [scheduler.submit(p, max_tokens=max_tokens) for p in stream_prompts]
+        while scheduler.has_work() and not all(s.tokens or s.done for s in streams):
+            scheduler.step()
+        mx.clear_cache()
+        mx.reset_peak_memory()
+        long_request = scheduler.submit(long_prompt, max_tokens=16)
+        scheduler.run()
+
+        gaps = 1000 * np.array([g for s in streams for g in s.inter_token_latencies] or [0.0])
+        rows.append({
+            "chunk_size": chunk_size,
+            "itl_p50_ms": float(np.percentile(gaps, 50)),
+            "itl_p99_ms": float(np.percentile(gaps, 99)),
+            "itl_max_ms": float(gaps.max()),
+            "long_ttft_s": long_request.first_token_at - long_request.submitted_at,
+            "peak_memory_gb": mx.get_peak_memory() / 1e9,
+        })
+
+    if verbose:
+        print(f"{'Chunk':>8} {'ITL p50 ms':>11} {'ITL p99 ms':>11} {'ITL max ms':>11} {'Long TTFT s':>12} {'Peak GB':>8}")
+        print("-" * 66)
+        for r in rows:
+            chunk = "none" if r["chunk_size"] is None else r["chunk_size"]
+            print(
+                f"{chunk:>8} {r['itl_p50_ms']:>11.1f} {r['itl_p99_ms']:>11.1f} {r['itl_max_ms']:>11.1f} "
+                f"{r['long_ttft_s']:>12.2f} {r['peak_memory_gb']:>8.2f}"
+            )
+    return rows
+
+
+def benchmark_priorities(
+    model,
+    tokenizer,
+    interactive_prompts: Sequence[Union[str, List[int]]],
+    batch_prompts: Sequence[Union[str, List[int]]],
+    preempt_modes: Sequence[Optional[str]] = (None, "keep", "recompute"),
+    max_batch_size: int = 8,
+    max_tokens: int = 64,
+    batch_max_tokens: int = 256,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Measure interactive latency while a batch job fills the scheduler.
+
+    The batch prompts are submitted first and decode until the batch is full;
+    then the interactive prompts arrive.  ``None`` runs both classes at equal
+    priority without preemption, as a baseline.
+
+    Args:
+        model: The loaded MLX model
+        tokenizer: The tokenizer for the model
+        interactive_prompts: Prompts of the interactive requests
+        batch_prompts: Prompts of the batch job (more than ``max_batch_size``
+            keeps the batch full)
+        preempt_modes: Modes to compare; None disables priorities
+        max_batch_size: Maximum sequences decoded together
+        max_tokens: Tokens generated per interactive request
+        batch_max_tokens: Tokens generated per batch request
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "mode", "interactive_ttft_p50_ms",
+        "interactive_ttft_p99_ms", "interactive_itl_p99_ms",
+        "batch_tokens_per_second" and "preemptions"
+
+    Example:
+        >>> benchmark_priorities(model, tokenizer, ["What is 2 + 2?"] * 4, dataset_prompts)
+    """
+    rows = []
+    for mode in preempt_modes:
+        classes = None if mode else {"interactive": PriorityClass(), "batch": PriorityClass()}
+        scheduler = Scheduler(
+            model, tokenizer, max_batch_size=max_batch_size, classes=classes, preempt_mode=mode or "keep"
+        )
+        batch = [scheduler.submit(p, max_tokens=batch_max_tokens, priority="batch") for p in batch_prompts]
+        while scheduler.has_work() and len(scheduler.running) < min(max_batch_size, len(batch)):
+            scheduler.step()
+        start = time.perf_counter()
+        for p in interactive_prompts:
+            scheduler.submit(p, max_tokens=max_tokens, priority="interactive")
+        scheduler.run()
+        seconds = time.perf_counter() - start
+
+        stats = scheduler.class_stats()
+        rows.append({
+            "mode": mode or "none",
+            "interactive_ttft_p50_ms": stats["interactive"]["ttft_p50_ms"],
+            "interactive_ttft_p99_ms": stats["interactive"]["ttft_p99_ms"],
+            "interactive_itl_p99_ms": stats["interactive"]["itl_p99_ms"],
+            "batch_tokens_per_second": sum(len(r.tokens) for r in batch) / seconds,
+            "preemptions": stats["batch"]["preemptions"],
+        })
+        if verbose:
+            print(f"Preemption: {mode or 'none (equal priority)'}")
+            scheduler.print_class_stats()
+            print()
+
+    if verbose:
+        print(f"{'Mode':<10} {'TTFT p50 ms':>12} {'TTFT p99 ms':>12} {'ITL p99 ms':>11} {'Batch tok/s':>12} {'Preempt':>8}")
+        print("-" * 70)
+        for r in rows:
+            print(
+                f"{r['mode']:<10} {r['interactive_ttft_p50_ms']:>12.0f} {r['interactive_ttft_p99_ms']:>12.0f} "
+                f"{r['interactive_itl_p99_ms']:>11.1f} {r['batch_tokens_per_second']:>12.1f} {r['preemptions']:>8}"
+            )
+    return rows
+
+
+def _greedy(logprobs: mx.array) -> mx.array:
+    return mx.argmax(logprobs, axis=-1)
+
+
+def _to_batch_cache(cache):
+    if type(cache) not in _BATCH_CACHES:
+        raise ValueError(f"{type(cache).__name__} cannot be batched")
+    return _BATCH_CACHES[type(cache)].merge([cache])
@@ -0,0 +1,375 @@
+"""
+Tiered storage for many chat sessions' prompt caches.
+
+Each chat session holds its own ``make_prompt_cache`` object, and an idle
+session keeps its KV arrays in (GPU-visible) memory that active sessions need.
+``SessionCacheManager`` tracks when each session was last used and moves the
+least recently used caches down three tiers when a tier exceeds its limit:
+
+1. ``ram``: live MLX caches, ready to use.
+2. ``compressed``: host-memory bytes.  The "zlib" codec is lossless (byte
+   planes are split before compression, which helps 16-bit floats); the "int8"
+   codec quantizes each key/value vector to int8 with one scale (lossy, about 2x).
+3. ``disk``: ``.safetensors`` files in the format ``save_prompt_cache`` writes.
+
+Asking for a session promotes it back to ``ram`` transparently, and swap-in
+latency is recorded per tier.
+"""
+
+import hashlib
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import mlx.core as mx
+import numpy as np
+from mlx.utils import tree_flatten, tree_unflatten
+from mlx_lm.models import cache as mlx_cache
+from mlx_lm.models.cache import make_prompt_cache, save_prompt_cache
+
+from .eviction import ImportanceKVCache, cache_nbytes
+from .tracing import span
+
+TIERS = ("ram", "compressed", "disk")
+CODECS = ("zlib", "int8")
+
+# Cache classes that can be rebuilt from a saved state
+_CACHE_CLASSES = {
+    name: obj for name, obj in vars(mlx_cache).items() if isinstance(obj, type) and hasattr(obj, "from_state")
+}
+_CACHE_CLASSES["ImportanceKVCache"] = ImportanceKVCache
+
+
+@dataclass
+class _Session:
+    session_id: str
+    tier: str = "ram"
+    cache: Optional[list] = None
+    packed: Optional[dict] = None
+    path: Optional[Path] = None
+    nbytes: int = 0
+    last_access: float = field(default_factory=time.monotonic)
+    in_use: int = 0  # callers between get() and touch(); never demoted meanwhile
+
+
+class SessionCacheManager:
+    """
+    Keep the most recently used session caches in memory and swap out the rest.
+
+    Example:
+        >>> sessions = SessionCacheManager(model, ram_limit_bytes=2 * 1024**3)
+        >>> with sessions.session("alice") as prompt_cache:
+        ...     generate_response(model, tokenizer, "Hi, I'm Alice.", model_id=MODEL_ID, prompt_cache=prompt_cache)
+        >>> sessions.print_stats()
+    """
+
+    def __init__(
+        self,
+        model,
+        cache_dir: str = "session_cache",
+        ram_limit_bytes: int = 4 * 1024**3,
+        compressed_limit_bytes: int = 4 * 1024**3,
+        disk_limit_bytes: Optional[int] = None,
+        codec: str = "zlib",
+        cache_factory: Optional[Callable[[], list]] = None,
+    ):
+        """
+        Args:
+            model: The loaded MLX model
+            cache_dir: Directory for the disk tier
+            ram_limit_bytes: KV bytes kept as live caches
+            compressed_limit_bytes: Compressed bytes kept in host memory (0 skips the tier)
+            disk_limit_bytes: Bytes kept on disk; beyond it the least recently
+                used sessions are dropped. None means unlimited
+            codec: "zlib" (lossless) or "int8" (lossy, smaller) for the compressed tier
+            cache_factory: Makes the cache of a new session (default:
+                ``make_prompt_cache(model)``), e.g. ``lambda: create_cache(model, MODEL_ID, eviction="sink")[0]``
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}'. Choose from {CODECS}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.limits = {"ram": ram_limit_bytes, "compressed": compressed_limit_bytes, "disk": disk_limit_bytes}
+        self.codec = codec
+        self.cache_factory = cache_factory or (lambda: make_prompt_cache(model))
+        self.sessions: Dict[str, _Session] = {}
+        self.swap_in_seconds: Dict[str, List[float]] = {"compressed": [], "disk": []}
+        self.demotions = {"compressed": 0, "disk": 0, "dropped": 0}
+        self._lock = threading.RLock()
+
+    def get(self, session_id: str) -> list:
+        """
+        Return a session's prompt cache, creating it or swapping it in as needed.
+
+        The session is in use, and is never swapped out, until the matching
+        ``touch`` call (or the end of ``session``), which also accounts for
+        its new size.
+        """
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = _Session(session_id, cache=self.cache_factory())
+            elif session.tier != "ram":
+                self._promote(session)
+            session.last_access = time.monotonic()
+            session.in_use += 1
+            self._rebalance(pinned=session_id)
+            return session.cache
+
+    def touch(self, session_id: str) -> None:
+        """Release a session taken with ``get``, record its use and re-measure its size."""
+        with self._lock:
+            session = self.sessions[session_id]
+            session.last_access = time.monotonic()
+            session.in_use = max(0, session.in_use - 1)
+            if session.tier == "ram":
+                session.nbytes = cache_nbytes(session.cache)
+            self._rebalance(pinned=session_id)
+
+    @contextmanager
+    def session(self, session_id: str):
+        """Context that yields a session's cache and accounts for it afterwards."""
+        cache = self.get(session_id)
+        try:
+            yield cache
+        finally:
+            self.touch(session_id)
+
+    def drop(self, session_id: str) -> None:
+        """Forget a session and delete its stored cache."""
+        with self._lock:
+            session = self.sessions.pop(session_id)
+            if session.path is not None:
+                session.path.unlink(missing_ok=True)
+
+    def tier_bytes(self) -> Dict[str, int]:
+        totals = dict.fromkeys(TIERS, 0)
+        for s in self.sessions.values():
+            totals[s.tier] += s.nbytes
+        return totals
+
+    def stats(self) -> Dict:
+        """
+        Per-tier session counts, bytes and sessions per GB, plus swap-in latency.
+
+        Returns:
+            Dictionary with "tiers" (tier -> sessions, bytes, sessions_per_gb),
+            "swap_in_ms" (tier -> p50, p95, count) and "demotions"
+        """
+        with self._lock:
+            tiers = {}
+            totals = self.tier_bytes()
+            for tier in TIERS:
+                count = sum(s.tier == tier for s in self.sessions.values())
+                tiers[tier] = {
+                    "sessions": count,
+                    "bytes": totals[tier],
+                    "sessions_per_gb": count / (totals[tier] / 1e9) if totals[tier] else 0.0,
+                }
+            swap_in = {}
+            for tier, seconds in self.swap_in_seconds.items():
+                ms = 1000 * np.array(seconds or [0.0])
+                swap_in[tier] = {"p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)), "count": len(seconds)}
+            return {"tiers": tiers, "swap_in_ms": swap_in, "demotions": dict(self.demotions)}
+
+    def print_stats(self) -> None:
+        stats = self.stats()
+        print(f"{'Tier':<11} {'Sessions':>9} {'MB':>9} {'Sessions/GB':>12} {'Swap-in p50 ms':>15} {'p95 ms':>8}")
+        print("-" * 69)
+        for tier in TIERS:
+            t = stats["tiers"][tier]
+            swap = stats["swap_in_ms"].get(tier)
+            latency = f"{swap['p50']:>15.1f} {swap['p95']:>8.1f}" if swap and swap["count"] else f"{'':>15} {'':>8}"
+            print(f"{tier:<11} {t['sessions']:>9} {t['bytes'] / 1e6:>9.1f} {t['sessions_per_gb']:>12.1f} {latency}")
+        d = stats["demotions"]
+        print(f"Demotions: {d['compressed']} to compressed, {d['disk']} to disk, {d['dropped']} dropped")
+
+    # Tier moves
+
+    def _rebalance(self, pinned: Optional[str] = None) -> None:
+        session = self.sessions.get(pinned)
+        if session is not None and session.tier == "ram":
+            session.nbytes = cache_nbytes(session.cache)
+        for tier, lower in (("ram", "compressed"), ("compressed", "disk"), ("disk", None)):
+            limit = self.limits[tier]
+            if limit is None:
+                continue
+            if lower == "compressed" and not self.limits["compressed"]:
+                lower = "disk"
+            while self.tier_bytes()[tier] > limit:
+                victims = [
+                    s for s in self.sessions.values()
+                    if s.tier == tier and s.session_id != pinned and not s.in_use and s.nbytes > 0
+                ]
+                if not victims:
+                    break
+                self._demote(min(victims, key=lambda s: s.last_access), lower)
+
+    def _demote(self, session: _Session, target: Optional[str]) -> None:
+        if target is None:
+            # Over the disk limit: the session is gone for good
+            self.drop(session.session_id)
+            self.demotions["dropped"] += 1
+            return
+        if target == "compressed":
+            session.packed = _pack(session.cache, self.codec)
+            session.nbytes = session.packed["nbytes"]
+            session.cache = None
+        else:
+            cache = session.cache if session.cache is not None else _unpack(session.packed)
+            session.path = self.cache_dir / f"{_safe_name(session.session_id)}.safetensors"
+            save_prompt_cache(str(session.path), cache)
+            session.nbytes = session.path.stat().st_size
+            session.cache = session.packed = None
+        session.tier = target
+        self.demotions[target] += 1
+
+    def _promote(self, session: _Session) -> None:
+        start = time.perf_counter()
+        with span("cache load", tier=session.tier):
+            if session.tier == "compressed":
+                session.cache = _unpack(session.packed)
+                session.packed = None
+            else:
+                session.cache = _load_cache(session.path)
+                session.path.unlink(missing_ok=True)
+                session.path = None
+            mx.eval([c.state for c in session.cache if c.keys is not None])
+        self.swap_in_seconds[session.tier].append(time.perf_counter() - start)
+        session.tier = "ram"
+        session.nbytes = cache_nbytes(session.cache)
+
+
+def benchmark_session_cache(
+    model,
+    num_sessions: int = 32,
+    context_tokens: int = 1024,
+    accesses: int = 200,
+    ram_sessions: int = 4,
+    compressed_sessions: int = 8,
+    codec: str = "zlib",
+    cache_dir: str = "session_cache_benchmark",
+    seed: int = 0,
+    verbose: bool = True,
+) -> Dict:
+    """
+    Simulate many sessions with skewed access and report the manager's stats.
+
+    Each session is prefilled with ``context_tokens`` random tokens.  Tier
+    limits are sized to hold ``ram_sessions`` and ``compressed_sessions``
+    sessions; accesses follow a Zipf distribution, so a few sessions stay hot
+    and the rest are swapped in from lower tiers.
+
+    Args:
+        model: The loaded MLX model
+        num_sessions: Number of sessions
+        context_tokens: Tokens per session cache
+        accesses: Random session accesses after the setup
+        ram_sessions: Sessions that fit the ram tier
+        compressed_sessions: Sessions that fit the compressed tier (uncompressed size)
+        codec: Compressed-tier codec
+        cache_dir: Directory for the disk tier
+        seed: Random seed
+        verbose: Whether to print the stats table
+
+    Returns:
+        The manager's ``stats()``
+    """
+    rng = np.random.default_rng(seed)
+    vocab = model.args.vocab_size if hasattr(model, "args") else 32000
+
+    probe = make_prompt_cache(model)
+    model(mx.array(rng.integers(0, vocab, context_tokens))[None], cache=probe)
+    mx.eval([c.state for c in probe])
+    per_session = cache_nbytes(probe)
+    del probe
+
+    manager = SessionCacheManager(
+        model,
+        cache_dir=cache_dir,
+        ram_limit_bytes=ram_sessions * per_session,
+        compressed_limit_bytes=compressed_sessions * per_session,
+        codec=codec,
+    )
+    for i in range(num_sessions):
+        with manager.session(f"session-{i}") as cache:
+            model(mx.array(rng.integers(0, vocab, context_tokens))[None], cache=cache)
+            mx.eval([c.state for c in cache])
+
+    for i in (rng.zipf(1.5, accesses) - 1) % num_sessions:
+        with manager.session(f"session-{i}") as cache:
+            # One new token per turn keeps the focus on swapping, not compute
+            mx.eval(model(mx.array([[int(rng.integers(0, vocab))]]), cache=cache))
+
+    if verbose:
+        print(f"{num_sessions} sessions x {context_tokens} tokens ({per_session / 1e6:.1f} MB each), codec={codec}")
+        manager.print_stats()
+    stats = manager.stats()
+    for session_id in list(manager.sessions):
+        manager.drop(session_id)
+    return stats
+
+
+def _pack(cache: list, codec: str) -> dict:
+    arrays = dict(tree_flatten([c.state for c in cache]))
+    entries, nbytes = {}, 0
+    for key, array in arrays.items():
+        dtype = str(array.dtype).split(".")[-1]
+        if codec == "int8" and mx.issubdtype(array.dtype, mx.floating):
+            x = array.astype(mx.float32)
+            scale = mx.maximum(mx.abs(x).max(axis=-1, keepdims=True), 1e-8) / 127
+            q = np.array(mx.round(x / scale).astype(mx.int8))
+            entry = (dtype, array.shape, "int8", zlib.compress(q.tobytes(), 1), np.array(scale.astype(mx.float16)).tobytes())
+        else:
+            # 16-bit floats (bfloat16 included) travel as raw uint16 words
+            raw = np.array(array.view(mx.uint16) if array.dtype in (mx.bfloat16, mx.float16) else array)
+            itemsize = raw.dtype.itemsize
+            planes = raw.view(np.uint8).reshape(-1, itemsize).T.tobytes()  # byte planes compress better
+            entry = (dtype, array.shape, f"zlib:{raw.dtype.str}", zlib.compress(planes, 1), b"")
+        entries[key] = entry
+        nbytes += len(entry[3]) + len(entry[4])
+    return {
+        "arrays": entries,
+        "meta": [c.meta_state for c in cache],
+        "classes": [type(c).__name__ for c in cache],
+        "nbytes": nbytes,
+    }
+
+
+def _unpack(packed: dict) -> list:
+    arrays = {}
+    for key, (dtype, shape, codec, payload, extra) in packed["arrays"].items():
+        target = getattr(mx, dtype)
+        if codec == "int8":
+            q = np.frombuffer(zlib.decompress(payload), dtype=np.int8).reshape(shape)
+            scale = np.frombuffer(extra, dtype=np.float16).reshape(*shape[:-1], 1)
+            arrays[key] = (mx.array(q).astype(mx.float32) * mx.array(scale).astype(mx.float32)).astype(target)
+        else:
+            np_dtype = np.dtype(codec.split(":", 1)[1])
+            planes = np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape(np_dtype.itemsize, -1)
+            raw = np.ascontiguousarray(planes.T).view(np_dtype).reshape(shape)
+            array = mx.array(raw)
+            arrays[key] = array.view(target) if target in (mx.bfloat16, mx.float16) else array
+    states = tree_unflatten(list(arrays.items()))
+    return [
+        _CACHE_CLASSES[name].from_state(state, meta)
+        for name, state, meta in zip(packed["classes"], states, packed["meta"])
+    ]
+
+
+def _load_cache(path: Path) -> list:
+    # load_prompt_cache, with ImportanceKVCache added to the known classes
+    arrays, metadata = mx.load(str(path), return_metadata=True)
+    arrays = tree_unflatten(list(arrays.items()))
+    info, _, classes = tree_unflatten(list(metadata.items()))
+    return [_CACHE_CLASSES[name].from_state(state, meta) for name, state, meta in zip(classes, arrays, info)]
+
+
+def _safe_name(session_id: str) -> str:
+    # The readable part can collide ("a@b" and "a#b"); the hash keeps names distinct
+    readable = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in session_id)[:64]
+    return f"{readable}-{hashlib.sha256(session_id.encode()).hexdigest()[:16]}"
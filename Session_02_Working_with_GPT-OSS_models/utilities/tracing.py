@@ -0,0 +1,203 @@
+"""
+Opt-in tracing of generation phases, exported as a Chrome/Perfetto timeline.
+
+A slow ``generate_response`` call gives no hint whether the time went to
+building the prompt, tokenizing it, loading a cache, prefill, decoding or
+extracting the Harmony final channel.  Inside ``with trace(...)`` the utilities
+record a span for each of those phases, and one per decode step:
+
+- "generate_response" / "generate_response_with_system": the whole request
+- "build prompt", "harmony prompt", "chat template": prompt construction
+- "tokenize": encoding the prompt text
+- "prefill": from the start of generation to the first token
+- "decode step": each further token
+- "cache load": a session cache swapped back into RAM
+- "extract harmony final": post-processing of GPT-OSS output
+
+The trace is written as Chrome trace-event JSON, which opens in
+https://ui.perfetto.dev or chrome://tracing, and summarized as a table.
+
+Outside ``trace`` nothing is recorded: a traced function costs one global
+lookup per call, and generation goes straight to ``mlx_lm``.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+
+from mlx_lm import generate, stream_generate
+
+_tracer: Optional["Tracer"] = None
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace "complete" events.
+
+    Example:
+        >>> with trace("trace.json") as tracer:
+        ...     generate_response(model, tokenizer, "Hello!", model_id=MODEL_ID)
+        >>> tracer.summary()["decode step"]["calls"]
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.events: List[Dict] = []
+        self._threads: Dict[int, str] = {}
+
+    def add(self, name: str, start: float, end: float, **args) -> None:
+        """Record a span that ran from ``start`` to ``end`` (``time.perf_counter`` values)."""
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.start) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": args,
+        })
+
+    @contextmanager
+    def span(self, name: str, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), **args)
+
+    def save(self, path: str) -> None:
+        """Write the trace as Chrome trace-event JSON."""
+        threads = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in self._threads.items()
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": threads + self.events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per span name: "calls", "total_ms", "mean_ms", "p50_ms", "max_ms" and "share" of the trace."""
+        durations = defaultdict(list)
+        for event in self.events:
+            durations[event["name"]].append(event["dur"] / 1000)
+        wall_ms = max((e["ts"] + e["dur"] for e in self.events), default=0.0) / 1000
+        rows = {}
+        for name, values in durations.items():
+            values.sort()
+            rows[name] = {
+                "calls": len(values),
+                "total_ms": sum(values),
+                "mean_ms": sum(values) / len(values),
+                "p50_ms": values[len(values) // 2],
+                "max_ms": values[-1],
+                "share": sum(values) / wall_ms if wall_ms else 0.0,
+            }
+        return rows
+
+    def print_summary(self) -> None:
+        rows = self.summary()
+        print(f"{'Phase':<30} {'Calls':>6} {'Total ms':>10} {'Mean ms':>9} {'p50 ms':>8} {'Max ms':>8} {'Share':>6}")
+        print("-" * 83)
+        for name, r in sorted(rows.items(), key=lambda item: -item[1]["total_ms"]):
+            print(
+                f"{name:<30} {r['calls']:>6} {r['total_ms']:>10.1f} {r['mean_ms']:>9.2f} "
+                f"{r['p50_ms']:>8.2f} {r['max_ms']:>8.2f} {r['share']:>6.1%}"
+            )
+        if "decode step" in rows:
+            decode = rows["decode step"]
+            print(f"Decode: {1000 * decode['calls'] / decode['total_ms']:.1f} tok/s over {decode['calls']} steps")
+
+
+@contextmanager
+def trace(path: Optional[str] = "trace.json", summary: bool = True) -> Iterator[Tracer]:
+    """
+    Trace the utilities' generation phases for the duration of the block.
+
+    Args:
+        path: Where to write the Chrome trace JSON; None keeps it in memory only
+        summary: Whether to print a per-phase summary table at the end
+
+    Yields:
+        The ``Tracer`` collecting the spans
+
+    Example:
+        >>> with trace("slow_request.json"):
+        ...     generate_response(model, tokenizer, "Summarize this...", model_id=MODEL_ID)
+        # then open slow_request.json in https://ui.perfetto.dev
+    """
+    global _tracer
+    if _tracer is not None:
+        raise RuntimeError("tracing is already enabled")
+    tracer = _tracer = Tracer()
+    try:
+        yield tracer
+    finally:
+        _tracer = None
+        if path is not None:
+            tracer.save(path)
+            print(f"✓ Wrote {len(tracer.events)} trace events to {path}")
+        if summary:
+            tracer.print_summary()
+
+
+def span(name: str, **args):
+    """A context manager recording ``name`` while tracing, and doing nothing otherwise."""
+    return _tracer.span(name, **args) if _tracer is not None else _NULL_SPAN
+
+
+def traced(name: str):
+    """Decorator recording each call of the function as a span named ``name`` while tracing."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_stream_generate(model, tokenizer, prompt, **kwargs):
+    """``mlx_lm.stream_generate``, recording tokenize, prefill and decode-step spans while tracing."""
+    tracer = _tracer
+    if tracer is None:
+        return stream_generate(model, tokenizer, prompt, **kwargs)
+    return _stream_traced(tracer, model, tokenizer, prompt, **kwargs)
+
+
+def traced_generate(model, tokenizer, prompt, verbose: bool = False, **kwargs) -> str:
+    """``mlx_lm.generate``, recording tokenize, prefill and decode-step spans while tracing."""
+    tracer = _tracer
+    if tracer is None:
+        return generate(model, tokenizer, prompt, verbose=verbose, **kwargs)
+    return "".join(response.text for response in _stream_traced(tracer, model, tokenizer, prompt, **kwargs))
+
+
+def _stream_traced(tracer: Tracer, model, tokenizer, prompt, **kwargs):
+    if isinstance(prompt, str):
+        # Tokenize the way stream_generate would, but as a span of its own
+        with tracer.span("tokenize", chars=len(prompt)):
+            add_special_tokens = tokenizer.bos_token is None or not prompt.startswith(tokenizer.bos_token)
+            prompt = tokenizer.encode(prompt, add_special_tokens=add_special_tokens)
+
+    last = time.perf_counter()
+    for step, response in enumerate(stream_generate(model, tokenizer, prompt, **kwargs)):
+        now = time.perf_counter()
+        if step == 0:
+            # The first token arrives once the whole prompt has been processed
+            tracer.add("prefill", last, now, prompt_tokens=response.prompt_tokens, prompt_tps=response.prompt_tps)
+        else:
+            tracer.add("decode step", last, now, step=step, token=response.token)
+        yield response
+        # Leave the consumer's time out of the next step
+        last = time.perf_counter()
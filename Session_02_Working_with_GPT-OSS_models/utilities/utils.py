@@ -1,7 +1,16 @@
-from mlx_lm import generate
-from typing import Optional
+from typing import Dict, List, Optional
 
+from .adapters import adapter_scope
+from .chat_template import get_renderer
+from .constrained import HARMONY_FINAL_TRIGGER, constraint_processor
+from .sampling import sample_n
+from .tracing import traced, traced_generate
 
+# Generate kwargs that sample_n also accepts when n > 1
+_SAMPLE_N_KWARGS = {"max_tokens", "sampler", "prefill_step_size", "logits_processors"}
+
+
+@traced("generate_response")
 def generate_response(
     model, 
     tokenizer, 
@@ -9,6 +18,10 @@ def generate_response(
     model_id: str = None,
     prompt_cache=None,
     reasoning_level: str = "low",
+    n: int = 1,
+    adapter: Optional[str] = None,
+    scheduler=None,
+    constraint=None,
     **kwargs
 ):
     """
@@ -23,24 +36,29 @@ def generate_response(
         prompt_cache: Optional prompt cache for multi-turn conversations
         reasoning_level: For GPT-OSS models, set reasoning effort: "low", "medium", or "high"
                         (default: "low" - reduces verbose internal analysis)
+        n: Number of completions to sample. With n > 1 the prompt is prefilled
+           once and the completions are decoded as one batch (see ``sample_n``).
+           Only max_tokens, sampler, prefill_step_size and logits_processors
+           are accepted as kwargs then
+        adapter: Name of a LoRA adapter loaded with ``get_model(..., adapters=...)``;
+                 None uses the base model
+        scheduler: Optional shared ``Scheduler``. The request is then batched with
+                   other callers' requests and its prompt is prefilled in chunks
+                   between their decode steps. Pass ``priority="batch"`` for
+                   offline work that interactive requests may preempt
+        constraint: Optional regex (str), JSON schema (dict) or compiled ``TokenFSM``
+                    the response must match. For GPT-OSS models it applies to
+                    the final channel, after the model has reasoned freely
         **kwargs: Additional arguments to pass to the generate function
                   (e.g., max_tokens, temperature, top_p, etc.)
+
+    Returns:
+        The response text, or a list of n ``Completion`` objects when n > 1
     """
     # Detect if this is a GPT-OSS model that requires Harmony format
     is_gpt_oss = model_id and ("gpt-oss" in model_id.lower() or "oss-gpt" in model_id.lower())
     
-    if is_gpt_oss:
-        system_msg = f"Reasoning: {reasoning_level}"
-        prompt = _format_harmony_prompt(user_message, system_msg)
-    elif tokenizer.chat_template is not None:
-        messages = [{"role": "user", "content": user_message}]
-        prompt = tokenizer.apply_chat_template(
-            messages,
-            add_generation_prompt=True,
-            tokenize=False,
-        )
-    else:
-        prompt = user_message
+    prompt = _build_prompt(tokenizer, user_message, is_gpt_oss=is_gpt_oss, reasoning_level=reasoning_level)
     
     print(f"User message: {user_message}\n")
     
@@ -49,14 +67,24 @@ def generate_response(
         if 'max_tokens' not in kwargs:
             kwargs['max_tokens'] = 2048  # Generous limit to allow model to complete reasoning
     
-    response = generate(
-        model, 
-        tokenizer, 
-        prompt=prompt, 
-        verbose=False, 
-        prompt_cache=prompt_cache, 
-        **kwargs
-    )
+    if constraint is not None:
+        _add_constraint(tokenizer, constraint, prompt, is_gpt_oss, n, scheduler, kwargs)
+    
+    if scheduler is not None:
+        response = _generate_scheduled(scheduler, prompt, n, adapter, prompt_cache, **kwargs)
+    else:
+        with adapter_scope(model, adapter):
+            if n > 1:
+                return _generate_n(model, tokenizer, prompt, n, is_gpt_oss, prompt_cache, **kwargs)
+            
+            response = traced_generate(
+                model, 
+                tokenizer, 
+                prompt=prompt, 
+                verbose=False, 
+                prompt_cache=prompt_cache, 
+                **kwargs
+            )
     
     # If GPT-OSS, extract only the final channel response
     if is_gpt_oss:
@@ -67,6 +95,40 @@ def generate_response(
     return response
 
 
+def _add_constraint(tokenizer, constraint, prompt, is_gpt_oss, n, scheduler, kwargs):
+    """Add a constrained-decoding logits processor to the generate kwargs."""
+    if n > 1 or scheduler is not None:
+        raise ValueError("constraint is not supported together with n > 1 or a scheduler")
+    trigger = HARMONY_FINAL_TRIGGER if is_gpt_oss else None
+    processor = constraint_processor(tokenizer, constraint, trigger=trigger, prompt=prompt)
+    kwargs['logits_processors'] = list(kwargs.get('logits_processors') or []) + [processor]
+
+
+def _generate_scheduled(scheduler, prompt, n, adapter, prompt_cache, **kwargs):
+    """Run one request through a shared Scheduler and return its text."""
+    if n > 1 or adapter is not None:
+        raise ValueError("n > 1 and adapter are not supported together with a scheduler")
+    return scheduler.generate(prompt, prompt_cache=prompt_cache, **kwargs)
+
+
+def _generate_n(model, tokenizer, prompt, n, is_gpt_oss, prompt_cache, **kwargs):
+    """Sample n completions with one shared prefill and print them."""
+    unsupported = sorted(set(kwargs) - _SAMPLE_N_KWARGS)
+    if unsupported:
+        raise ValueError(f"not supported together with n > 1: {', '.join(unsupported)}")
+    completions = sample_n(model, tokenizer, prompt, n=n, prompt_cache=prompt_cache, **kwargs)
+    for i, completion in enumerate(completions, 1):
+        if is_gpt_oss:
+            completion.text = _extract_harmony_final(completion.text)
+        print(
+            f"[{i}/{n}] ({completion.generation_tokens} tokens, "
+            f"{completion.generation_tps:.1f} tok/s, {completion.finish_reason})"
+        )
+        print(f"{completion.text}\n")
+    return completions
+
+
+@traced("extract harmony final")
 def _extract_harmony_final(response: str) -> str:
     """
     Extract the final response from Harmony format output.
@@ -97,6 +159,40 @@ def _extract_harmony_final(response: str) -> str:
     return response
 
 
+@traced("build prompt")
+def _build_prompt(
+    tokenizer,
+    user_message: str,
+    system_message: Optional[str] = None,
+    is_gpt_oss: bool = False,
+    reasoning_level: str = "low",
+) -> str:
+    """
+    Format a user (and optional system) message for the model.
+    
+    GPT-OSS models get a Harmony prompt with the reasoning level, other models
+    their chat template, and models without a template the plain text.
+    """
+    if is_gpt_oss:
+        # Combine reasoning level with custom system message if provided
+        full_system_msg = f"Reasoning: {reasoning_level}"
+        if system_message:
+            full_system_msg = f"{full_system_msg}\n{system_message}"
+        return _format_harmony_prompt(user_message, full_system_msg)
+    if tokenizer.chat_template is not None:
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": user_message})
+        return tokenizer.apply_chat_template(
+            messages,
+            add_generation_prompt=True,
+            tokenize=False,
+        )
+    return f"{system_message}\n\n{user_message}" if system_message else user_message
+
+
+@traced("harmony prompt")
 def _format_harmony_prompt(user_message: str, system_message: Optional[str] = None) -> str:
     """
     Format a prompt using the Harmony format for GPT-OSS models.
@@ -152,6 +248,7 @@ def _format_harmony_prompt(user_message: str, system_message: Optional[str] = No
         return user_message
 
 
+@traced("generate_response_with_system")
 def generate_response_with_system(
     model,
     tokenizer,
@@ -160,6 +257,11 @@ def generate_response_with_system(
     model_id: str = None,
     prompt_cache=None,
     reasoning_level: str = "low",
+    n: int = 1,
+    adapter: Optional[str] = None,
+    scheduler=None,
+    constraint=None,
+    history: Optional[List[Dict[str, str]]] = None,
     **kwargs
 ):
     """
@@ -174,28 +276,35 @@ def generate_response_with_system(
         model_id: The model identifier (used to determine prompt format)
         prompt_cache: Optional prompt cache for multi-turn conversations
         reasoning_level: For GPT-OSS models, set reasoning effort: "low", "medium", or "high"
+        n: Number of completions to sample; see ``generate_response``
+        adapter: Name of a loaded LoRA adapter; see ``generate_response``
+        scheduler: Optional shared ``Scheduler``; see ``generate_response``
+        constraint: Optional regex or JSON schema; see ``generate_response``
+        history: Earlier turns as chat messages ({"role": ..., "content": ...}),
+                 placed between the system message and this one. The prompt is
+                 then rendered with ``IncrementalChatRenderer``, which reuses the
+                 tokens of turns it has already seen. With a ``prompt_cache``
+                 (start it empty and pass it on every turn) only the tokens the
+                 cache lacks are prefilled. Not for GPT-OSS models
         **kwargs: Additional arguments to pass to the generate function
+
+    Returns:
+        The response text, or a list of n ``Completion`` objects when n > 1
     """
     is_gpt_oss = model_id and ("gpt-oss" in model_id.lower() or "oss-gpt" in model_id.lower())
     
-    if is_gpt_oss:
-        # Combine reasoning level with custom system message if provided
-        full_system_msg = f"Reasoning: {reasoning_level}"
-        if system_message:
-            full_system_msg = f"{full_system_msg}\n{system_message}"
-        prompt = _format_harmony_prompt(user_message, full_system_msg)
-    elif tokenizer.chat_template is not None:
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": user_message})
-        prompt = tokenizer.apply_chat_template(
-            messages,
-            add_generation_prompt=True,
-            tokenize=False,
-        )
+    if history is not None:
+        if is_gpt_oss or tokenizer.chat_template is None:
+            raise ValueError("history needs a model with a chat template (Harmony prompts are not supported)")
+        messages = [{"role": "system", "content": system_message}] if system_message else []
+        messages += list(history) + [{"role": "user", "content": user_message}]
+        renderer = get_renderer(tokenizer)
+        if prompt_cache is not None:
+            prompt = renderer.render_delta(messages, prompt_cache)
+        else:
+            prompt = renderer.render(messages)
     else:
-        prompt = f"{system_message}\n\n{user_message}" if system_message else user_message
+        prompt = _build_prompt(tokenizer, user_message, system_message, is_gpt_oss, reasoning_level)
     
     print(f"User message: {user_message}\n")
     if system_message:
@@ -206,14 +315,24 @@ def generate_response_with_system(
         if 'max_tokens' not in kwargs:
             kwargs['max_tokens'] = 2048  # Generous limit to allow model to complete reasoning
     
-    response = generate(
-        model,
-        tokenizer,
-        prompt=prompt,
-        verbose=False,
-        prompt_cache=prompt_cache,
-        **kwargs
-    )
+    if constraint is not None:
+        _add_constraint(tokenizer, constraint, prompt, is_gpt_oss, n, scheduler, kwargs)
+    
+    if scheduler is not None:
+        response = _generate_scheduled(scheduler, prompt, n, adapter, prompt_cache, **kwargs)
+    else:
+        with adapter_scope(model, adapter):
+            if n > 1:
+                return _generate_n(model, tokenizer, prompt, n, is_gpt_oss, prompt_cache, **kwargs)
+            
+            response = traced_generate(
+                model,
+                tokenizer,
+                prompt=prompt,
+                verbose=False,
+                prompt_cache=prompt_cache,
+                **kwargs
+            )
     
     # If GPT-OSS, extract only the final channel response
     if is_gpt_oss:
@@ -0,0 +1,345 @@
+"""
+Pick the largest quantization of a model that fits a memory budget.
+
+Each ``ModelType`` names one quantization (4-bit Qwen, 8-bit Llama, ...), and
+``get_model`` loads it whether or not it fits.  ``MODEL_VARIANTS`` lists the
+quantizations each family can be loaded in: either a published MLX repo or,
+where none is listed, a local conversion of the family's source weights with
+``mlx_lm.convert``.  ``select_variant`` walks them from most to fewest bits and
+returns the first whose weights plus a KV cache of ``kv_tokens`` tokens fit the
+budget, converting it into ``converted_dir`` the first time it is needed.
+"""
+
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .get_model import MODEL_ALIASES, ModelType
+
+# Quantization bits -> published MLX repo, or None to convert locally from "source"
+MODEL_VARIANTS = {
+    ModelType.QWEN3_4B: {
+        "source": "Qwen/Qwen3-4B-Instruct-2507",
+        "bits": {16: None, 8: None, 4: ModelType.QWEN3_4B.value},
+    },
+    ModelType.LLAMA_8B: {
+        "source": "meta-llama/Llama-3.1-8B-Instruct",
+        "bits": {16: None, 8: ModelType.LLAMA_8B.value, 4: None},
+    },
+    ModelType.MISTRAL_24B: {
+        "source": "mistralai/Mistral-Small-3.2-24B-Instruct-2506",
+        "bits": {8: None, 4: ModelType.MISTRAL_24B.value},
+    },
+    # GPT-OSS is released with MXFP4 experts; there is no larger variant to pick
+    ModelType.GPT_20B: {
+        "source": "openai/gpt-oss-20b",
+        "bits": {4: ModelType.GPT_20B.value},
+    },
+    ModelType.GPT_120B: {
+        "source": "openai/gpt-oss-120b",
+        "bits": {4: ModelType.GPT_120B.value},
+    },
+}
+
+Q_GROUP_SIZE = 64
+SIZES_FILE = "repo_sizes.json"  # weight bytes per Hub repo, kept in converted_dir
+
+
+def model_family(model) -> ModelType:
+    """
+    Find the ``ModelType`` for an enum value, alias or model ID.
+
+    Raises:
+        ValueError: If the model is not one of the families in ``MODEL_VARIANTS``
+    """
+    if isinstance(model, ModelType):
+        return model
+    if isinstance(model, str):
+        if model.lower() in MODEL_ALIASES:
+            return MODEL_ALIASES[model.lower()]
+        for model_type, family in MODEL_VARIANTS.items():
+            if model == family["source"] or model in family["bits"].values():
+                return model_type
+    raise ValueError(f"No quantization variants are known for {model}; use one of {[m.short_name for m in MODEL_VARIANTS]}")
+
+
+def list_variants(
+    model,
+    kv_tokens: int = 8192,
+    converted_dir: str = "converted_models",
+    hf_token: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Describe every quantization of a model family and the memory it needs.
+
+    Sizes are read from the Hub (or the local conversion) when the variant
+    exists, and estimated from the source weights otherwise.  Hub sizes are
+    remembered in ``converted_dir``, so later calls work offline.
+
+    Args:
+        model: ``ModelType``, alias or model ID of the family
+        kv_tokens: Context length whose KV cache must also fit
+        converted_dir: Directory holding local conversions
+        hf_token: Hugging Face token for gated source repos
+
+    Returns:
+        List of dictionaries with "bits", "model_id", "available", "weight_bytes",
+        "kv_bytes" and "required_bytes", from most to fewest bits
+    """
+    model_type = model_family(model)
+    family = MODEL_VARIANTS[model_type]
+    token = hf_token or os.getenv("HF_TOKEN")
+
+    source_bytes = None
+    kv_bytes = None
+    variants = []
+    for bits, repo in sorted(family["bits"].items(), reverse=True):
+        local = _converted_path(model_type, bits, converted_dir)
+        model_id = repo or str(local)
+        if repo:
+            weight_bytes, available = _repo_bytes(repo, token, converted_dir), True
+        elif (local / "config.json").exists():
+            weight_bytes, available = sum(f.stat().st_size for f in local.glob("*.safetensors")), True
+        else:
+            if source_bytes is None:
+                source_bytes = _repo_bytes(family["source"], token, converted_dir)
+            # Source weights are 16-bit; affine quantization adds a 16-bit scale
+            # and bias per group of Q_GROUP_SIZE weights
+            extra = 0 if bits == 16 else 32 / Q_GROUP_SIZE
+            weight_bytes, available = int(source_bytes / 16 * (bits + extra)), False
+        if kv_bytes is None:
+            # A local conversion has its own config.json, so it needs no Hub access
+            kv_bytes = kv_bytes_per_token(model_id if available else family["source"], token) * kv_tokens
+        variants.append({
+            "bits": bits,
+            "model_id": model_id,
+            "available": available,
+            "weight_bytes": weight_bytes,
+            "kv_bytes": kv_bytes,
+            "required_bytes": weight_bytes + kv_bytes,
+        })
+    return variants
+
+
+def select_variant(
+    model,
+    memory_budget_bytes: int,
+    kv_tokens: int = 8192,
+    converted_dir: str = "converted_models",
+    hf_token: Optional[str] = None,
+    verbose: bool = True,
+) -> Tuple[str, int]:
+    """
+    Return the largest quantization of a model that fits the memory budget.
+
+    A variant without a published MLX repo is converted with ``mlx_lm.convert``
+    into ``converted_dir`` the first time it is selected and reused afterwards.
+
+    Args:
+        model: ``ModelType``, alias or model ID of the family
+        memory_budget_bytes: Memory available for weights plus KV cache
+        kv_tokens: Context length whose KV cache must also fit
+        converted_dir: Directory holding local conversions
+        hf_token: Hugging Face token for gated source repos
+        verbose: Whether to print the choice
+
+    Returns:
+        tuple: (model_id, bits)
+            - model_id: Hub repo or local directory to pass to ``load``
+            - bits: Quantization bits of the chosen variant
+
+    Raises:
+        ValueError: If even the smallest variant does not fit
+
+    Example:
+        >>> model_id, bits = select_variant("llama", memory_budget_bytes=8 * 1024**3)
+    """
+    model_type = model_family(model)
+    variants = list_variants(model_type, kv_tokens, converted_dir, hf_token)
+    fitting = [v for v in variants if v["required_bytes"] <= memory_budget_bytes]
+    if not fitting:
+        smallest = variants[-1]
+        raise ValueError(
+            f"{model_type.short_name} needs at least {smallest['required_bytes'] / 1e9:.1f} GB "
+            f"({smallest['bits']}-bit weights + {kv_tokens} tokens of KV cache); "
+            f"the budget is {memory_budget_bytes / 1e9:.1f} GB"
+        )
+    choice = fitting[0]
+    if verbose:
+        print(
+            f"📐 {model_type.short_name}: {choice['bits']}-bit needs {choice['required_bytes'] / 1e9:.1f} GB "
+            f"of the {memory_budget_bytes / 1e9:.1f} GB budget"
+        )
+    if not choice["available"]:
+        _convert(MODEL_VARIANTS[model_type]["source"], Path(choice["model_id"]), choice["bits"], verbose, hf_token)
+    return choice["model_id"], choice["bits"]
+
+
+def benchmark_variants(
+    model,
+    memory_budget_bytes: Optional[int] = None,
+    kv_tokens: int = 8192,
+    prompt: str = "Write a short story about a lighthouse keeper.",
+    max_tokens: int = 128,
+    convert_missing: bool = False,
+    converted_dir: str = "converted_models",
+    hf_token: Optional[str] = None,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Load each quantization of a model family and measure it.
+
+    Args:
+        model: ``ModelType``, alias or model ID of the family
+        memory_budget_bytes: Optional budget; variants over it are reported, not loaded
+        kv_tokens: Context length whose KV cache must also fit
+        prompt: Prompt for the decode speed test
+        max_tokens: Tokens generated for the decode speed test
+        convert_missing: Convert variants that have no repo or local copy yet
+        converted_dir: Directory holding local conversions
+        hf_token: Hugging Face token for gated repos
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "bits", "model_id", "size_gb", "load_seconds",
+        "resident_gb", "decode_tps" and "skipped"
+
+    Example:
+        >>> benchmark_variants("qwen", convert_missing=True)
+    """
+    import mlx.core as mx
+    from mlx_lm import load, stream_generate
+
+    model_type = model_family(model)
+    rows = []
+    for v in list_variants(model_type, kv_tokens, converted_dir, hf_token):
+        row = {
+            "bits": v["bits"], "model_id": v["model_id"], "size_gb": v["weight_bytes"] / 1e9,
+            "load_seconds": None, "resident_gb": None, "decode_tps": None, "skipped": None,
+        }
+        rows.append(row)
+        if memory_budget_bytes is not None and v["required_bytes"] > memory_budget_bytes:
+            row["skipped"] = "over budget"
+            continue
+        if not v["available"]:
+            if not convert_missing:
+                row["skipped"] = "not converted"
+                continue
+            _convert(MODEL_VARIANTS[model_type]["source"], Path(v["model_id"]), v["bits"], verbose, hf_token)
+
+        mx.clear_cache()
+        before = mx.get_active_memory()
+        start = time.perf_counter()
+        loaded_model, tokenizer = load(v["model_id"])
+        mx.eval(loaded_model.parameters())
+        row["load_seconds"] = time.perf_counter() - start
+        row["resident_gb"] = (mx.get_active_memory() - before) / 1e9
+        for response in stream_generate(loaded_model, tokenizer, prompt, max_tokens=max_tokens):
+            pass
+        row["decode_tps"] = response.generation_tps
+        del loaded_model, tokenizer
+        mx.clear_cache()
+
+    if verbose:
+        print(f"{'Bits':>4} {'Size GB':>8} {'Load s':>7} {'Resident GB':>12} {'Decode tok/s':>13}  Model")
+        print("-" * 80)
+        for r in rows:
+            if r["skipped"]:
+                print(f"{r['bits']:>4} {r['size_gb']:>8.1f} {'':>7} {'':>12} {'':>13}  {r['model_id']} ({r['skipped']})")
+            else:
+                print(
+                    f"{r['bits']:>4} {r['size_gb']:>8.1f} {r['load_seconds']:>7.1f} {r['resident_gb']:>12.1f} "
+                    f"{r['decode_tps']:>13.1f}  {r['model_id']}"
+                )
+    return rows
+
+
+def kv_bytes_per_token(repo: str, hf_token: Optional[str] = None) -> int:
+    """
+    KV cache bytes per token of context (keys and values, 16-bit, all layers).
+
+    Args:
+        repo: Hub repo or local directory with a ``config.json``
+        hf_token: Hugging Face token for gated repos
+    """
+    path = Path(repo) / "config.json"
+    if not path.exists():
+        from huggingface_hub import hf_hub_download
+        path = hf_hub_download(repo, "config.json", token=hf_token)
+    with open(path) as f:
+        config = json.load(f)
+    config = config.get("text_config", config)
+    heads = config["num_attention_heads"]
+    kv_heads = config.get("num_key_value_heads") or heads
+    head_dim = config.get("head_dim") or config["hidden_size"] // heads
+    return 2 * config["num_hidden_layers"] * kv_heads * head_dim * 2
+
+
+def _repo_bytes(repo: str, hf_token: Optional[str], converted_dir: str) -> int:
+    # A repo's weights do not change size, so each is asked for once
+    sizes_path = Path(converted_dir) / SIZES_FILE
+    sizes = json.loads(sizes_path.read_text()) if sizes_path.exists() else {}
+    if repo in sizes:
+        return sizes[repo]
+
+    from huggingface_hub import HfApi
+
+    info = HfApi(token=hf_token).model_info(repo, files_metadata=True)
+    # Top-level weights only: some repos also ship "original/" or
+    # "consolidated.safetensors" copies of the same tensors
+    sizes[repo] = sum(
+        s.size or 0 for s in info.siblings
+        if s.rfilename.endswith(".safetensors") and "/" not in s.rfilename
+        and not s.rfilename.startswith("consolidated")
+    )
+    sizes_path.parent.mkdir(parents=True, exist_ok=True)
+    sizes_path.write_text(json.dumps(sizes, indent=2))
+    return sizes[repo]
+
+
+def _converted_path(model_type: ModelType, bits: int, converted_dir: str) -> Path:
+    name = MODEL_VARIANTS[model_type]["source"].split("/")[-1]
+    return Path(converted_dir) / (f"{name}-bf16" if bits == 16 else f"{name}-{bits}bit")
+
+
+def _convert(source: str, target: Path, bits: int, verbose: bool, hf_token: Optional[str] = None) -> None:
+    from mlx_lm import convert
+
+    # Convert next to the target and rename, so an interrupted conversion
+    # is never mistaken for a finished one
+    partial = target.with_name(target.name + ".partial")
+    if partial.exists():
+        shutil.rmtree(partial)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if verbose:
+        print(f"⚙️  Converting {source} to {bits}-bit in {target} (one time)...")
+    start = time.perf_counter()
+    with _hf_token_env(hf_token):
+        if bits == 16:
+            convert(source, str(partial), dtype="bfloat16")
+        else:
+            convert(source, str(partial), quantize=True, q_bits=bits, q_group_size=Q_GROUP_SIZE)
+    os.replace(partial, target)
+    if verbose:
+        print(f"✓ Converted in {time.perf_counter() - start:.0f}s")
+
+
+@contextmanager
+def _hf_token_env(hf_token: Optional[str]):
+    # mlx_lm.convert takes no token; the Hub client reads HF_TOKEN on each request
+    if not hf_token:
+        yield
+        return
+    previous = os.environ.get("HF_TOKEN")
+    os.environ["HF_TOKEN"] = hf_token
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["HF_TOKEN"]
+        else:
+            os.environ["HF_TOKEN"] = previous
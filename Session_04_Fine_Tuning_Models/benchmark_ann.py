@@ -0,0 +1,36 @@
+"""
+Sweep recall vs latency of HNSW and IVF indexes against the flat FAISS baseline.
+
+Run from this folder after the notebook has written test_dataset.jsonl:
+
+    uv run python benchmark_ann.py
+    uv run python benchmark_ann.py --model finetuned_arctic_ft --top-k 5
+"""
+
+import argparse
+import json
+
+from langchain_huggingface import HuggingFaceEmbeddings
+from utilities import CachedEmbeddings, sweep_ann
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--dataset", default="test_dataset.jsonl", help="Dataset written by the notebook")
+parser.add_argument("--model", default="Snowflake/snowflake-arctic-embed-l", help="Embedding model name or local path")
+parser.add_argument("--top-k", type=int, default=5)
+parser.add_argument("--hnsw-m", type=int, default=32)
+parser.add_argument("--ef-construction", type=int, default=200)
+parser.add_argument("--nlist", type=int, default=None)
+args = parser.parse_args()
+
+with open(args.dataset) as f:
+    dataset = json.load(f)
+
+embed_model = CachedEmbeddings(HuggingFaceEmbeddings(model_name=args.model))
+sweep_ann(
+    dataset,
+    embed_model,
+    hnsw_m=args.hnsw_m,
+    ef_construction=args.ef_construction,
+    nlist=args.nlist,
+    top_k=args.top_k,
+)
@@ -0,0 +1,85 @@
+"""
+Exports are resolved lazily: each submodule is imported the first time one of
+its names is used, so ``from utilities import pretokenize`` in a training
+notebook does not pull in langchain_core, pydantic or the retrieval stack.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "retrieval_eval": (
+        "embed_texts",
+        "top_k_search",
+        "retrieval_metrics",
+        "evaluate_retrieval",
+        "evaluate_models",
+        "evaluate_openai_loop",
+        "compare_with_loop",
+    ),
+    "embedding_cache": ("CachedEmbeddings", "model_fingerprint"),
+    "matryoshka_retriever": ("MatryoshkaIndex", "MatryoshkaRetriever", "benchmark_matryoshka_tiers"),
+    "quantized_index": ("QuantizedIndex", "QuantizedRetriever", "benchmark_quantized_index"),
+    "ann_index": ("build_vectorstore", "set_search_params", "save_vectorstore", "load_vectorstore", "sweep_ann"),
+    "question_generation": (
+        "generate_questions",
+        "parse_questions",
+        "ChainBackend",
+        "MLXBackend",
+        "ExtractiveBackend",
+    ),
+    "ingestion": (
+        "content_hash",
+        "chunk_id",
+        "iter_files",
+        "parse_file",
+        "stream_documents",
+        "stream_files",
+        "stream_chunks",
+        "ingest",
+        "benchmark_ingestion",
+    ),
+    "incremental_index": ("IncrementalVectorStore",),
+    "dedup": ("minhash_signatures", "lsh_clusters", "deduplicate_chunks", "benchmark_dedup"),
+    "dataset_io": (
+        "DatasetWriter",
+        "write_dataset",
+        "convert_dataset",
+        "iter_records",
+        "read_dataset",
+        "iter_examples",
+        "PairDataset",
+        "benchmark_dataset_io",
+    ),
+    "cached_loss": ("make_train_loss", "benchmark_cached_loss"),
+    "tokenization": (
+        "tokenizer_fingerprint",
+        "TokenizedTexts",
+        "pretokenize",
+        "LengthBucketSampler",
+        "padding_ratio",
+        "benchmark_length_bucketing",
+    ),
+    "rewards": (
+        "ParsedCompletion",
+        "parse_completion",
+        "RewardEngine",
+        "DEFAULT_REWARDS",
+        "benchmark_rewards",
+    ),
+}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    if name in _MODULES:
+        value = getattr(importlib.import_module(f".{_MODULES[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,260 @@
+"""
+Approximate-nearest-neighbor (HNSW / IVF) FAISS vector stores.
+
+``FAISS.from_documents`` always builds an exact ``IndexFlatL2``, so every query
+scans the whole corpus.  ``build_vectorstore`` builds the same LangChain ``FAISS``
+vector store on top of an HNSW or IVF index instead, so ``as_retriever`` and the
+LCEL chains work unchanged.  Stores are persisted with ``save_local`` plus a small
+JSON file holding the index parameters, and reload without re-embedding.
+
+Build-time parameters:
+    hnsw: ``hnsw_m`` (graph degree) and ``ef_construction``
+    ivf:  ``nlist`` (number of clusters)
+
+Query-time knobs (set with ``set_search_params``):
+    hnsw: ``ef_search`` - larger is slower and more accurate
+    ivf:  ``nprobe``    - number of clusters scanned per query
+"""
+
+import json
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .retrieval_eval import embed_texts, retrieval_metrics
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+CONFIG_FILE = "ann_config.json"
+
+
+def build_vectorstore(
+    documents,
+    embed_model,
+    index_type: str = "hnsw",
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    nlist: Optional[int] = None,
+    ef_search: int = 64,
+    nprobe: int = 8,
+    batch_size: int = 64,
+):
+    """
+    Build a LangChain ``FAISS`` vector store backed by a flat, HNSW or IVF index.
+
+    Args:
+        documents: LangChain documents to index
+        embed_model: A LangChain ``Embeddings`` object
+        index_type: "flat", "hnsw" or "ivf" (default: "hnsw")
+        hnsw_m: Neighbors per HNSW graph node
+        ef_construction: HNSW candidate list size while building
+        nlist: Number of IVF clusters (default: about 4 * sqrt(n_docs))
+        ef_search: Initial HNSW query-time candidate list size
+        nprobe: Initial number of IVF clusters scanned per query
+        batch_size: Number of texts per embedding call
+
+    Returns:
+        A ``FAISS`` vector store; use ``.as_retriever(search_kwargs={"k": 6})``
+        exactly as with ``FAISS.from_documents``
+
+    Example:
+        >>> base_vectorstore = build_vectorstore(training_documents, huggingface_embeddings, "hnsw")
+        >>> base_retriever = base_vectorstore.as_retriever(search_kwargs={"k": 6})
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    texts = [d.page_content for d in documents]
+    vectors = embed_texts(embed_model, texts, batch_size)
+    params = {
+        "index_type": index_type,
+        "hnsw_m": hnsw_m,
+        "ef_construction": ef_construction,
+        "nlist": nlist or _default_nlist(len(vectors)),
+    }
+    index = _make_index(vectors, params)
+
+    vectorstore = FAISS(embed_model, index, InMemoryDocstore(), {})
+    vectorstore.add_embeddings(
+        list(zip(texts, vectors.tolist())),
+        metadatas=[d.metadata for d in documents],
+        ids=[str(d.metadata.get("id", i)) for i, d in enumerate(documents)],
+    )
+    vectorstore.ann_params = params
+    set_search_params(vectorstore, ef_search=ef_search, nprobe=nprobe)
+    return vectorstore
+
+
+def set_search_params(vectorstore, ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> None:
+    """
+    Set the query-time recall/latency knobs on a vector store's index.
+
+    Args:
+        vectorstore: A ``FAISS`` vector store (or a raw FAISS index)
+        ef_search: HNSW candidate list size; ignored for other index types
+        nprobe: IVF clusters scanned per query; ignored for other index types
+    """
+    import faiss
+
+    index = getattr(vectorstore, "index", vectorstore)
+    if ef_search is not None and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    if nprobe is not None:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = nprobe
+
+
+def save_vectorstore(vectorstore, path: str) -> None:
+    """
+    Persist a vector store and its ANN parameters.
+
+    Args:
+        vectorstore: A ``FAISS`` vector store from ``build_vectorstore``
+        path: Directory to write to
+    """
+    vectorstore.save_local(path)
+    params = getattr(vectorstore, "ann_params", {"index_type": "flat"})
+    (Path(path) / CONFIG_FILE).write_text(json.dumps(params, indent=2))
+
+
+def load_vectorstore(
+    path: str,
+    embed_model,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+):
+    """
+    Reload a vector store written by ``save_vectorstore`` without re-embedding.
+
+    Args:
+        path: Directory passed to ``save_vectorstore``
+        embed_model: The same embedding model used to build the store (used for queries)
+        ef_search: Optional HNSW query-time override
+        nprobe: Optional IVF query-time override
+
+    Returns:
+        The ``FAISS`` vector store
+    """
+    from langchain_community.vectorstores import FAISS
+
+    # The pickle holds the docstore we wrote ourselves
+    vectorstore = FAISS.load_local(path, embed_model, allow_dangerous_deserialization=True)
+    config_file = Path(path) / CONFIG_FILE
+    vectorstore.ann_params = json.loads(config_file.read_text()) if config_file.exists() else {"index_type": "flat"}
+    set_search_params(vectorstore, ef_search=ef_search, nprobe=nprobe)
+    return vectorstore
+
+
+def sweep_ann(
+    dataset: Dict,
+    embed_model,
+    ef_search_values: Sequence[int] = (8, 16, 32, 64, 128, 256),
+    nprobe_values: Sequence[int] = (1, 2, 4, 8, 16, 32),
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    nlist: Optional[int] = None,
+    top_k: int = 5,
+    batch_size: int = 64,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Sweep recall vs latency for HNSW and IVF against the flat baseline.
+
+    Queries are embedded once up front and searched one at a time, so the
+    latency column is the index alone.  "recall_vs_flat" is the overlap with the
+    exact flat top-k; "hit_rate" uses the dataset's relevant contexts.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        embed_model: A LangChain ``Embeddings`` object
+        ef_search_values: HNSW ``efSearch`` settings to try
+        nprobe_values: IVF ``nprobe`` settings to try
+        hnsw_m: Neighbors per HNSW graph node
+        ef_construction: HNSW candidate list size while building
+        nlist: Number of IVF clusters (default: about 4 * sqrt(n_docs))
+        top_k: Number of documents retrieved per question
+        batch_size: Number of texts per embedding call
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries, one per (index type, knob) setting
+    """
+    question_ids = list(dataset["questions"].keys())
+    doc_ids = list(dataset["corpus"].keys())
+    doc_vectors = embed_texts(embed_model, list(dataset["corpus"].values()), batch_size)
+    query_vectors = embed_texts(embed_model, list(dataset["questions"].values()), batch_size)
+    relevant_contexts = dataset["relevant_contexts"]
+    k = min(top_k, len(doc_ids))
+    nlist = nlist or _default_nlist(len(doc_vectors))
+    params = {"hnsw_m": hnsw_m, "ef_construction": ef_construction, "nlist": nlist}
+
+    def make(index_type):
+        index = _make_index(doc_vectors, {**params, "index_type": index_type})
+        index.add(doc_vectors)
+        return index
+
+    def run(index, index_type, knob, value):
+        start = time.perf_counter()
+        top = np.vstack([index.search(q[None], k)[1] for q in query_vectors])
+        seconds = time.perf_counter() - start
+        metrics = retrieval_metrics(top, question_ids, doc_ids, relevant_contexts)
+        metrics.pop("is_hit")
+        return {"index": index_type, "knob": knob, "value": value, "top": top,
+                "ms_per_query": 1000 * seconds / max(len(query_vectors), 1), **metrics}
+
+    rows = [run(make("flat"), "flat", "-", "-")]
+
+    hnsw = make("hnsw")
+    for ef in ef_search_values:
+        set_search_params(hnsw, ef_search=ef)
+        rows.append(run(hnsw, "hnsw", "efSearch", ef))
+
+    ivf = make("ivf")
+    for nprobe in nprobe_values:
+        if nprobe > nlist:
+            break
+        set_search_params(ivf, nprobe=nprobe)
+        rows.append(run(ivf, "ivf", "nprobe", nprobe))
+
+    exact = rows[0]["top"]
+    for r in rows:
+        top = r.pop("top")
+        r["recall_vs_flat"] = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(top, exact)]))
+
+    if verbose:
+        print(f"{len(doc_ids)} documents, {len(question_ids)} queries, k={k}, IVF nlist={nlist}")
+        print(f"{'Index':<6} {'Knob':<9} {'Value':>6} {'ms/query':>9} {'Recall vs flat':>15} {'Hit rate':>9} {'MRR':>7}")
+        print("-" * 67)
+        for r in rows:
+            print(
+                f"{r['index']:<6} {r['knob']:<9} {r['value']:>6} {r['ms_per_query']:>9.3f} "
+                f"{r['recall_vs_flat']:>15.3f} {r['hit_rate']:>9.3f} {r['mrr']:>7.3f}"
+            )
+    return rows
+
+
+def _default_nlist(n_docs: int) -> int:
+    # FAISS wants roughly 39+ training points per cluster
+    return max(1, min(int(4 * math.sqrt(n_docs)), n_docs // 39))
+
+
+def _make_index(vectors: np.ndarray, params: Dict):
+    import faiss
+
+    index_type = params["index_type"]
+    dim = vectors.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, params["nlist"])
+        index.train(vectors)
+    else:
+        raise ValueError(f"Invalid index type: {index_type}. Choose from {INDEX_TYPES}")
+    # Vectors are added by the caller (LangChain adds them through add_embeddings)
+    return index
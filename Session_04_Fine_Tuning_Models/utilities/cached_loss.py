@@ -0,0 +1,175 @@
+"""
+Large effective batches for ``MultipleNegativesRankingLoss`` with cached gradients.
+
+Every other example in a batch is a negative for ``MultipleNegativesRankingLoss``,
+so bigger batches train better embeddings, but activation memory grows with the
+batch and ``BATCH_SIZE = 64`` runs out of memory on CPU training boxes.  The
+GradCache technique (Gao et al., 2021) splits the step into three passes:
+
+1. Embed the batch in mini-chunks with gradients disabled.
+2. Compute the contrastive loss over the full batch of embeddings and keep the
+   gradient with respect to each embedding.
+3. Re-embed each mini-chunk with gradients enabled and backpropagate the cached
+   embedding gradients through it, one chunk at a time.
+
+Peak activation memory is set by ``mini_batch_size``, not the batch size, and
+the loss is the same as full-batch training.  sentence-transformers ships this
+as ``CachedMultipleNegativesRankingLoss``, and ``MatryoshkaLoss`` wraps it
+(reusing the cached embeddings for every truncated dimension), so
+``make_train_loss`` only has to choose between the two.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .dataset_io import _peak_rss_mb, _reset_peak_rss
+
+MATRYOSHKA_DIMS = (768, 512, 256, 128, 64)
+
+
+def make_train_loss(
+    model,
+    matryoshka_dims: Sequence[int] = MATRYOSHKA_DIMS,
+    mini_batch_size: Optional[int] = None,
+):
+    """
+    Build the notebook's ``MatryoshkaLoss(MultipleNegativesRankingLoss)`` objective.
+
+    Args:
+        model: The ``SentenceTransformer`` being fine-tuned
+        matryoshka_dims: Embedding sizes trained by ``MatryoshkaLoss``
+        mini_batch_size: Chunk size for cached-gradient training; ``None`` uses
+            the plain loss, where the whole batch is embedded with gradients
+
+    Returns:
+        A ``MatryoshkaLoss`` to pass to ``model.fit``
+
+    Example:
+        >>> BATCH_SIZE = 128
+        >>> train_loss = make_train_loss(model, matryoshka_dimensions, mini_batch_size=8)
+    """
+    from sentence_transformers.losses import (
+        CachedMultipleNegativesRankingLoss,
+        MatryoshkaLoss,
+        MultipleNegativesRankingLoss,
+    )
+
+    if mini_batch_size:
+        inner_loss = CachedMultipleNegativesRankingLoss(model, mini_batch_size=mini_batch_size)
+    else:
+        inner_loss = MultipleNegativesRankingLoss(model)
+    return MatryoshkaLoss(model, inner_loss, matryoshka_dims=list(matryoshka_dims))
+
+
+def benchmark_cached_loss(
+    model_name_or_path: str,
+    pairs: Sequence[Tuple[str, str]],
+    batch_sizes: Sequence[int] = (10, 32, 64, 128),
+    mini_batch_size: int = 8,
+    matryoshka_dims: Sequence[int] = MATRYOSHKA_DIMS,
+    steps: int = 3,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Report peak memory and examples/s of plain vs cached-gradient training.
+
+    Each (mode, batch size) runs ``steps`` optimizer steps, after one warm-up
+    step, in a fresh process, so peak RSS (or peak CUDA memory on a GPU) belongs
+    to that configuration alone.  A configuration that runs out of memory is
+    reported as such instead of stopping the sweep.
+
+    Args:
+        model_name_or_path: Model to fine-tune, e.g. "Snowflake/snowflake-arctic-embed-l"
+        pairs: (question, positive context) pairs, at least ``max(batch_sizes) * (steps + 1)``
+        batch_sizes: Batch sizes to try
+        mini_batch_size: Chunk size for the cached-gradient mode
+        matryoshka_dims: Embedding sizes trained by ``MatryoshkaLoss``
+        steps: Timed optimizer steps per configuration
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "mode", "batch_size", "peak_memory_mb",
+        "examples_per_second" and "error"
+
+    Example:
+        >>> pairs = [(e.texts[0], e.texts[1]) for e in examples]
+        >>> benchmark_cached_loss("Snowflake/snowflake-arctic-embed-l", pairs, batch_sizes=(10, 64))
+    """
+    pairs = [tuple(p) for p in pairs]
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for batch_size in batch_sizes:
+        for mode, chunk in (("standard", None), (f"cached ({mini_batch_size})", mini_batch_size)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                future = pool.submit(
+                    _train_steps, model_name_or_path, pairs, batch_size, chunk, list(matryoshka_dims), steps
+                )
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # The kernel's OOM killer ends the process instead of raising
+                    result = {"peak_memory_mb": None, "examples_per_second": None, "error": "out of memory (killed)"}
+            rows.append({"mode": mode, "batch_size": batch_size, **result})
+
+    if verbose:
+        print(f"{'Mode':<14} {'Batch':>6} {'Peak MB':>9} {'Examples/s':>11}")
+        print("-" * 43)
+        for r in rows:
+            if r["error"]:
+                print(f"{r['mode']:<14} {r['batch_size']:>6} {'':>9} {'':>11}  ⚠️ {r['error']}")
+            else:
+                print(
+                    f"{r['mode']:<14} {r['batch_size']:>6} {r['peak_memory_mb']:>9.0f} "
+                    f"{r['examples_per_second']:>11.1f}"
+                )
+    return rows
+
+
+def _train_steps(
+    model_name_or_path: str,
+    pairs: List[Tuple[str, str]],
+    batch_size: int,
+    mini_batch_size: Optional[int],
+    matryoshka_dims: List[int],
+    steps: int,
+) -> Dict:
+    # Runs in a fresh process; see benchmark_cached_loss
+    import torch
+    from sentence_transformers import InputExample, SentenceTransformer
+    from sentence_transformers.util import batch_to_device
+    from torch.utils.data import DataLoader
+
+    model = SentenceTransformer(model_name_or_path)
+    loss = make_train_loss(model, matryoshka_dims, mini_batch_size)
+    examples = [InputExample(texts=list(p)) for p in pairs[: batch_size * (steps + 1)]]
+    if len(examples) < batch_size * (steps + 1):
+        return {"peak_memory_mb": None, "examples_per_second": None, "error": "not enough pairs"}
+    loader = DataLoader(examples, batch_size=batch_size, collate_fn=model.smart_batching_collate, drop_last=True)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=2e-5)
+    cuda = model.device.type == "cuda"
+
+    _reset_peak_rss()
+    model.train()
+    try:
+        for step, (features, labels) in enumerate(loader):
+            if step == 1:
+                if cuda:
+                    torch.cuda.synchronize()
+                start = time.perf_counter()
+            features = [batch_to_device(f, model.device) for f in features]
+            loss(features, labels.to(model.device)).backward()
+            optimizer.step()
+            optimizer.zero_grad()
+        if cuda:
+            torch.cuda.synchronize()
+        seconds = time.perf_counter() - start
+    except (RuntimeError, MemoryError) as e:
+        if "out of memory" not in str(e).lower() and not isinstance(e, MemoryError):
+            raise
+        return {"peak_memory_mb": None, "examples_per_second": None, "error": "out of memory"}
+
+    peak = torch.cuda.max_memory_allocated() / 1e6 if cuda else _peak_rss_mb()
+    return {"peak_memory_mb": peak, "examples_per_second": batch_size * steps / seconds, "error": None}
@@ -0,0 +1,508 @@
+"""
+Streaming, appendable storage for question/context training sets.
+
+The notebook saves each split as one ``json.dump`` of a dictionary, so reading
+it means parsing the whole file into memory, and it cannot be appended to or
+sharded.  Here a dataset is a directory of record shards:
+
+    my_dataset/
+        meta.json                 format and record counts
+        questions-00000.<ext>     {"id", "question", "context_ids"} per record
+        corpus-00000.<ext>        {"id", "text"} per record
+
+Three formats share that layout:
+
+- "jsonl":   one JSON object per line; streamed line by line
+- "arrow":   uncompressed Arrow IPC files; memory-mapped, so opening a dataset
+             costs almost nothing and text is paged in only when read
+- "parquet": compressed columnar files; streamed one record batch at a time
+
+``DatasetWriter`` writes records (replacing an existing dataset, or adding new
+shards to it with ``mode="append"``),
+``iter_examples`` streams ``InputExample`` objects, and ``PairDataset`` is a
+map-style dataset that can be passed straight to a ``DataLoader``.
+"""
+
+import gc
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+FORMATS = ("jsonl", "arrow", "parquet")
+WRITE_MODES = ("overwrite", "append")
+META_FILE = "meta.json"
+_KINDS = ("questions", "corpus")
+
+
+class DatasetWriter:
+    """
+    Write questions and corpus documents to a sharded dataset directory.
+
+    An existing dataset in the directory is replaced, unless the writer is
+    opened with ``mode="append"``: then new shards are added and the format
+    must match.
+
+    Example:
+        >>> with DatasetWriter("datasets/train", format="arrow") as writer:
+        ...     for doc in training_split_documents:
+        ...         writer.add_document(doc.metadata["id"], doc.page_content)
+        ...     for question_id, question in training_questions.items():
+        ...         writer.add_question(question_id, question, training_relevant_contexts[question_id])
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: str = "jsonl",
+        shard_size: int = 100_000,
+        batch_size: int = 10_000,
+        mode: str = "overwrite",
+    ):
+        """
+        Args:
+            path: Dataset directory (created if missing)
+            format: "jsonl", "arrow" or "parquet"
+            shard_size: Records per shard file
+            batch_size: Records buffered per Arrow record batch / Parquet row group
+            mode: "overwrite" replaces an existing dataset; "append" adds to it
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Invalid format: {format}. Choose from {FORMATS}")
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Invalid mode: {mode}. Choose from {WRITE_MODES}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        if mode == "overwrite":
+            _remove_dataset(self.path)
+        self.format = format
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+
+        self.meta = _read_meta(self.path) or {"format": format, "questions": 0, "corpus": 0, "shards": {k: 0 for k in _KINDS}}
+        if self.meta["format"] != format:
+            raise ValueError(f"{path} holds a {self.meta['format']} dataset, not {format}")
+        self._shards = {kind: _Shard(self, kind) for kind in _KINDS}
+
+    def add_document(self, doc_id: str, text: str) -> None:
+        """Append one corpus document."""
+        self._shards["corpus"].add({"id": str(doc_id), "text": text})
+
+    def add_question(self, question_id: str, question: str, context_ids: Sequence[str]) -> None:
+        """Append one question with the IDs of its relevant contexts."""
+        self._shards["questions"].add(
+            {"id": str(question_id), "question": question, "context_ids": [str(c) for c in context_ids]}
+        )
+
+    def close(self) -> None:
+        """Flush buffered records and write ``meta.json``."""
+        for shard in self._shards.values():
+            shard.close()
+        tmp = self.path / (META_FILE + ".tmp")
+        tmp.write_text(json.dumps(self.meta, indent=2))
+        tmp.replace(self.path / META_FILE)
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _Shard:
+    """Writes one record kind, rotating to a new file every ``shard_size`` records."""
+
+    def __init__(self, writer: DatasetWriter, kind: str):
+        self.writer = writer
+        self.kind = kind
+        self.buffer: List[Dict] = []
+        self.file = None
+        self.count = 0
+
+    def add(self, record: Dict) -> None:
+        if self.file is None or self.count >= self.writer.shard_size:
+            self._rotate()
+        self.count += 1
+        self.writer.meta[self.kind] += 1
+        if self.writer.format == "jsonl":
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.writer.batch_size:
+                self._flush()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self._flush()
+            self.file.close()
+            self.file = None
+
+    def _rotate(self) -> None:
+        self.close()
+        meta = self.writer.meta
+        number = meta["shards"][self.kind]
+        meta["shards"][self.kind] += 1
+        path = self.writer.path / f"{self.kind}-{number:05d}.{self.writer.format}"
+        if self.writer.format == "jsonl":
+            self.file = open(path, "w", encoding="utf-8")
+        elif self.writer.format == "arrow":
+            import pyarrow as pa
+
+            self.file = pa.ipc.new_file(str(path), _schema(self.kind))
+        else:
+            import pyarrow.parquet as pq
+
+            self.file = pq.ParquetWriter(str(path), _schema(self.kind), compression="zstd")
+        self.count = 0
+
+    def _flush(self) -> None:
+        if not self.buffer or self.writer.format == "jsonl":
+            return
+        import pyarrow as pa
+
+        self.file.write_batch(pa.RecordBatch.from_pylist(self.buffer, schema=_schema(self.kind)))
+        self.buffer = []
+
+
+def write_dataset(
+    dataset: Dict,
+    path: str,
+    format: str = "jsonl",
+    shard_size: int = 100_000,
+    mode: str = "overwrite",
+) -> None:
+    """
+    Write a dataset in the notebook's dictionary format to a dataset directory.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        path: Dataset directory
+        format: "jsonl", "arrow" or "parquet"
+        shard_size: Records per shard file
+        mode: "overwrite" (default) replaces an existing dataset, so rerunning
+              a cell does not duplicate records; "append" adds to it
+
+    Example:
+        >>> write_dataset(train_dataset, "datasets/train", format="arrow")
+    """
+    with DatasetWriter(path, format, shard_size, mode=mode) as writer:
+        for doc_id, text in dataset["corpus"].items():
+            writer.add_document(doc_id, text)
+        for question_id, question in dataset["questions"].items():
+            writer.add_question(question_id, question, dataset["relevant_contexts"][question_id])
+
+
+def convert_dataset(json_path: str, path: str, format: str = "jsonl", shard_size: int = 100_000) -> None:
+    """
+    Convert a single-object file such as ``training_dataset.jsonl`` from the notebook.
+
+    Args:
+        json_path: File written with ``json.dump(train_dataset, f)``
+        path: Dataset directory to write
+        format: "jsonl", "arrow" or "parquet"
+        shard_size: Records per shard file
+    """
+    with open(json_path) as f:
+        write_dataset(json.load(f), path, format, shard_size)
+
+
+def iter_records(path: str, kind: str = "questions", batch_size: int = 10_000) -> Iterator[List[Dict]]:
+    """
+    Stream the records of one kind in batches, shard by shard.
+
+    Args:
+        path: Dataset directory
+        kind: "questions" or "corpus"
+        batch_size: Records per yielded batch
+
+    Yields:
+        Lists of record dictionaries
+    """
+    meta = _require_meta(path)
+    for shard in _shard_paths(path, meta, kind):
+        if meta["format"] == "jsonl":
+            batch = []
+            with open(shard, encoding="utf-8") as f:
+                for line in f:
+                    batch.append(json.loads(line))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+            if batch:
+                yield batch
+        elif meta["format"] == "arrow":
+            for record_batch in _open_arrow(shard).to_batches(max_chunksize=batch_size):
+                yield record_batch.to_pylist()
+        else:
+            import pyarrow.parquet as pq
+
+            for record_batch in pq.ParquetFile(str(shard)).iter_batches(batch_size=batch_size):
+                yield record_batch.to_pylist()
+
+
+def read_dataset(path: str) -> Dict:
+    """
+    Load a dataset directory into the notebook's dictionary format.
+
+    Use this for ``evaluate_retrieval`` and the other helpers that take the
+    dictionary; training should stream with ``iter_examples`` or ``PairDataset``.
+
+    Returns:
+        Dictionary with "questions", "relevant_contexts" and "corpus"
+    """
+    dataset = {"questions": {}, "relevant_contexts": {}, "corpus": {}}
+    for batch in iter_records(path, "corpus"):
+        dataset["corpus"].update((r["id"], r["text"]) for r in batch)
+    for batch in iter_records(path, "questions"):
+        for r in batch:
+            dataset["questions"][r["id"]] = r["question"]
+            dataset["relevant_contexts"][r["id"]] = r["context_ids"]
+    return dataset
+
+
+def iter_examples(path: str, batch_size: int = 10_000):
+    """
+    Stream ``InputExample(texts=[question, positive_context])`` pairs.
+
+    Only the corpus lookup is held in memory (memory-mapped for "arrow");
+    questions are read one batch at a time.  The first relevant context is the
+    positive, as in the notebook.
+
+    Args:
+        path: Dataset directory
+        batch_size: Question records read per batch
+
+    Yields:
+        ``sentence_transformers.InputExample`` objects
+    """
+    from sentence_transformers import InputExample
+
+    corpus = _CorpusLookup(path)
+    for batch in iter_records(path, "questions", batch_size):
+        for r in batch:
+            yield InputExample(texts=[r["question"], corpus[r["context_ids"][0]]])
+
+
+class PairDataset:
+    """
+    Map-style (question, positive context) dataset for ``torch.utils.data.DataLoader``.
+
+    With the "arrow" format both tables are memory-mapped, so construction is
+    near-instant and examples are decoded on access.  Other formats are read
+    into Arrow tables once.
+
+    Example:
+        >>> train_examples = PairDataset("datasets/train")
+        >>> loader = DataLoader(train_examples, batch_size=BATCH_SIZE, shuffle=True)
+    """
+
+    def __init__(self, path: str):
+        self.questions = _load_table(path, "questions")
+        self.corpus = _CorpusLookup(path)
+
+    def __len__(self) -> int:
+        return self.questions.num_rows
+
+    def __getitem__(self, i: int):
+        from sentence_transformers import InputExample
+
+        question = self.questions.column("question")[i].as_py()
+        context_id = self.questions.column("context_ids")[i][0].as_py()
+        return InputExample(texts=[question, self.corpus[context_id]])
+
+
+class _CorpusLookup:
+    """Corpus ID -> text; for "arrow" only the ID index lives on the heap."""
+
+    def __init__(self, path: str):
+        self.table = _load_table(path, "corpus")
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.table.column("id").to_pylist())}
+        self.text = self.table.column("text")
+
+    def __getitem__(self, doc_id: str) -> str:
+        return self.text[self.rows[doc_id]].as_py()
+
+
+def benchmark_dataset_io(
+    path: str = "benchmark_datasets",
+    n_pairs: int = 1_000_000,
+    n_docs: int = 100_000,
+    formats: Sequence[str] = FORMATS,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Compare load time and peak RSS of the notebook's single JSON file with
+    each streaming format on a synthetic dataset.
+
+    Every measurement runs in a fresh process.  "ready_seconds" is the time
+    until examples can be handed to a ``DataLoader``; "pass_seconds" is one
+    full pass over all (question, context) pairs.
+
+    Args:
+        path: Scratch directory for the synthetic datasets, one subdirectory per size
+        n_pairs: Number of question/context pairs
+        n_docs: Number of corpus documents
+        formats: Streaming formats to compare
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "format", "disk_mb", "ready_seconds",
+        "pass_seconds" and "peak_rss_mb"
+    """
+    # One directory per size, so a rerun with other sizes never measures stale files
+    root = Path(path) / f"{n_pairs}_pairs_{n_docs}_docs"
+    root.mkdir(parents=True, exist_ok=True)
+    legacy = root / "legacy_dataset.jsonl"
+    missing = [format for format in formats if not (root / format / META_FILE).exists()]
+    if missing or not legacy.exists():
+        dataset = _synthetic_dataset(n_pairs, n_docs)
+        if not legacy.exists():
+            with open(legacy, "w") as f:
+                json.dump(dataset, f)
+        for format in missing:
+            write_dataset(dataset, root / format, format)
+        del dataset
+        gc.collect()
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for format in ("legacy json", *formats):
+        target = legacy if format == "legacy json" else root / format
+        with context.Pool(1) as pool:
+            ready, full, peak_rss = pool.apply(_measure_load, (str(target), format))
+        disk = target.stat().st_size if target.is_file() else sum(f.stat().st_size for f in target.iterdir())
+        rows.append({"format": format, "disk_mb": disk / 1e6, "ready_seconds": ready,
+                     "pass_seconds": full, "peak_rss_mb": peak_rss})
+
+    if verbose:
+        print(f"{n_pairs} pairs, {n_docs} corpus documents")
+        print(f"{'Format':<12} {'Disk MB':>8} {'Ready s':>8} {'Pass s':>8} {'Peak RSS MB':>12}")
+        print("-" * 52)
+        for r in rows:
+            print(
+                f"{r['format']:<12} {r['disk_mb']:>8.0f} {r['ready_seconds']:>8.2f} "
+                f"{r['pass_seconds']:>8.2f} {r['peak_rss_mb']:>12.0f}"
+            )
+    return rows
+
+
+def _measure_load(path: str, format: str):
+    # Runs in a fresh process so peak RSS belongs to this load alone
+    _reset_peak_rss()
+    start = time.perf_counter()
+    if format == "legacy json":
+        with open(path) as f:
+            dataset = json.load(f)
+        corpus, contexts = dataset["corpus"], dataset["relevant_contexts"]
+        pairs = [(q, corpus[contexts[qid][0]]) for qid, q in dataset["questions"].items()]
+        ready = time.perf_counter() - start
+    elif format == "arrow":
+        pairs = PairDataset(path)
+        ready = time.perf_counter() - start
+        for batch in pairs.questions.to_batches():
+            for question, context_ids in zip(batch.column("question").to_pylist(), batch.column("context_ids").to_pylist()):
+                pairs.corpus[context_ids[0]]
+    else:
+        corpus = _CorpusLookup(path)
+        ready = time.perf_counter() - start
+        for batch in iter_records(path):
+            for r in batch:
+                corpus[r["context_ids"][0]]
+    full = time.perf_counter() - start
+    return ready, full, _peak_rss_mb()
+
+
+def _reset_peak_rss() -> None:
+    # Linux carries the parent's RSS high-water mark across exec
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1e3
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def _synthetic_dataset(n_pairs: int, n_docs: int) -> Dict:
+    import random
+    import uuid
+
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(5_000)]
+    doc_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(n_docs)]
+    corpus = {doc_id: " ".join(rng.choices(words, k=120)) for doc_id in doc_ids}
+    questions, relevant = {}, {}
+    for _ in range(n_pairs):
+        question_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        questions[question_id] = "What does the context say about " + " ".join(rng.choices(words, k=10)) + "?"
+        relevant[question_id] = [rng.choice(doc_ids)]
+    return {"questions": questions, "relevant_contexts": relevant, "corpus": corpus}
+
+
+def _schema(kind: str):
+    import pyarrow as pa
+
+    if kind == "corpus":
+        return pa.schema([("id", pa.string()), ("text", pa.large_string())])
+    return pa.schema([("id", pa.string()), ("question", pa.string()), ("context_ids", pa.list_(pa.string()))])
+
+
+def _read_meta(path: Path) -> Optional[Dict]:
+    meta_file = Path(path) / META_FILE
+    return json.loads(meta_file.read_text()) if meta_file.exists() else None
+
+
+def _remove_dataset(path: Path) -> None:
+    """Delete the meta file and shards of a dataset directory, leaving other files alone."""
+    meta = _read_meta(path)
+    if meta is None:
+        return
+    for kind in _KINDS:
+        for shard in _shard_paths(str(path), meta, kind):
+            shard.unlink(missing_ok=True)
+    (path / META_FILE).unlink()
+
+
+def _require_meta(path: str) -> Dict:
+    meta = _read_meta(Path(path))
+    if meta is None:
+        raise FileNotFoundError(f"No {META_FILE} in {path}; write it with DatasetWriter or write_dataset")
+    return meta
+
+
+def _shard_paths(path: str, meta: Dict, kind: str) -> List[Path]:
+    return [Path(path) / f"{kind}-{i:05d}.{meta['format']}" for i in range(meta["shards"][kind])]
+
+
+def _open_arrow(shard: Path):
+    import pyarrow as pa
+
+    return pa.ipc.open_file(pa.memory_map(str(shard), "r")).read_all()
+
+
+def _load_table(path: str, kind: str):
+    """Concatenate a kind's shards into one Arrow table (memory-mapped for "arrow")."""
+    import pyarrow as pa
+
+    meta = _require_meta(path)
+    shards = _shard_paths(path, meta, kind)
+    if meta["format"] == "arrow":
+        tables = [_open_arrow(shard) for shard in shards]
+    elif meta["format"] == "parquet":
+        import pyarrow.parquet as pq
+
+        tables = [pq.read_table(str(shard), memory_map=True) for shard in shards]
+    else:
+        tables = [pa.Table.from_pylist(r, schema=_schema(kind)) for r in iter_records(path, kind)]
+    return pa.concat_tables(tables) if tables else _schema(kind).empty_table()
@@ -0,0 +1,239 @@
+"""
+Near-duplicate chunk elimination with MinHash and LSH banding.
+
+Blog posts repeat navigation, footers and quoted passages, so after splitting
+many chunks are (nearly) the same text.  Each of them costs an embedding call,
+an index slot, and a top-k position at query time.  ``deduplicate_chunks`` runs
+between splitting and embedding:
+
+1. Each chunk is turned into a set of word shingles and a MinHash signature.
+2. Signatures are cut into bands; chunks sharing any band land in the same LSH
+   bucket, so only bucket-mates are compared (no all-pairs scan).
+3. Candidates whose estimated Jaccard similarity reaches ``threshold`` are
+   merged with union-find, and the first chunk of each cluster is kept.
+
+The returned provenance map records which chunk IDs each kept chunk stands for.
+"""
+
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .retrieval_eval import embed_texts
+
+# Smallest prime above 2**32; (a * x + b) fits in uint64 for 32-bit a and x
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(2**32 - 1)
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, shingle_size: int = 5) -> np.ndarray:
+    """
+    Hash the word ``shingle_size``-grams of a text to 32-bit integers.
+
+    Args:
+        text: Chunk text
+        shingle_size: Words per shingle
+
+    Returns:
+        Array of unique uint64 shingle hashes
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < shingle_size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+def minhash_signatures(
+    texts: Sequence[str],
+    num_perm: int = 128,
+    shingle_size: int = 5,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    MinHash signatures using ``num_perm`` universal hash functions.
+
+    Args:
+        texts: Chunk texts
+        num_perm: Signature length (more is more accurate and slower)
+        shingle_size: Words per shingle
+        seed: Seed for the hash function parameters
+
+    Returns:
+        Array of shape (n_texts, num_perm) of uint64 values
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        hashes = shingles(text, shingle_size)
+        signatures[i] = (((hashes[:, None] * a + b) % _PRIME) & _MAX_HASH).min(axis=0)
+    return signatures
+
+
+def lsh_clusters(signatures: np.ndarray, threshold: float = 0.8, bands: Optional[int] = None) -> np.ndarray:
+    """
+    Group near-duplicate signatures with LSH banding and union-find.
+
+    Args:
+        signatures: Output of ``minhash_signatures``
+        threshold: Minimum estimated Jaccard similarity to merge two chunks
+        bands: Number of LSH bands (default: the fewest that find pairs at
+            ``threshold`` with 90% probability)
+
+    Returns:
+        Array mapping each row to the row index of its cluster representative
+        (the earliest row in the cluster)
+    """
+    n, num_perm = signatures.shape
+    bands = bands or _optimal_bands(num_perm, threshold)
+    rows = num_perm // bands
+    parent = np.arange(n)
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets: Dict[bytes, int] = {}
+        band_rows = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i in range(n):
+            key = band_rows[i].tobytes()
+            first = buckets.setdefault(key, i)
+            if first == i:
+                continue
+            root_i, root_first = find(i), find(first)
+            if root_i == root_first:
+                continue
+            # Bucket-mates are only candidates; confirm with the full signature
+            if np.mean(signatures[i] == signatures[first]) >= threshold:
+                parent[max(root_i, root_first)] = min(root_i, root_first)
+
+    return np.array([find(i) for i in range(n)])
+
+
+def deduplicate_chunks(
+    chunks,
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    bands: Optional[int] = None,
+    shingle_size: int = 5,
+    verbose: bool = True,
+) -> Tuple[List, Dict[str, List[str]]]:
+    """
+    Drop near-duplicate chunks, keeping one representative per cluster.
+
+    Args:
+        chunks: LangChain documents (``metadata["id"]`` is used when present)
+        threshold: Minimum estimated Jaccard similarity of word shingles
+        num_perm: MinHash signature length
+        bands: Number of LSH bands (default: derived from ``threshold``)
+        shingle_size: Words per shingle
+        verbose: Whether to print the reduction
+
+    Returns:
+        tuple: (kept_chunks, provenance)
+            - kept_chunks: Representatives, in their original order
+            - provenance: representative ID -> IDs of the chunks it replaced
+
+    Example:
+        >>> training_documents, provenance = deduplicate_chunks(training_documents, threshold=0.8)
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return [], {}
+    start = time.perf_counter()
+    signatures = minhash_signatures([c.page_content for c in chunks], num_perm, shingle_size)
+    representatives = lsh_clusters(signatures, threshold, bands)
+
+    ids = [str(c.metadata.get("id", i)) for i, c in enumerate(chunks)]
+    kept = [c for i, c in enumerate(chunks) if representatives[i] == i]
+    provenance: Dict[str, List[str]] = {}
+    for i, rep in enumerate(representatives):
+        if rep != i:
+            provenance.setdefault(ids[rep], []).append(ids[i])
+
+    if verbose:
+        removed = len(chunks) - len(kept)
+        print(
+            f"✓ {len(chunks)} -> {len(kept)} chunks ({removed} near-duplicates, "
+            f"{100 * removed / len(chunks):.1f}% fewer) in {time.perf_counter() - start:.2f}s"
+        )
+    return kept, provenance
+
+
+def benchmark_dedup(
+    chunks,
+    embed_model,
+    thresholds: Sequence[float] = (0.9, 0.8, 0.7),
+    num_perm: int = 128,
+    batch_size: int = 64,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Report chunk reduction and embedding time saved at several thresholds.
+
+    All chunks are embedded once to measure the per-chunk embedding cost; the
+    time saved is that cost times the number of chunks removed.
+
+    Args:
+        chunks: LangChain documents after splitting
+        embed_model: A LangChain ``Embeddings`` object
+        thresholds: Similarity thresholds to try
+        num_perm: MinHash signature length
+        batch_size: Number of texts per embedding call
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "threshold", "chunks", "kept", "reduction",
+        "dedup_seconds" and "embed_seconds_saved"
+    """
+    chunks = list(chunks)
+    start = time.perf_counter()
+    embed_texts(embed_model, [c.page_content for c in chunks], batch_size)
+    per_chunk = (time.perf_counter() - start) / max(len(chunks), 1)
+
+    rows = []
+    for threshold in thresholds:
+        start = time.perf_counter()
+        kept, _ = deduplicate_chunks(chunks, threshold, num_perm, verbose=False)
+        dedup_seconds = time.perf_counter() - start
+        removed = len(chunks) - len(kept)
+        rows.append({
+            "threshold": threshold,
+            "chunks": len(chunks),
+            "kept": len(kept),
+            "reduction": removed / len(chunks) if chunks else 0.0,
+            "dedup_seconds": dedup_seconds,
+            "embed_seconds_saved": removed * per_chunk,
+        })
+
+    if verbose:
+        print(f"Embedding all {len(chunks)} chunks: {per_chunk * len(chunks):.2f}s")
+        print(f"{'Threshold':>9} {'Kept':>8} {'Reduction':>10} {'Dedup s':>8} {'Embed s saved':>14}")
+        print("-" * 53)
+        for r in rows:
+            print(
+                f"{r['threshold']:>9.2f} {r['kept']:>8} {r['reduction']:>10.1%} "
+                f"{r['dedup_seconds']:>8.2f} {r['embed_seconds_saved']:>14.2f}"
+            )
+    return rows
+
+
+def _optimal_bands(num_perm: int, threshold: float, recall: float = 0.9) -> int:
+    # Fewest bands (longest, most selective bands) for which a pair exactly at
+    # ``threshold`` still shares a bucket with probability >= ``recall``.
+    # False positives are filtered by the full-signature check afterwards.
+    for bands in (b for b in range(1, num_perm + 1) if num_perm % b == 0):
+        if 1 - (1 - threshold ** (num_perm // bands)) ** bands >= recall:
+            return bands
+    return num_perm
@@ -0,0 +1,261 @@
+"""
+Disk-backed embedding cache shared across index builds and evaluations.
+
+``CachedEmbeddings`` wraps any LangChain ``Embeddings`` object.  Vectors are
+stored in a memory-mapped float32 array and looked up through a compact index of
+16-byte content hashes, so re-running ``evaluate_openai``, ``FAISS.from_documents``
+or the batched evaluator only embeds text that has not been seen before.
+
+Each cache lives in its own directory named after a fingerprint of the embedding
+model.  For local checkpoints (e.g. ``finetuned_arctic_ft``) the fingerprint
+includes the size and modification time of every file in the checkpoint, so
+re-training the model automatically starts a fresh cache.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+KEY_BYTES = 16
+INITIAL_CAPACITY = 1024
+
+
+def model_fingerprint(embed_model) -> str:
+    """
+    Build a string that identifies the exact weights behind an embedding model.
+
+    Args:
+        embed_model: A LangChain ``Embeddings`` object
+
+    Returns:
+        Identity string such as
+        "HuggingFaceEmbeddings:finetuned_arctic_ft:<checkpoint hash>"
+    """
+    name = (
+        getattr(embed_model, "model_name", None)
+        or getattr(embed_model, "model", None)
+        or ""
+    )
+    identity = f"{type(embed_model).__name__}:{name}"
+
+    dimensions = getattr(embed_model, "dimensions", None)
+    if dimensions:
+        identity += f":dim={dimensions}"
+
+    if name and os.path.isdir(name):
+        # Local checkpoint: any re-save changes the file sizes or mtimes
+        identity += f":{_directory_fingerprint(Path(name))}"
+    elif name and "/" in name:
+        revision = _hub_revision(name)
+        if revision:
+            identity += f"@{revision}"
+
+    encode_kwargs = getattr(embed_model, "encode_kwargs", None)
+    if encode_kwargs:
+        identity += f":{json.dumps(encode_kwargs, sort_keys=True, default=str)}"
+    return identity
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Caching wrapper around any LangChain ``Embeddings`` object.
+
+    Example:
+        >>> huggingface_embeddings = CachedEmbeddings(
+        ...     HuggingFaceEmbeddings(model_name="Snowflake/snowflake-arctic-embed-l")
+        ... )
+        >>> base_vectorstore = FAISS.from_documents(training_documents, huggingface_embeddings)
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache_dir: str = "embedding_cache",
+        model_identity: Optional[str] = None,
+        batch_size: int = 64,
+    ):
+        """
+        Args:
+            underlying: The embedding model to wrap
+            cache_dir: Root directory for all embedding caches (default: "embedding_cache")
+            model_identity: Override for the automatic model fingerprint
+            batch_size: Number of uncached texts sent to the model per call
+        """
+        self.underlying = underlying
+        self.batch_size = batch_size
+        self.model_identity = model_identity or model_fingerprint(underlying)
+
+        namespace = hashlib.sha256(self.model_identity.encode()).hexdigest()[:16]
+        self.cache_path = Path(cache_dir) / namespace
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self._keys_file = self.cache_path / "keys.bin"
+        self._vectors_file = self.cache_path / "vectors.f32"
+        self._meta_file = self.cache_path / "meta.json"
+
+        self.hits = 0
+        self.misses = 0
+        self._dim: Optional[int] = None
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._index: Dict[bytes, int] = {}
+        self._load()
+
+    # LangChain Embeddings interface
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        key = _text_key(text, "query")
+        row = self._index.get(key)
+        if row is not None:
+            self.hits += 1
+            return self._vectors[row].tolist()
+        self.misses += 1
+        vector = np.asarray([self.underlying.embed_query(text)], dtype=np.float32)
+        self._append([key], vector)
+        return vector[0].tolist()
+
+    # Cache API
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed documents and return a float32 array, skipping the list conversion.
+
+        Args:
+            texts: The texts to embed
+
+        Returns:
+            Array of shape (len(texts), dim)
+        """
+        keys = [_text_key(text, "document") for text in texts]
+
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self._index and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        missing_keys = list(missing.keys())
+        missing_texts = list(missing.values())
+        for start in range(0, len(missing_texts), self.batch_size):
+            batch = missing_texts[start:start + self.batch_size]
+            vectors = np.asarray(self.underlying.embed_documents(batch), dtype=np.float32)
+            self._append(missing_keys[start:start + self.batch_size], vectors)
+
+        if not texts:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        rows = np.fromiter((self._index[key] for key in keys), dtype=np.int64, count=len(keys))
+        return np.asarray(self._vectors[rows])
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def stats(self) -> Dict:
+        """Hit/miss counters for this session and the number of cached vectors."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "cached_vectors": len(self._index),
+        }
+
+    def clear(self) -> None:
+        """Delete every cached vector for this model."""
+        self._vectors = None
+        for path in (self._keys_file, self._vectors_file, self._meta_file):
+            path.unlink(missing_ok=True)
+        self._index = {}
+        self._dim = None
+        self._capacity = 0
+
+    # Storage
+
+    def _load(self) -> None:
+        if not self._meta_file.exists():
+            return
+        meta = json.loads(self._meta_file.read_text())
+        if meta.get("model_identity") != self.model_identity:
+            # Namespace collision or a hand-edited directory: start over
+            self.clear()
+            return
+
+        self._dim = meta["dim"]
+        raw_keys = self._keys_file.read_bytes() if self._keys_file.exists() else b""
+        count = len(raw_keys) // KEY_BYTES
+        self._index = {
+            raw_keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(count)
+        }
+        size = self._vectors_file.stat().st_size if self._vectors_file.exists() else 0
+        self._capacity = size // (4 * self._dim)
+        if self._capacity == 0:
+            return
+        self._vectors = np.memmap(
+            self._vectors_file, dtype=np.float32, mode="r+", shape=(self._capacity, self._dim)
+        )
+
+    def _append(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+            self._meta_file.write_text(
+                json.dumps({"model_identity": self.model_identity, "dim": self._dim})
+            )
+
+        start = len(self._index)
+        self._ensure_capacity(start + len(keys))
+        self._vectors[start:start + len(keys)] = vectors
+        self._vectors.flush()
+
+        # Keys are written after the vectors, so a crash never indexes a missing row
+        with open(self._keys_file, "ab") as f:
+            f.write(b"".join(keys))
+        for offset, key in enumerate(keys):
+            self._index[key] = start + offset
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+        capacity = max(self._capacity, INITIAL_CAPACITY)
+        while capacity < rows:
+            capacity *= 2
+
+        self._vectors = None
+        with open(self._vectors_file, "ab") as f:
+            f.truncate(capacity * self._dim * 4)
+        self._capacity = capacity
+        self._vectors = np.memmap(
+            self._vectors_file, dtype=np.float32, mode="r+", shape=(capacity, self._dim)
+        )
+
+
+def _text_key(text: str, kind: str) -> bytes:
+    return hashlib.blake2b(f"{kind}\0{text}".encode(), digest_size=KEY_BYTES).digest()
+
+
+def _directory_fingerprint(path: Path) -> str:
+    digest = hashlib.sha256()
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        stat = file.stat()
+        digest.update(f"{file.relative_to(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def _hub_revision(repo_id: str) -> Optional[str]:
+    """Commit hash of the locally cached Hugging Face snapshot, if there is one."""
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return None
+    config_path = try_to_load_from_cache(repo_id, "config.json")
+    if not isinstance(config_path, str):
+        return None
+    # .../models--org--name/snapshots/<commit>/config.json
+    return Path(config_path).parent.name
@@ -0,0 +1,218 @@
+"""
+Incremental re-indexing of a persisted FAISS vector store.
+
+The notebook rebuilds ``base_vectorstore`` and ``finetune_vectorstore`` with
+``FAISS.from_documents`` whenever a file is added under ``data/``, which
+re-embeds the whole corpus.  ``IncrementalVectorStore`` persists the vector
+store together with a manifest mapping each source file to its content hash and
+chunk IDs.  ``sync()`` compares the manifest with the directory and only parses,
+embeds and upserts chunks from added or changed files, and deletes the chunks of
+changed or removed files.  Chunk IDs come from ``ingestion.chunk_id``, so an
+edited file only re-embeds the chunks whose text actually changed.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .ann_index import _make_index, build_vectorstore, load_vectorstore, save_vectorstore
+from .ingestion import DEFAULT_PATTERNS, iter_files, stream_chunks, stream_files
+from .retrieval_eval import embed_texts
+
+MANIFEST_FILE = "manifest.json"
+
+
+class IncrementalVectorStore:
+    """
+    Persisted FAISS vector store kept in sync with a directory of source files.
+
+    Example:
+        >>> store = IncrementalVectorStore("indexes/base", "data/", huggingface_embeddings, text_splitter)
+        >>> store.sync()          # first run embeds everything
+        >>> store.sync()          # later runs only touch added/changed/deleted files
+        >>> base_retriever = store.as_retriever(search_kwargs={"k": 6})
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        data_dir: str,
+        embed_model,
+        text_splitter,
+        patterns: Sequence[str] = DEFAULT_PATTERNS,
+        index_type: str = "flat",
+        max_workers: Optional[int] = None,
+        batch_size: int = 64,
+    ):
+        """
+        Args:
+            index_path: Directory holding the vector store and manifest
+            data_dir: Directory of source files to index
+            embed_model: A LangChain ``Embeddings`` object
+            text_splitter: A LangChain text splitter
+            patterns: Glob patterns of files to index
+            index_type: "flat", "hnsw" or "ivf" for a newly created store
+            max_workers: Worker processes used to parse changed files
+            batch_size: Number of texts per embedding call
+        """
+        self.index_path = Path(index_path)
+        self.data_dir = data_dir
+        self.embed_model = embed_model
+        self.text_splitter = text_splitter
+        self.patterns = patterns
+        self.index_type = index_type
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+        self.vectorstore = None
+        self.manifest: Dict[str, Dict] = {}
+        if (self.index_path / MANIFEST_FILE).exists():
+            self.manifest = json.loads((self.index_path / MANIFEST_FILE).read_text())["files"]
+            if any(entry["chunks"] for entry in self.manifest.values()):
+                self.vectorstore = load_vectorstore(str(self.index_path), embed_model)
+
+    def as_retriever(self, **kwargs):
+        """Return a LangChain retriever over the current store."""
+        if self.vectorstore is None:
+            raise ValueError("The store is empty. Call sync() first.")
+        return self.vectorstore.as_retriever(**kwargs)
+
+    def sync(self, verbose: bool = True) -> Dict:
+        """
+        Bring the store up to date with ``data_dir``.
+
+        Files whose size and mtime match the manifest are skipped without being
+        read.  Files that were touched but whose bytes are unchanged only get
+        their manifest entry refreshed.
+
+        Args:
+            verbose: Whether to print a summary
+
+        Returns:
+            Dictionary with lists of "added", "changed", "deleted" files and the
+            counts "unchanged", "chunks_embedded", "chunks_deleted", plus "seconds"
+        """
+        start = time.perf_counter()
+        current = {str(f): f for f in iter_files(self.data_dir, self.patterns)}
+
+        added, changed, unchanged = [], [], 0
+        new_entries: Dict[str, Dict] = {}
+        for source, file in current.items():
+            stat = file.stat()
+            entry = self.manifest.get(source)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                unchanged += 1
+                continue
+            file_hash = _file_hash(file)
+            if entry and entry["file_hash"] == file_hash:
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                unchanged += 1
+                continue
+            (changed if entry else added).append(source)
+            new_entries[source] = {"file_hash": file_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        deleted = [source for source in self.manifest if source not in current]
+
+        # Chunks of added/changed files; IDs that already exist are not re-embedded
+        existing_ids = {i for source in changed for i in self.manifest[source]["chunks"]}
+        new_chunks = []
+        for chunk in stream_chunks(stream_files(added + changed, self.max_workers), self.text_splitter):
+            new_entries[chunk.metadata["source"]].setdefault("chunks", []).append(chunk.metadata["id"])
+            if chunk.metadata["id"] not in existing_ids:
+                new_chunks.append(chunk)
+
+        kept_ids = {i for source in changed for i in new_entries[source].get("chunks", [])}
+        stale_ids = [i for i in existing_ids if i not in kept_ids]
+        stale_ids += [i for source in deleted for i in self.manifest[source]["chunks"]]
+
+        if stale_ids and self.vectorstore is not None:
+            self._delete(stale_ids)
+        if new_chunks:
+            self._upsert(new_chunks)
+
+        for source in deleted:
+            del self.manifest[source]
+        for source, entry in new_entries.items():
+            entry.setdefault("chunks", [])
+            self.manifest[source] = entry
+        self._save()
+
+        summary = {
+            "added": added,
+            "changed": changed,
+            "deleted": deleted,
+            "unchanged": unchanged,
+            "chunks_embedded": len(new_chunks),
+            "chunks_deleted": len(stale_ids),
+            "seconds": time.perf_counter() - start,
+        }
+        if verbose:
+            print(
+                f"✓ Synced {self.data_dir}: {len(added)} added, {len(changed)} changed, "
+                f"{len(deleted)} deleted, {unchanged} unchanged files | "
+                f"{len(new_chunks)} chunks embedded, {len(stale_ids)} removed in {summary['seconds']:.2f}s"
+            )
+        return summary
+
+    def _upsert(self, chunks) -> None:
+        if self.vectorstore is None:
+            self.vectorstore = build_vectorstore(
+                chunks, self.embed_model, index_type=self.index_type, batch_size=self.batch_size
+            )
+            return
+        texts = [c.page_content for c in chunks]
+        vectors = embed_texts(self.embed_model, texts, self.batch_size)
+        self.vectorstore.add_embeddings(
+            list(zip(texts, vectors.tolist())),
+            metadatas=[c.metadata for c in chunks],
+            ids=[c.metadata["id"] for c in chunks],
+        )
+
+    def _delete(self, ids: List[str]) -> None:
+        vectorstore = self.vectorstore
+        index_type = getattr(vectorstore, "ann_params", {}).get("index_type", "flat")
+        if index_type == "flat":
+            # IndexFlat renumbers on removal, which is what LangChain's delete assumes
+            vectorstore.delete(ids)
+            return
+
+        # HNSW cannot remove vectors and IVF keeps the old labels, so rebuild the
+        # index from the surviving stored vectors (no re-embedding)
+        remove = set(ids)
+        old_index = vectorstore.index
+        if hasattr(old_index, "invlists"):
+            old_index.make_direct_map()
+        keep = [(i, doc_id) for i, doc_id in sorted(vectorstore.index_to_docstore_id.items()) if doc_id not in remove]
+        vectors = np.vstack([old_index.reconstruct(i) for i, _ in keep]) if keep else None
+
+        vectorstore.docstore.delete(list(remove))
+        vectorstore.index_to_docstore_id = {new: doc_id for new, (_, doc_id) in enumerate(keep)}
+        if vectors is None:
+            self.vectorstore = None
+            return
+        params = dict(vectorstore.ann_params)
+        if index_type == "ivf":
+            params["nlist"] = min(params["nlist"], len(vectors))
+        vectorstore.index = _make_index(vectors, params)
+        vectorstore.index.add(vectors)
+
+    def _save(self) -> None:
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        if self.vectorstore is not None:
+            save_vectorstore(self.vectorstore, str(self.index_path))
+        tmp = self.index_path / (MANIFEST_FILE + ".tmp")
+        tmp.write_text(json.dumps({"data_dir": str(self.data_dir), "files": self.manifest}, indent=1))
+        os.replace(tmp, self.index_path / MANIFEST_FILE)
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
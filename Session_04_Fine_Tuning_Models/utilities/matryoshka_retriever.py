@@ -0,0 +1,250 @@
+"""
+Matryoshka-tiered retrieval: coarse low-dimensional search, full-dimensional rerank.
+
+The embedding model is fine-tuned with ``MatryoshkaLoss`` over
+``matryoshka_dimensions = [768, 512, 256, 128, 64]``, so the first 64 or 128
+components of each vector are already a usable embedding.  ``MatryoshkaIndex``
+keeps those truncated, re-normalized prefixes in a small contiguous array for a
+fast first pass, then reranks the best candidates against the full vectors.
+``MatryoshkaRetriever`` wraps the index as a LangChain retriever so it can be
+dropped into the notebook's LCEL RAG chain in place of ``base_retriever``.
+"""
+
+import time
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from .retrieval_eval import _normalize, embed_texts, retrieval_metrics
+
+
+class MatryoshkaIndex:
+    """
+    Two-tier cosine-similarity index over Matryoshka embeddings.
+
+    Example:
+        >>> index = MatryoshkaIndex(doc_vectors, coarse_dim=64)
+        >>> indices, scores = index.search(query_vectors, k=5, candidates=50)
+    """
+
+    def __init__(self, full_vectors: np.ndarray, coarse_dim: int = 64):
+        """
+        Args:
+            full_vectors: Array of shape (n_docs, dim) with the model's full output
+            coarse_dim: Number of leading dimensions used for the first pass
+        """
+        if coarse_dim > full_vectors.shape[1]:
+            raise ValueError(
+                f"coarse_dim ({coarse_dim}) is larger than the embedding size ({full_vectors.shape[1]})"
+            )
+        self.coarse_dim = coarse_dim
+        self.full_vectors = _normalize(np.asarray(full_vectors, dtype=np.float32))
+        self.coarse_vectors = np.ascontiguousarray(
+            _normalize(self.full_vectors[:, :coarse_dim])
+        )
+
+    def __len__(self) -> int:
+        return len(self.full_vectors)
+
+    @property
+    def coarse_bytes(self) -> int:
+        """Memory held by the first-pass vectors."""
+        return self.coarse_vectors.nbytes
+
+    @property
+    def full_bytes(self) -> int:
+        """Memory held by the rerank vectors."""
+        return self.full_vectors.nbytes
+
+    def search(
+        self,
+        query_vectors: np.ndarray,
+        k: int = 5,
+        candidates: int = 50,
+        rerank: bool = True,
+    ):
+        """
+        Search with the truncated vectors, then rerank with the full vectors.
+
+        Args:
+            query_vectors: Array of shape (n_queries, dim) or (dim,)
+            k: Number of results per query
+            candidates: Number of first-pass candidates passed to the rerank
+            rerank: If False, return the first-pass ranking only
+
+        Returns:
+            tuple: (indices, scores), both of shape (n_queries, k)
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        k = min(k, len(self))
+        candidates = min(max(candidates, k), len(self))
+
+        coarse_queries = _normalize(queries[:, :self.coarse_dim])
+        coarse_scores = coarse_queries @ self.coarse_vectors.T
+        shortlist = np.argpartition(-coarse_scores, candidates - 1, axis=1)[:, :candidates]
+
+        if rerank:
+            # (n_queries, candidates, dim) . (n_queries, dim) -> (n_queries, candidates)
+            scores = np.einsum("qcd,qd->qc", self.full_vectors[shortlist], queries)
+        else:
+            scores = np.take_along_axis(coarse_scores, shortlist, axis=1)
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return (
+            np.take_along_axis(shortlist, np.take_along_axis(top, order, axis=1), axis=1),
+            np.take_along_axis(top_scores, order, axis=1),
+        )
+
+
+class MatryoshkaRetriever(BaseRetriever):
+    """
+    LangChain retriever backed by a ``MatryoshkaIndex``.
+
+    Example:
+        >>> finetune_retriever = MatryoshkaRetriever.from_documents(
+        ...     training_documents, finetune_embeddings, coarse_dim=64, k=6
+        ... )
+        >>> finetune_retriever.invoke("What is an agent?")
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: Any
+    documents: List[Document]
+    embed_model: Any
+    k: int = 6
+    candidates: int = 50
+
+    @classmethod
+    def from_documents(
+        cls,
+        documents: List[Document],
+        embed_model,
+        coarse_dim: int = 64,
+        k: int = 6,
+        candidates: int = 50,
+        batch_size: int = 64,
+    ) -> "MatryoshkaRetriever":
+        """
+        Embed documents and build the tiered index.
+
+        Args:
+            documents: LangChain documents to index
+            embed_model: A LangChain ``Embeddings`` object (a ``CachedEmbeddings``
+                         avoids re-embedding on reruns)
+            coarse_dim: Number of leading dimensions used for the first pass
+            k: Number of documents returned per query
+            candidates: Number of first-pass candidates reranked with full vectors
+            batch_size: Number of texts per embedding call
+
+        Returns:
+            A ready-to-use retriever
+        """
+        vectors = embed_texts(embed_model, [d.page_content for d in documents], batch_size)
+        return cls(
+            index=MatryoshkaIndex(vectors, coarse_dim=coarse_dim),
+            documents=documents,
+            embed_model=embed_model,
+            k=k,
+            candidates=candidates,
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_vector = np.asarray(self.embed_model.embed_query(query), dtype=np.float32)
+        indices, _ = self.index.search(query_vector, k=self.k, candidates=self.candidates)
+        return [self.documents[i] for i in indices[0]]
+
+
+def benchmark_matryoshka_tiers(
+    dataset: Dict,
+    embed_model,
+    coarse_dims: Sequence[int] = (64, 128),
+    candidates: int = 50,
+    top_k: int = 5,
+    batch_size: int = 64,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Compare each Matryoshka tier against the notebook's flat FAISS index.
+
+    Every tier is timed one query at a time, which is how a retriever is called
+    inside the RAG chain.  Requires ``faiss-cpu`` for the flat baseline.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        embed_model: A LangChain ``Embeddings`` object
+        coarse_dims: First-pass dimensions to benchmark (default: 64 and 128)
+        candidates: Number of first-pass candidates reranked with full vectors
+        top_k: Number of documents retrieved per question
+        batch_size: Number of texts per embedding call
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "tier", "bytes_per_vector", "index_mb",
+        "ms_per_query", "hit_rate", "mrr" and recall@k for each tier
+
+    Example:
+        >>> benchmark_matryoshka_tiers(test_dataset, finetune_embeddings, coarse_dims=(64, 128))
+    """
+    import faiss
+
+    question_ids = list(dataset["questions"].keys())
+    doc_ids = list(dataset["corpus"].keys())
+    doc_vectors = embed_texts(embed_model, list(dataset["corpus"].values()), batch_size)
+    query_vectors = embed_texts(embed_model, list(dataset["questions"].values()), batch_size)
+    relevant_contexts = dataset["relevant_contexts"]
+
+    def run_tier(name, search_one, index_bytes):
+        start = time.perf_counter()
+        top = np.vstack([search_one(q) for q in query_vectors])
+        seconds = time.perf_counter() - start
+        metrics = retrieval_metrics(top, question_ids, doc_ids, relevant_contexts)
+        metrics.pop("is_hit")
+        return {
+            "tier": name,
+            "bytes_per_vector": index_bytes / len(doc_vectors),
+            "index_mb": index_bytes / 1e6,
+            "ms_per_query": 1000 * seconds / max(len(query_vectors), 1),
+            **metrics,
+        }
+
+    flat = faiss.IndexFlatL2(doc_vectors.shape[1])
+    flat.add(doc_vectors)
+    rows = [run_tier(
+        f"flat ({doc_vectors.shape[1]}d)",
+        lambda q: flat.search(q[None], top_k)[1],
+        doc_vectors.nbytes,
+    )]
+
+    for dim in coarse_dims:
+        index = MatryoshkaIndex(doc_vectors, coarse_dim=dim)
+        rows.append(run_tier(
+            f"{dim}d only",
+            lambda q: index.search(q, k=top_k, candidates=candidates, rerank=False)[0],
+            index.coarse_bytes,
+        ))
+        rows.append(run_tier(
+            f"{dim}d + rerank@{candidates}",
+            lambda q: index.search(q, k=top_k, candidates=candidates)[0],
+            index.coarse_bytes + index.full_bytes,
+        ))
+
+    if verbose:
+        recall_key = f"recall@{min(top_k, len(doc_ids))}"
+        print(f"{'Tier':<22} {'B/vector':>9} {'Index MB':>9} {'ms/query':>9} {'Hit rate':>9} {'MRR':>7} {recall_key:>10}")
+        print("-" * 81)
+        for r in rows:
+            print(
+                f"{r['tier']:<22} {r['bytes_per_vector']:>9.0f} {r['index_mb']:>9.2f} "
+                f"{r['ms_per_query']:>9.3f} {r['hit_rate']:>9.3f} {r['mrr']:>7.3f} {r[recall_key]:>10.3f}"
+            )
+    return rows
+
@@ -0,0 +1,303 @@
+"""
+Quantized (int8 and binary) vector index with float rescoring.
+
+``FAISS.from_documents`` keeps a float32 copy of every chunk vector in RAM
+(4 bytes per dimension).  ``QuantizedIndex`` keeps only compact codes in memory:
+
+- "int8": FAISS 8-bit scalar quantizer, 1 byte per dimension, inner-product search
+- "binary": one sign bit per dimension, Hamming-distance search
+
+The candidate shortlist from the codes is then rescored against the float
+vectors, which live in a memory-mapped file on disk and are only paged in for
+the few rows that are rescored.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from .retrieval_eval import _normalize, embed_texts, retrieval_metrics
+
+QUANTIZATION_MODES = ("int8", "binary")
+
+
+class QuantizedIndex:
+    """
+    Cosine-similarity index storing int8 or binary codes in RAM and float
+    vectors on disk.
+
+    Example:
+        >>> index = QuantizedIndex.build(doc_vectors, "indexes/arctic-binary", mode="binary")
+        >>> indices, scores = index.search(query_vectors, k=5, rescore=50)
+        >>> index = QuantizedIndex.load("indexes/arctic-binary")
+    """
+
+    def __init__(self, path: str, codes_index, float_vectors: np.memmap, mode: str):
+        self.path = Path(path)
+        self.codes_index = codes_index
+        self.float_vectors = float_vectors
+        self.mode = mode
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, path: str, mode: str = "int8") -> "QuantizedIndex":
+        """
+        Quantize vectors and write the index to ``path``.
+
+        Args:
+            vectors: Array of shape (n_docs, dim)
+            path: Directory for the codes and the float vectors
+            mode: "int8" or "binary"
+
+        Returns:
+            The built index, with its float vectors memory-mapped from disk
+        """
+        import faiss
+
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Invalid mode: {mode}. Choose from {QUANTIZATION_MODES}")
+
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        n_docs, dim = vectors.shape
+
+        float_vectors = np.memmap(path / "vectors.f32", dtype=np.float32, mode="w+", shape=(n_docs, dim))
+        float_vectors[:] = vectors
+        float_vectors.flush()
+
+        if mode == "int8":
+            codes_index = faiss.IndexScalarQuantizer(
+                dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            codes_index.train(vectors)
+            codes_index.add(vectors)
+            faiss.write_index(codes_index, str(path / "codes.faiss"))
+        else:
+            codes_index = faiss.IndexBinaryFlat(_binary_dim(dim))
+            codes_index.add(_binarize(vectors))
+            faiss.write_index_binary(codes_index, str(path / "codes.faiss"))
+
+        (path / "meta.json").write_text(json.dumps({"mode": mode, "n_docs": n_docs, "dim": dim}))
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        """
+        Load an index written by ``build``.
+
+        Args:
+            path: Directory passed to ``build``
+
+        Returns:
+            The index, with its float vectors memory-mapped read-only
+        """
+        import faiss
+
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text())
+        if meta["mode"] == "int8":
+            codes_index = faiss.read_index(str(path / "codes.faiss"))
+        else:
+            codes_index = faiss.read_index_binary(str(path / "codes.faiss"))
+        float_vectors = np.memmap(
+            path / "vectors.f32", dtype=np.float32, mode="r", shape=(meta["n_docs"], meta["dim"])
+        )
+        return cls(path, codes_index, float_vectors, meta["mode"])
+
+    def __len__(self) -> int:
+        return self.float_vectors.shape[0]
+
+    @property
+    def bytes_per_vector(self) -> float:
+        """RAM used by the codes for one vector (the float copy stays on disk)."""
+        dim = self.float_vectors.shape[1]
+        return dim if self.mode == "int8" else _binary_dim(dim) / 8
+
+    def search(self, query_vectors: np.ndarray, k: int = 5, rescore: int = 50):
+        """
+        Search the codes, then rescore the shortlist with float vectors.
+
+        Args:
+            query_vectors: Array of shape (n_queries, dim) or (dim,)
+            k: Number of results per query
+            rescore: Shortlist size per query; 0 returns the code ranking as is
+
+        Returns:
+            tuple: (indices, scores), both of shape (n_queries, k)
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        k = min(k, len(self))
+        shortlist_size = min(max(rescore, k), len(self))
+
+        if self.mode == "int8":
+            code_scores, shortlist = self.codes_index.search(queries, shortlist_size)
+        else:
+            distances, shortlist = self.codes_index.search(_binarize(queries), shortlist_size)
+            code_scores = -distances.astype(np.float32)
+
+        if not rescore:
+            return shortlist[:, :k], code_scores[:, :k]
+
+        # Only the shortlisted rows are read from the memory-mapped file
+        rows = np.unique(shortlist)
+        row_lookup = np.searchsorted(rows, shortlist)
+        candidates = np.asarray(self.float_vectors[rows])[row_lookup]
+        scores = np.einsum("qcd,qd->qc", candidates, queries)
+
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(shortlist, top, axis=1), np.take_along_axis(scores, top, axis=1)
+
+
+class QuantizedRetriever(BaseRetriever):
+    """
+    LangChain retriever backed by a ``QuantizedIndex``.
+
+    Example:
+        >>> finetune_retriever = QuantizedRetriever.from_documents(
+        ...     training_documents, finetune_embeddings, "indexes/finetune-int8", mode="int8", k=6
+        ... )
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: Any
+    documents: List[Document]
+    embed_model: Any
+    k: int = 6
+    rescore: int = 50
+
+    @classmethod
+    def from_documents(
+        cls,
+        documents: List[Document],
+        embed_model,
+        path: str,
+        mode: str = "int8",
+        k: int = 6,
+        rescore: int = 50,
+        batch_size: int = 64,
+    ) -> "QuantizedRetriever":
+        """
+        Embed documents and build a quantized index at ``path``.
+
+        Args:
+            documents: LangChain documents to index
+            embed_model: A LangChain ``Embeddings`` object
+            path: Directory for the index files
+            mode: "int8" or "binary"
+            k: Number of documents returned per query
+            rescore: Shortlist size rescored with float vectors
+            batch_size: Number of texts per embedding call
+
+        Returns:
+            A ready-to-use retriever
+        """
+        vectors = embed_texts(embed_model, [d.page_content for d in documents], batch_size)
+        return cls(
+            index=QuantizedIndex.build(vectors, path, mode=mode),
+            documents=documents,
+            embed_model=embed_model,
+            k=k,
+            rescore=rescore,
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_vector = np.asarray(self.embed_model.embed_query(query), dtype=np.float32)
+        indices, _ = self.index.search(query_vector, k=self.k, rescore=self.rescore)
+        return [self.documents[i] for i in indices[0]]
+
+
+def benchmark_quantized_index(
+    dataset: Dict,
+    embed_model,
+    path: str = "indexes/quantized_benchmark",
+    modes: Sequence[str] = QUANTIZATION_MODES,
+    rescore: int = 50,
+    top_k: int = 5,
+    batch_size: int = 64,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Report recall@k, memory per vector and QPS for each quantization mode.
+
+    "recall_vs_float" is the overlap with an exact float32 search; "hit_rate"
+    uses the dataset's relevant contexts.  Each mode is run with and without
+    float rescoring.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        embed_model: A LangChain ``Embeddings`` object
+        path: Scratch directory for the benchmark indexes
+        modes: Quantization modes to benchmark
+        rescore: Shortlist size rescored with float vectors
+        top_k: Number of documents retrieved per question
+        batch_size: Number of texts per embedding call
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries, one per configuration
+
+    Example:
+        >>> benchmark_quantized_index(test_dataset, finetune_embeddings)
+    """
+    import faiss
+
+    question_ids = list(dataset["questions"].keys())
+    doc_ids = list(dataset["corpus"].keys())
+    doc_vectors = _normalize(embed_texts(embed_model, list(dataset["corpus"].values()), batch_size))
+    query_vectors = _normalize(embed_texts(embed_model, list(dataset["questions"].values()), batch_size))
+    relevant_contexts = dataset["relevant_contexts"]
+    k = min(top_k, len(doc_ids))
+
+    flat = faiss.IndexFlatIP(doc_vectors.shape[1])
+    flat.add(doc_vectors)
+
+    def run(name, search, bytes_per_vector):
+        start = time.perf_counter()
+        top = search(query_vectors)
+        seconds = time.perf_counter() - start
+        metrics = retrieval_metrics(top, question_ids, doc_ids, relevant_contexts)
+        metrics.pop("is_hit")
+        return {"config": name, "bytes_per_vector": bytes_per_vector, "top": top,
+                "qps": len(query_vectors) / seconds if seconds else float("inf"), **metrics}
+
+    rows = [run("float32 (flat)", lambda q: flat.search(q, k)[1], doc_vectors.shape[1] * 4)]
+    for mode in modes:
+        index = QuantizedIndex.build(doc_vectors, Path(path) / mode, mode=mode)
+        rows.append(run(f"{mode}", lambda q: index.search(q, k, rescore=0)[0], index.bytes_per_vector))
+        rows.append(run(f"{mode} + rescore@{rescore}", lambda q: index.search(q, k, rescore=rescore)[0],
+                        index.bytes_per_vector))
+
+    exact = rows[0]["top"]
+    for r in rows:
+        top = r.pop("top")
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(top, exact)]
+        r["recall_vs_float"] = float(np.mean(overlap))
+
+    if verbose:
+        print(f"{'Config':<24} {'B/vector':>9} {'QPS':>10} {'Recall vs f32':>14} {'Hit rate':>9} {'MRR':>7}")
+        print("-" * 78)
+        for r in rows:
+            print(
+                f"{r['config']:<24} {r['bytes_per_vector']:>9.0f} {r['qps']:>10.0f} "
+                f"{r['recall_vs_float']:>14.3f} {r['hit_rate']:>9.3f} {r['mrr']:>7.3f}"
+            )
+    return rows
+
+
+def _binary_dim(dim: int) -> int:
+    """FAISS binary indexes need a multiple of 8 bits."""
+    return (dim + 7) // 8 * 8
+
+
+def _binarize(vectors: np.ndarray) -> np.ndarray:
+    return np.packbits(vectors > 0, axis=1)
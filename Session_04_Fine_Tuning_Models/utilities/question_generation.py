@@ -0,0 +1,303 @@
+"""
+Bounded-concurrency, resumable synthetic question generation.
+
+``generate_questions`` is a drop-in for the notebook's ``create_questions``
+activity.  Documents are fanned out with an ``asyncio.Semaphore`` so only
+``concurrency`` requests are in flight, each request is retried with exponential
+backoff, and every finished document is appended to a JSONL checkpoint so a
+rerun skips the documents that are already done.
+
+The model call is pluggable.  A backend is any async callable
+``backend(context, n_questions) -> str`` that returns the raw numbered list:
+
+- ``ChainBackend``: the notebook's ``question_generation_chain`` (or any LangChain runnable)
+- ``MLXBackend``: a local MLX model, with concurrent requests grouped into
+  ``mlx_lm.batch_generate`` calls on a single worker thread
+- ``ExtractiveBackend``: a dependency-free local stand-in for dry runs and benchmarks
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+QA_PROMPT = """\
+Given the following context, you must generate questions based on only the provided context.
+
+You are to generate {n_questions} questions which should be provided in the following format:
+
+1. QUESTION #1
+2. QUESTION #2
+...
+
+Context:
+{context}
+"""
+
+_NUMBERED_LINE = re.compile(r"^\s*\d+\s*[.)]\s*(.+?)\s*$")
+
+
+def parse_questions(text: str, n_questions: Optional[int] = None) -> List[str]:
+    """
+    Parse the "1. QUESTION" list format requested by ``QA_PROMPT``.
+
+    Args:
+        text: Raw model output
+        n_questions: Keep at most this many questions
+
+    Returns:
+        List of question strings
+    """
+    questions = []
+    for line in text.splitlines():
+        match = _NUMBERED_LINE.match(line)
+        if match:
+            questions.append(match.group(1))
+    return questions[:n_questions] if n_questions else questions
+
+
+class ChainBackend:
+    """
+    Backend wrapping a LangChain runnable such as ``question_generation_chain``.
+
+    Example:
+        >>> backend = ChainBackend(question_generation_chain)
+    """
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    async def __call__(self, context: str, n_questions: int) -> str:
+        result = await self.chain.ainvoke({"context": context, "n_questions": n_questions})
+        return getattr(result, "content", result)
+
+
+class MLXBackend:
+    """
+    Backend running a local MLX model with micro-batched generation.
+
+    Concurrent calls are queued and grouped into one ``mlx_lm.batch_generate``
+    call of up to ``batch_size`` prompts.  All MLX work runs on a single
+    dedicated thread, so the event loop is never blocked.  Use a
+    ``concurrency`` of at least ``batch_size`` in ``generate_questions`` so the
+    batches can fill.
+
+    Example:
+        >>> from mlx_lm import load
+        >>> model, tokenizer = load("mlx-community/Qwen3-4B-Instruct-2507-4bit")
+        >>> backend = MLXBackend(model, tokenizer, batch_size=8)
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_tokens: int = 512,
+        batch_size: int = 8,
+        batch_wait: float = 0.05,
+        prompt_template: str = QA_PROMPT,
+    ):
+        """
+        Args:
+            model: A loaded MLX model (e.g. from ``mlx_lm.load`` or ``get_model``)
+            tokenizer: The model's tokenizer
+            max_tokens: Maximum tokens generated per document
+            batch_size: Maximum prompts per ``batch_generate`` call
+            batch_wait: Seconds to wait for a batch to fill before running it
+            prompt_template: Prompt with ``{context}`` and ``{n_questions}`` fields
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.prompt_template = prompt_template
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mlx")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def __call__(self, context: str, n_questions: int) -> str:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run_batches())
+        future = asyncio.get_running_loop().create_future()
+        prompt = self.prompt_template.format(context=context, n_questions=n_questions)
+        await self._queue.put((prompt, future))
+        return await future
+
+    async def aclose(self) -> None:
+        """Stop the batching task and the MLX worker thread."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        self._executor.shutdown(wait=False)
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            prompts = [prompt for prompt, _ in batch]
+            try:
+                texts = await loop.run_in_executor(self._executor, self._generate, prompts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), text in zip(batch, texts):
+                    if not future.done():
+                        future.set_result(text)
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        from mlx_lm import batch_generate
+
+        token_prompts = [
+            self.tokenizer.apply_chat_template(
+                [{"role": "user", "content": prompt}], add_generation_prompt=True
+            )
+            for prompt in prompts
+        ]
+        response = batch_generate(
+            self.model, self.tokenizer, token_prompts, max_tokens=self.max_tokens
+        )
+        return response.texts
+
+
+class ExtractiveBackend:
+    """
+    Local stand-in backend that turns context sentences into questions.
+
+    Useful for dry runs of the pipeline and for benchmarking the orchestration
+    without a model.  ``delay`` simulates model latency.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def __call__(self, context: str, n_questions: int) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", context) if len(s.strip()) > 20]
+        sentences = sentences or [context.strip()[:200]]
+        return "\n".join(
+            f"{i + 1}. What does the context say about: {sentences[i % len(sentences)][:120]}?"
+            for i in range(n_questions)
+        )
+
+
+async def generate_questions(
+    documents,
+    n_questions: int,
+    backend,
+    checkpoint_path: Optional[str] = None,
+    concurrency: int = 8,
+    max_retries: int = 4,
+    base_delay: float = 1.0,
+    verbose: bool = True,
+) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
+    """
+    Generate ``n_questions`` questions per document with bounded concurrency.
+
+    Args:
+        documents: LangChain documents with ``metadata["id"]``
+        n_questions: Questions to generate per document
+        backend: Async callable ``backend(context, n_questions) -> str``
+        checkpoint_path: JSONL file of finished documents; reruns skip them
+        concurrency: Maximum requests in flight
+        max_retries: Retries per document after the first attempt
+        base_delay: First backoff delay in seconds (doubles each retry, with jitter)
+        verbose: Whether to print progress and a throughput summary
+
+    Returns:
+        tuple: (questions, relevant_docs) in the notebook's format
+            - questions: question ID -> question text
+            - relevant_docs: question ID -> [context ID]
+
+    Example:
+        >>> training_questions, training_relevant_contexts = await generate_questions(
+        ...     training_split_documents, 2, ChainBackend(question_generation_chain),
+        ...     checkpoint_path="checkpoints/training_questions.jsonl",
+        ... )
+    """
+    questions: Dict[str, str] = {}
+    relevant_docs: Dict[str, List[str]] = {}
+
+    def record(doc_id: str, items: List[Dict]) -> None:
+        for item in items:
+            questions[item["id"]] = item["question"]
+            relevant_docs[item["id"]] = [doc_id]
+
+    done = set()
+    checkpoint = Path(checkpoint_path) if checkpoint_path else None
+    if checkpoint and checkpoint.exists():
+        with open(checkpoint) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    done.add(entry["doc_id"])
+                    record(entry["doc_id"], entry["questions"])
+    if checkpoint:
+        checkpoint.parent.mkdir(parents=True, exist_ok=True)
+
+    pending = [d for d in documents if d.metadata["id"] not in done]
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    failed: Dict[str, str] = {}
+    finished = 0
+
+    async def process(document) -> None:
+        nonlocal finished
+        doc_id = document.metadata["id"]
+        for attempt in range(max_retries + 1):
+            try:
+                async with semaphore:
+                    text = await backend(document.page_content, n_questions)
+                parsed = parse_questions(text, n_questions)
+                if not parsed:
+                    raise ValueError("no numbered questions in model output")
+                break
+            except Exception as e:
+                if attempt == max_retries:
+                    failed[doc_id] = repr(e)
+                    return
+            # Back off outside the semaphore so a throttled document frees its slot
+            await asyncio.sleep(base_delay * 2 ** attempt * (0.5 + random.random()))
+
+        items = [{"id": str(uuid.uuid4()), "question": q} for q in parsed]
+        record(doc_id, items)
+        if checkpoint:
+            async with write_lock:
+                with open(checkpoint, "a") as f:
+                    f.write(json.dumps({"doc_id": doc_id, "questions": items}) + "\n")
+        finished += 1
+        if verbose:
+            print(f"\r{finished}/{len(pending)} documents", end="", flush=True)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(process(d) for d in pending))
+    elapsed = time.perf_counter() - start
+
+    if verbose:
+        rate = finished / elapsed if elapsed else 0.0
+        print(
+            f"\n✓ {finished} documents in {elapsed:.1f}s ({rate:.2f} documents/s), "
+            f"{len(done)} skipped from checkpoint, {len(questions)} questions total"
+        )
+        if failed:
+            print(f"⚠️  {len(failed)} documents failed after {max_retries} retries; rerun to retry them")
+    return questions, relevant_docs
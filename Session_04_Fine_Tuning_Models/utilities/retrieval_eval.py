@@ -0,0 +1,348 @@
+"""
+Batched retrieval evaluation for embedding models.
+
+The notebook's ``evaluate_openai`` builds a FAISS index and then calls
+``retriever.invoke`` once per question, which means one embedding request and
+one search per question.  The functions here embed every query in batches, run
+a single matrix top-k search against the corpus, and compute hit rate, MRR and
+recall@k with NumPy.  Several embedding models can be scored against the same
+dataset in one run.
+"""
+
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def embed_texts(embed_model, texts: List[str], batch_size: int = 64) -> np.ndarray:
+    """
+    Embed a list of texts in batches with any LangChain ``Embeddings`` object.
+
+    Queries are embedded with ``embed_documents`` so that each batch is a single
+    request.  For ``OpenAIEmbeddings`` and ``HuggingFaceEmbeddings`` with default
+    encode kwargs this gives the same vectors as ``embed_query``.
+
+    Args:
+        embed_model: A LangChain ``Embeddings`` object
+        texts: The texts to embed
+        batch_size: Number of texts sent to the model per call (default: 64)
+
+    Returns:
+        float32 array of shape (len(texts), dim)
+    """
+    if hasattr(embed_model, "embed_array"):
+        # CachedEmbeddings already batches and returns an array
+        return embed_model.embed_array(texts)
+
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embed_model.embed_documents(texts[start:start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def top_k_search(
+    query_vectors: np.ndarray,
+    doc_vectors: np.ndarray,
+    top_k: int = 5,
+    metric: str = "l2",
+    block_size: int = 1024,
+) -> np.ndarray:
+    """
+    Exact top-k search of every query against every document.
+
+    Queries are scored in blocks so the score matrix never holds more than
+    ``block_size`` rows at a time.
+
+    Args:
+        query_vectors: Array of shape (n_queries, dim)
+        doc_vectors: Array of shape (n_docs, dim)
+        top_k: Number of documents to return per query
+        metric: "l2" (FAISS default, smallest distance first), "ip" (inner
+                product) or "cosine"
+        block_size: Number of queries scored per matrix multiply
+
+    Returns:
+        int64 array of shape (n_queries, top_k) with document row indices,
+        best match first
+
+    Raises:
+        ValueError: If the metric is unknown or there are no documents
+    """
+    if metric not in ("l2", "ip", "cosine"):
+        raise ValueError(f"Invalid metric: {metric}")
+    if len(doc_vectors) == 0:
+        raise ValueError("corpus is empty")
+
+    if metric == "cosine":
+        query_vectors = _normalize(query_vectors)
+        doc_vectors = _normalize(doc_vectors)
+
+    top_k = min(top_k, len(doc_vectors))
+    # ||q - d||^2 = ||q||^2 - 2 q.d + ||d||^2, and ||q||^2 does not change the ranking
+    doc_sq_norms = (doc_vectors * doc_vectors).sum(axis=1) if metric == "l2" else None
+
+    results = np.empty((len(query_vectors), top_k), dtype=np.int64)
+    for start in range(0, len(query_vectors), block_size):
+        scores = query_vectors[start:start + block_size] @ doc_vectors.T
+        if doc_sq_norms is not None:
+            scores = 2 * scores - doc_sq_norms
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        results[start:start + block_size] = np.take_along_axis(candidates, order, axis=1)
+    return results
+
+
+def retrieval_metrics(
+    top_k_indices: np.ndarray,
+    question_ids: List[str],
+    doc_ids: List[str],
+    relevant_contexts: Dict[str, List[str]],
+) -> Dict:
+    """
+    Compute hit rate, MRR and recall@k from a top-k result matrix.
+
+    Relevant (question, document) pairs are encoded as single integer keys so the
+    lookup is one ``np.isin`` over the (n_queries, k) result matrix instead of a
+    Python loop.
+
+    Args:
+        top_k_indices: Array of shape (n_queries, k) from ``top_k_search``
+        question_ids: Question IDs in the same row order as the queries
+        doc_ids: Document IDs in the same row order as the corpus vectors
+        relevant_contexts: Mapping of question ID to relevant document IDs
+
+    Returns:
+        Dictionary with "hit_rate", "mrr", "recall@k" and the per-question
+        boolean array "is_hit"
+    """
+    n_docs = len(doc_ids)
+    k = top_k_indices.shape[1]
+    doc_index = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+    pair_keys = []
+    n_relevant = np.zeros(len(question_ids), dtype=np.int64)
+    for row, question_id in enumerate(question_ids):
+        relevant = [doc_index[d] for d in relevant_contexts[question_id] if d in doc_index]
+        n_relevant[row] = len(relevant)
+        pair_keys.extend(row * n_docs + d for d in relevant)
+
+    rows = np.arange(len(question_ids), dtype=np.int64)[:, None]
+    hits = np.isin(rows * n_docs + top_k_indices, np.asarray(pair_keys, dtype=np.int64))
+
+    is_hit = hits.any(axis=1)
+    first_rank = hits.argmax(axis=1) + 1
+    reciprocal_rank = np.where(is_hit, 1.0 / first_rank, 0.0)
+    recall = hits.sum(axis=1) / np.maximum(n_relevant, 1)
+
+    return {
+        "hit_rate": float(is_hit.mean()),
+        "mrr": float(reciprocal_rank.mean()),
+        f"recall@{k}": float(recall.mean()),
+        "is_hit": is_hit,
+    }
+
+
+def evaluate_retrieval(
+    dataset: Dict,
+    embed_model,
+    top_k: int = 5,
+    batch_size: int = 64,
+    metric: str = "l2",
+    model_name: Optional[str] = None,
+) -> Dict:
+    """
+    Batched drop-in replacement for the notebook's ``evaluate_openai``.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        embed_model: A LangChain ``Embeddings`` object
+        top_k: Number of documents retrieved per question (default: 5)
+        batch_size: Number of texts per embedding call (default: 64)
+        metric: Similarity used for search, see ``top_k_search`` (default: "l2",
+                matching ``FAISS.from_documents``)
+        model_name: Label for the model in the returned metrics
+
+    Returns:
+        Dictionary with the metrics from ``retrieval_metrics``, timings in
+        seconds, and "results": a list of per-question rows in the same shape as
+        ``evaluate_openai`` returns (so ``pd.DataFrame(...)`` still works)
+
+    Raises:
+        ValueError: If the dataset's corpus is empty
+
+    Example:
+        >>> metrics = evaluate_retrieval(test_dataset, huggingface_embeddings)
+        >>> metrics["hit_rate"], metrics["mrr"]
+    """
+    return _evaluate(_prepare_dataset(dataset), embed_model, top_k, batch_size, metric, model_name)
+
+
+def evaluate_models(
+    dataset: Dict,
+    embed_models: Dict[str, object],
+    top_k: int = 5,
+    batch_size: int = 64,
+    metric: str = "l2",
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Evaluate several embedding models over the same dataset in one run.
+
+    The question/corpus ordering is prepared once and shared by every model.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        embed_models: Mapping of display name to LangChain ``Embeddings`` object
+        top_k: Number of documents retrieved per question (default: 5)
+        batch_size: Number of texts per embedding call (default: 64)
+        metric: Similarity used for search, see ``top_k_search``
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of metric dictionaries, one per model, in the input order
+
+    Example:
+        >>> evaluate_models(test_dataset, {
+        ...     "te3-small": te3_openai,
+        ...     "arctic-base": huggingface_embeddings,
+        ...     "arctic-ft": finetune_embeddings,
+        ... })
+    """
+    prepared = _prepare_dataset(dataset)
+    all_metrics = [
+        _evaluate(prepared, embed_model, top_k, batch_size, metric, name)
+        for name, embed_model in embed_models.items()
+    ]
+
+    if verbose:
+        recall_key = f"recall@{min(top_k, len(prepared['doc_ids']))}"
+        print(f"{'Model':<24} {'Hit rate':>9} {'MRR':>7} {recall_key:>10} {'Seconds':>9}")
+        print("-" * 63)
+        for m in all_metrics:
+            print(
+                f"{m['model']:<24} {m['hit_rate']:>9.3f} {m['mrr']:>7.3f} "
+                f"{m[recall_key]:>10.3f} {m['total_seconds']:>9.2f}"
+            )
+    return all_metrics
+
+
+def evaluate_openai_loop(dataset: Dict, embed_model, top_k: int = 5) -> List[Dict]:
+    """
+    The notebook's original per-question ``evaluate_openai`` loop.
+
+    Kept so the batched evaluator can be timed against it.  Requires
+    ``langchain-community`` and ``faiss-cpu``.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        embed_model: A LangChain ``Embeddings`` object
+        top_k: Number of documents retrieved per question (default: 5)
+
+    Returns:
+        List of per-question result dictionaries
+    """
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    corpus = dataset['corpus']
+    questions = dataset['questions']
+    relevant_docs = dataset['relevant_contexts']
+    documents = [Document(page_content=content, metadata={"id": doc_id}) for doc_id, content in corpus.items()]
+    vectorstore = FAISS.from_documents(documents, embed_model)
+    retriever = vectorstore.as_retriever(search_kwargs={"k": top_k})
+
+    eval_results = []
+    for id, question in questions.items():
+        retrieved_nodes = retriever.invoke(question)
+        retrieved_ids = [node.metadata["id"] for node in retrieved_nodes]
+        expected_id = relevant_docs[id][0]
+        is_hit = expected_id in retrieved_ids
+        eval_results.append({"id": id, "question": question, "expected_id": expected_id, "is_hit": is_hit})
+    return eval_results
+
+
+def compare_with_loop(dataset: Dict, embed_model, top_k: int = 5, batch_size: int = 64) -> Dict:
+    """
+    Time the batched evaluator against the original per-question loop.
+
+    Args:
+        dataset: Dictionary with "questions", "relevant_contexts" and "corpus"
+        embed_model: A LangChain ``Embeddings`` object
+        top_k: Number of documents retrieved per question (default: 5)
+        batch_size: Number of texts per embedding call (default: 64)
+
+    Returns:
+        Dictionary with both timings, both hit rates and the speedup
+    """
+    start = time.perf_counter()
+    loop_results = evaluate_openai_loop(dataset, embed_model, top_k=top_k)
+    loop_seconds = time.perf_counter() - start
+    loop_hit_rate = sum(r["is_hit"] for r in loop_results) / max(len(loop_results), 1)
+
+    batched = evaluate_retrieval(dataset, embed_model, top_k=top_k, batch_size=batch_size)
+
+    speedup = loop_seconds / batched["total_seconds"] if batched["total_seconds"] else float("inf")
+    print(f"Per-question loop: {loop_seconds:8.2f}s  hit rate {loop_hit_rate:.3f}")
+    print(f"Batched:           {batched['total_seconds']:8.2f}s  hit rate {batched['hit_rate']:.3f}")
+    print(f"Speedup:           {speedup:8.1f}x")
+
+    return {
+        "loop_seconds": loop_seconds,
+        "batched_seconds": batched["total_seconds"],
+        "loop_hit_rate": loop_hit_rate,
+        "batched_hit_rate": batched["hit_rate"],
+        "speedup": speedup,
+    }
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _prepare_dataset(dataset: Dict) -> Dict:
+    questions = dataset["questions"]
+    corpus = dataset["corpus"]
+    if not corpus:
+        raise ValueError("corpus is empty")
+    return {
+        "question_ids": list(questions.keys()),
+        "question_texts": list(questions.values()),
+        "doc_ids": list(corpus.keys()),
+        "doc_texts": list(corpus.values()),
+        "relevant_contexts": dataset["relevant_contexts"],
+    }
+
+
+def _evaluate(prepared: Dict, embed_model, top_k, batch_size, metric, model_name) -> Dict:
+    start = time.perf_counter()
+    doc_vectors = embed_texts(embed_model, prepared["doc_texts"], batch_size)
+    query_vectors = embed_texts(embed_model, prepared["question_texts"], batch_size)
+    embed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    top_k_indices = top_k_search(query_vectors, doc_vectors, top_k=top_k, metric=metric)
+    metrics = retrieval_metrics(
+        top_k_indices, prepared["question_ids"], prepared["doc_ids"], prepared["relevant_contexts"]
+    )
+    search_seconds = time.perf_counter() - start
+
+    relevant_contexts = prepared["relevant_contexts"]
+    metrics["results"] = [
+        {
+            "id": question_id,
+            "question": question,
+            "expected_id": relevant_contexts[question_id][0],
+            "is_hit": bool(hit),
+        }
+        for question_id, question, hit in zip(
+            prepared["question_ids"], prepared["question_texts"], metrics["is_hit"]
+        )
+    ]
+    metrics["model"] = model_name or type(embed_model).__name__
+    metrics["embed_seconds"] = embed_seconds
+    metrics["search_seconds"] = search_seconds
+    metrics["total_seconds"] = embed_seconds + search_seconds
+    return metrics
@@ -0,0 +1,361 @@
+"""
+Parse-once reward engine for GRPO rollouts.
+
+The notebook's five reward functions each pull the text out of every completion
+and re-scan it: ``extract_xml_answer`` runs twice, the format patterns are
+recompiled on every call, and ``count_xml`` makes seven more passes.
+``GRPOTrainer`` calls every function on the same batch, so each completion is
+parsed five times per step.
+
+``RewardEngine`` parses each completion once into a ``ParsedCompletion``
+(extracted answer, format matches, tag counts and trailing text lengths) using
+precompiled patterns, then evaluates every registered reward over the parsed
+batch.  ``engine.reward_funcs()`` returns drop-in replacements for the notebook's
+functions: the first one called on a batch scores all rewards, and the rest
+read from that result.  Large batches can be parsed in a process pool.  Nothing
+is printed.
+
+The rewards are identical to the notebook's; only the work is shared.
+"""
+
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+# Same pattern (and the same re.match semantics) as the notebook
+_SOFT_FORMAT = re.compile(r"<reasoning>.*?</reasoning>\s*<answer>.*?</answer>")
+
+
+class ParsedCompletion(NamedTuple):
+    """Everything the reward functions need from one completion."""
+
+    answer: str
+    strict_format: bool
+    soft_format: bool
+    reasoning_open: int
+    reasoning_close: int
+    answer_open: int
+    answer_close: int
+    after_answer_block: int
+    after_answer_close: int
+
+
+def parse_completion(text: str) -> ParsedCompletion:
+    """
+    Parse a completion once.
+
+    Args:
+        text: The completion's message content
+
+    Returns:
+        ``ParsedCompletion`` with the ``extract_xml_answer`` result, whether the
+        strict and soft format patterns match, the counts used by ``count_xml``,
+        and the lengths of the text after the last "\\n</answer>\\n" and "\\n</answer>"
+    """
+    answer_open = text.count("\n<answer>\n")
+    return ParsedCompletion(
+        answer=text.rpartition("<answer>")[2].partition("</answer>")[0].strip(),
+        strict_format=_is_strict_format(text),
+        # The pattern is anchored at the start, so skip the regex when it cannot match
+        soft_format=text.startswith("<reasoning>") and _SOFT_FORMAT.match(text) is not None,
+        reasoning_open=text.count("<reasoning>\n"),
+        reasoning_close=text.count("\n</reasoning>\n"),
+        answer_open=answer_open,
+        answer_close=text.count("\n</answer>"),
+        # "\n</answer>\n" can overlap itself, so split like count_xml does (only used
+        # when answer_open == 1); "\n</answer>" cannot, so rpartition is exact
+        after_answer_block=len(text.split("\n</answer>\n")[-1]) if answer_open == 1 else 0,
+        after_answer_close=len(text.rpartition("\n</answer>")[2]),
+    )
+
+
+def correctness_reward(parsed: ParsedCompletion, answer: Optional[str]) -> float:
+    return 2.0 if parsed.answer == answer else 0.0
+
+
+def int_reward(parsed: ParsedCompletion, answer: Optional[str]) -> float:
+    return 0.5 if parsed.answer.isdigit() else 0.0
+
+
+def strict_format_reward(parsed: ParsedCompletion, answer: Optional[str]) -> float:
+    return 0.5 if parsed.strict_format else 0.0
+
+
+def soft_format_reward(parsed: ParsedCompletion, answer: Optional[str]) -> float:
+    return 0.5 if parsed.soft_format else 0.0
+
+
+def xmlcount_reward(parsed: ParsedCompletion, answer: Optional[str]) -> float:
+    count = 0.0
+    if parsed.reasoning_open == 1:
+        count += 0.125
+    if parsed.reasoning_close == 1:
+        count += 0.125
+    if parsed.answer_open == 1:
+        count += 0.125
+        count -= parsed.after_answer_block * 0.001
+    if parsed.answer_close == 1:
+        count += 0.125
+        count -= (parsed.after_answer_close - 1) * 0.001
+    return count
+
+
+# Same order and names as the notebook's reward_funcs list
+DEFAULT_REWARDS: Dict[str, Callable[[ParsedCompletion, Optional[str]], float]] = {
+    "xmlcount_reward_func": xmlcount_reward,
+    "soft_format_reward_func": soft_format_reward,
+    "strict_format_reward_func": strict_format_reward,
+    "int_reward_func": int_reward,
+    "correctness_reward_func": correctness_reward,
+}
+
+
+class RewardEngine:
+    """
+    Scores every registered reward over a batch of completions in one pass.
+
+    Example:
+        >>> reward_engine = RewardEngine()
+        >>> trainer = GRPOTrainer(
+        ...     model = model,
+        ...     processing_class = tokenizer,
+        ...     reward_funcs = reward_engine.reward_funcs(),
+        ...     args = training_args,
+        ...     train_dataset = dataset,
+        ... )
+    """
+
+    def __init__(
+        self,
+        rewards: Optional[Dict[str, Callable]] = None,
+        processes: Optional[int] = None,
+        min_pool_batch: int = 512,
+    ):
+        """
+        Args:
+            rewards: Name -> ``fn(parsed, answer) -> float`` (default: the notebook's five)
+            processes: Worker processes for parsing; ``None`` parses in this process
+            min_pool_batch: Smallest batch sent to the pool; smaller batches are
+                cheaper to parse here than to ship to a worker
+        """
+        self.rewards = dict(rewards if rewards is not None else DEFAULT_REWARDS)
+        self.processes = processes
+        self.min_pool_batch = min_pool_batch
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._last_batch = None
+        self._last_scores: Dict[str, List[float]] = {}
+
+    def register(self, name: str, fn: Callable[[ParsedCompletion, Optional[str]], float]) -> None:
+        """
+        Add a reward computed from the parsed completion.
+
+        Args:
+            name: Name reported by ``GRPOTrainer`` in its logs
+            fn: ``fn(parsed, answer) -> float``
+        """
+        self.rewards[name] = fn
+        self._last_batch = None
+
+    def score(self, completions: Sequence, answer: Optional[Sequence[str]] = None) -> Dict[str, List[float]]:
+        """
+        Score a batch with every registered reward.
+
+        Args:
+            completions: ``GRPOTrainer`` completions (lists of messages) or plain strings
+            answer: Reference answers aligned with ``completions``
+
+        Returns:
+            Reward name -> list of scores
+        """
+        texts = [c if isinstance(c, str) else c[0]["content"] for c in completions]
+        answers = list(answer) if answer is not None else [None] * len(texts)
+
+        if self.processes and len(texts) >= self.min_pool_batch:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes)
+            chunk = -(-len(texts) // self.processes)
+            parsed = [
+                p
+                for part in self._pool.map(_parse_all, [texts[i:i + chunk] for i in range(0, len(texts), chunk)])
+                for p in part
+            ]
+        else:
+            parsed = _parse_all(texts)
+
+        return {
+            name: [fn(p, a) for p, a in zip(parsed, answers)]
+            for name, fn in self.rewards.items()
+        }
+
+    def reward_funcs(self) -> List[Callable]:
+        """
+        ``GRPOTrainer``-compatible reward functions, one per registered reward.
+
+        Each has the registered name as ``__name__`` (used in the trainer logs)
+        and the signature ``fn(prompts, completions, answer=None, **kwargs)``.
+        The batch is scored once and shared by all of them.
+        """
+        return [self._make_reward_func(name) for name in self.rewards]
+
+    def close(self) -> None:
+        """Shut down the worker pool, if any."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _make_reward_func(self, name: str) -> Callable:
+        def reward_func(prompts=None, completions=(), answer=None, **kwargs) -> List[float]:
+            # GRPOTrainer passes the same list objects to each function within a
+            # step; holding them keeps their ids from being reused by a later step
+            last = self._last_batch
+            if last is None or last[0] is not completions or last[1] is not answer:
+                self._last_scores = self.score(completions, answer)
+                self._last_batch = (completions, answer)
+            return self._last_scores[name]
+
+        reward_func.__name__ = name
+        return reward_func
+
+
+def benchmark_rewards(
+    baseline_funcs: Optional[Sequence[Callable]] = None,
+    num_generations: int = 8,
+    n_batches: int = 500,
+    processes: Sequence[Optional[int]] = (None, 4),
+    pool_batch_size: int = 4096,
+    repeats: int = 3,
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Benchmark rewards/s on synthetic rollouts.
+
+    Batches of ``num_generations`` completions per prompt mimic one GRPO step.
+    The process pool only pays off for large batches, so the pooled engine is
+    measured on batches of ``pool_batch_size`` completions.
+
+    Args:
+        baseline_funcs: The notebook's reward functions, in the trainer's order;
+            when given they are timed too and the engine's scores are checked
+            against them
+        num_generations: Completions per prompt (``GRPOConfig.num_generations``)
+        n_batches: Prompts (GRPO batches) to score
+        processes: Engine pool sizes to try (``None`` for in-process)
+        pool_batch_size: Completions per batch when a pool is used
+        repeats: Timing runs per method; the fastest is reported
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "method", "batch_size", "rewards_per_second"
+        and "matches_baseline"
+
+    Example:
+        >>> benchmark_rewards([xmlcount_reward_func, soft_format_reward_func, strict_format_reward_func,
+        ...                    int_reward_func, correctness_reward_func])
+    """
+    rng = random.Random(0)
+    completions, answers = [], []
+    for _ in range(n_batches * num_generations):
+        text, answer = _synthetic_completion(rng)
+        completions.append([{"role": "assistant", "content": text}])
+        answers.append(answer)
+    prompts = [[{"role": "user", "content": "question"}]] * len(completions)
+    n_rewards = len(DEFAULT_REWARDS)
+
+    def batches(size):
+        return [(completions[i:i + size], answers[i:i + size]) for i in range(0, len(completions), size)]
+
+    def timed(funcs, size):
+        best, scores = float("inf"), None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            scores = [[fn(prompts=prompts[:len(c)], completions=c, answer=a) for fn in funcs] for c, a in batches(size)]
+            best = min(best, time.perf_counter() - start)
+        return scores, best
+
+    reference = None
+    rows = []
+    if baseline_funcs:
+        reference, seconds = timed(baseline_funcs, num_generations)
+        rows.append({"method": "notebook functions", "batch_size": num_generations,
+                     "rewards_per_second": len(completions) * len(baseline_funcs) / seconds,
+                     "matches_baseline": True})
+
+    for pool_size in processes:
+        batch_size = pool_batch_size if pool_size else num_generations
+        engine = RewardEngine(processes=pool_size, min_pool_batch=1)
+        if pool_size:
+            engine.score(completions[:pool_size])  # start the workers outside the timing
+        scores, seconds = timed(engine.reward_funcs(), batch_size)
+        engine.close()
+
+        matches = None
+        if reference is not None:
+            matches = all(
+                abs(x - y) < 1e-9
+                for got, expected in zip(_by_reward(scores), _by_reward(reference))
+                for x, y in zip(got, expected)
+            )
+        rows.append({
+            "method": f"engine ({pool_size} processes)" if pool_size else "engine (in-process)",
+            "batch_size": batch_size,
+            "rewards_per_second": len(completions) * n_rewards / seconds,
+            "matches_baseline": matches,
+        })
+
+    if verbose:
+        print(f"{len(completions)} completions, num_generations={num_generations}")
+        print(f"{'Method':<26} {'Batch':>6} {'Rewards/s':>12} {'Matches':>8}")
+        print("-" * 55)
+        for r in rows:
+            match = "-" if r["matches_baseline"] is None else ("✓" if r["matches_baseline"] else "✗")
+            print(f"{r['method']:<26} {r['batch_size']:>6} {r['rewards_per_second']:>12,.0f} {match:>8}")
+    return rows
+
+
+def _by_reward(per_batch: List[List[List[float]]]) -> List[List[float]]:
+    # [batch][reward][completion] -> [reward][completion over all batches]
+    return [list(chain.from_iterable(batch[j] for batch in per_batch)) for j in range(len(per_batch[0]))]
+
+
+def _is_strict_format(text: str) -> bool:
+    """
+    Line-based equivalent of the notebook's strict pattern
+    ``^<reasoning>\\n.*?\\n</reasoning>\\n<answer>\\n.*?\\n</answer>\\n$``.
+
+    ``.`` does not match newlines, so the reasoning and the answer are single
+    lines, and ``$`` also matches before one final newline.  Splitting on
+    newlines avoids the lazy ``.*?`` stepping through the text one character
+    at a time.
+    """
+    lines = text.split("\n", 8)
+    return (
+        len(lines) in (7, 8)
+        and lines[0] == "<reasoning>"
+        and lines[2] == "</reasoning>"
+        and lines[3] == "<answer>"
+        and lines[5] == "</answer>"
+        and all(line == "" for line in lines[6:])
+    )
+
+
+def _parse_all(texts: List[str]) -> List[ParsedCompletion]:
+    return [parse_completion(t) for t in texts]
+
+
+def _synthetic_completion(rng: random.Random):
+    answer = str(rng.randint(0, 999))
+    reasoning = " ".join(rng.choice(("so", "then", "add", "the", "total", "is", "3", "12")) for _ in range(rng.randint(20, 200)))
+    given = answer if rng.random() < 0.5 else str(rng.randint(0, 999))
+    style = rng.randrange(4)
+    if style == 0:
+        text = f"<reasoning>\n{reasoning}\n</reasoning>\n<answer>\n{given}\n</answer>\n"
+    elif style == 1:
+        text = f"<reasoning>{reasoning}</reasoning> <answer>{given}</answer> trailing text"
+    elif style == 2:
+        text = f"{reasoning}\nThe answer is {given}."
+    else:
+        text = f"<reasoning>\n{reasoning}\n</reasoning>\n<answer>\n{given}\n</answer>\n<answer>\n{given}\n</answer>"
+    return text, answer
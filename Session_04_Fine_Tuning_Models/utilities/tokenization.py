@@ -0,0 +1,320 @@
+"""
+Disk-cached pre-tokenization and length-bucketed batching.
+
+The GRPO notebook finds ``max_prompt_length`` by running
+``tokenizer.apply_chat_template`` over the whole dataset in two ``dataset.map``
+passes, and repeats that work on every run.  ``pretokenize`` tokenizes a list of
+texts or chat conversations once and stores the token IDs on disk as two
+memory-mapped ``.npy`` files (flat IDs and row offsets).  The cache key combines a
+fingerprint of the tokenizer (vocabulary, chat template, special tokens), the
+template options and the content of the inputs, so a different tokenizer,
+template or dataset never reuses stale IDs.
+
+The embedding ``DataLoader`` batches examples in arbitrary order, so every
+batch is padded to its longest text.  ``LengthBucketSampler`` shuffles, then
+sorts examples by length within large pools and cuts each pool into batches, so
+batches hold similar lengths while their order stays random.
+"""
+
+import hashlib
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+
+import numpy as np
+
+
+def tokenizer_fingerprint(tokenizer, **template_kwargs) -> str:
+    """
+    Hash identifying a tokenizer's vocabulary, chat template and options.
+
+    Args:
+        tokenizer: A Hugging Face tokenizer
+        **template_kwargs: Options that change the token IDs, e.g. ``add_generation_prompt=True``
+
+    Returns:
+        16-character hex digest
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    vocabulary = backend.to_str() if backend is not None else json.dumps(tokenizer.get_vocab(), sort_keys=True)
+    parts = [
+        type(tokenizer).__name__,
+        vocabulary,
+        getattr(tokenizer, "chat_template", None) or "",
+        json.dumps(getattr(tokenizer, "special_tokens_map", {}), sort_keys=True, default=str),
+        json.dumps(template_kwargs, sort_keys=True, default=str),
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+
+class TokenizedTexts:
+    """
+    Token IDs of many texts stored as one flat array plus row offsets.
+
+    Example:
+        >>> prompts = pretokenize(dataset["prompt"], tokenizer, chat_template=True)
+        >>> max_prompt_length = prompts.max_length
+        >>> prompts[0]           # token IDs of the first prompt
+    """
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray):
+        self.ids = ids
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Number of tokens per text."""
+        return np.diff(self.offsets)
+
+    @property
+    def max_length(self) -> int:
+        """Longest text in tokens (0 when empty)."""
+        return int(self.lengths.max()) if len(self) else 0
+
+
+def pretokenize(
+    items: Sequence,
+    tokenizer,
+    cache_dir: str = "token_cache",
+    chat_template: bool = False,
+    add_generation_prompt: bool = True,
+    batch_size: int = 1000,
+    verbose: bool = True,
+) -> TokenizedTexts:
+    """
+    Tokenize texts or chat conversations once and cache the IDs on disk.
+
+    Args:
+        items: Texts, or message lists when ``chat_template`` is True
+        tokenizer: A Hugging Face tokenizer
+        cache_dir: Root directory of the token cache
+        chat_template: Apply ``tokenizer.apply_chat_template`` to message lists
+        add_generation_prompt: Passed to ``apply_chat_template``
+        batch_size: Items tokenized per call
+        verbose: Whether to print whether the cache was hit
+
+    Returns:
+        ``TokenizedTexts`` backed by memory-mapped files
+
+    Example:
+        >>> max_prompt_length = pretokenize(dataset["prompt"], tokenizer, chat_template=True).max_length
+    """
+    items = list(items)
+    options = {"chat_template": chat_template}
+    if chat_template:
+        options["add_generation_prompt"] = add_generation_prompt
+    namespace = Path(cache_dir) / tokenizer_fingerprint(tokenizer, **options)
+    content = hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    ids_file, offsets_file = namespace / f"{content}.ids.npy", namespace / f"{content}.offsets.npy"
+
+    if ids_file.exists() and offsets_file.exists():
+        if verbose:
+            print(f"✓ Loaded {len(items)} tokenized items from {namespace}")
+        return TokenizedTexts(np.load(ids_file, mmap_mode="r"), np.load(offsets_file, mmap_mode="r"))
+
+    start = time.perf_counter()
+    rows: List[List[int]] = []
+    for i in range(0, len(items), batch_size):
+        batch = items[i:i + batch_size]
+        if chat_template:
+            rows.extend(tokenizer.apply_chat_template(
+                batch, add_generation_prompt=add_generation_prompt, tokenize=True
+            ))
+        else:
+            rows.extend(tokenizer(batch)["input_ids"])
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rows], out=offsets[1:])
+    ids = np.fromiter((t for r in rows for t in r), dtype=np.int32, count=int(offsets[-1]))
+
+    namespace.mkdir(parents=True, exist_ok=True)
+    # Offsets are written last, so a partial write is never mistaken for a hit
+    for array, target in ((ids, ids_file), (offsets, offsets_file)):
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, target)
+    if verbose:
+        print(f"✓ Tokenized {len(items)} items in {time.perf_counter() - start:.2f}s (cached in {namespace})")
+    return TokenizedTexts(np.load(ids_file, mmap_mode="r"), np.load(offsets_file, mmap_mode="r"))
+
+
+class LengthBucketSampler:
+    """
+    Batch sampler that groups examples of similar length.
+
+    Indices are shuffled, split into pools of ``batch_size * pool_batches``,
+    sorted by length inside each pool and cut into batches; the batches are then
+    shuffled.  Pass it as ``batch_sampler`` to a ``torch.utils.data.DataLoader``
+    and call ``set_epoch`` each epoch for a new order.
+
+    Example:
+        >>> lengths = pretokenize(contexts, model.tokenizer).lengths
+        >>> loader = DataLoader(examples, batch_sampler=LengthBucketSampler(lengths, BATCH_SIZE))
+    """
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        batch_size: int,
+        pool_batches: int = 50,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            lengths: Sort key per example, e.g. token count (or summed token
+                counts for multi-text examples)
+            batch_size: Examples per batch
+            pool_batches: Batches per sorting pool; larger pools pad less but
+                make batch contents less random
+            shuffle: Whether to shuffle before pooling and after batching
+            drop_last: Drop the final short batch of each pool
+            seed: Base random seed
+        """
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.pool_batches = pool_batches
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[List[int]]:
+        rng = random.Random(self.seed + self.epoch)
+        indices = list(range(len(self.lengths)))
+        if self.shuffle:
+            rng.shuffle(indices)
+
+        pool_size = self.batch_size * self.pool_batches
+        batches = []
+        for p in range(0, len(indices), pool_size):
+            pool = sorted(indices[p:p + pool_size], key=lambda i: self.lengths[i])
+            for b in range(0, len(pool), self.batch_size):
+                batch = pool[b:b + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+        if self.shuffle:
+            rng.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self) -> int:
+        pool_size = self.batch_size * self.pool_batches
+        full_pools, rest = divmod(len(self.lengths), pool_size)
+        last = rest // self.batch_size if self.drop_last else -(-rest // self.batch_size)
+        return full_pools * self.pool_batches + last
+
+
+def padding_ratio(lengths: np.ndarray, batches: Sequence[Sequence[int]]) -> float:
+    """
+    Fraction of padded positions when each batch is padded to its longest example.
+
+    Args:
+        lengths: Token counts of shape (n_examples,) or (n_examples, n_texts);
+            each text column is padded separately, as ``smart_batching_collate`` does
+        batches: Lists of example indices
+
+    Returns:
+        Padding tokens / total tokens, between 0 and 1
+    """
+    lengths = np.asarray(lengths)
+    lengths = lengths.reshape(len(lengths), -1)
+    padded = real = 0
+    for batch in batches:
+        rows = lengths[list(batch)]
+        padded += int(rows.max(axis=0).sum()) * len(batch)
+        real += int(rows.sum())
+    return 1 - real / padded if padded else 0.0
+
+
+def benchmark_length_bucketing(
+    model,
+    pairs: Sequence[Sequence[str]],
+    batch_size: int = 32,
+    steps: int = 20,
+    cache_dir: str = "token_cache",
+    verbose: bool = True,
+) -> List[Dict]:
+    """
+    Compare random batches with ``LengthBucketSampler`` batches for embedding training.
+
+    Padding is measured over a full epoch; step time is the mean of ``steps``
+    ``MultipleNegativesRankingLoss`` forward/backward passes (no optimizer step).
+
+    Args:
+        model: A ``SentenceTransformer``
+        pairs: (question, context) texts per example
+        batch_size: Examples per batch
+        steps: Timed training steps per ordering
+        cache_dir: Token cache directory
+        verbose: Whether to print a summary table
+
+    Returns:
+        List of dictionaries with "sampler", "padding_ratio" and "ms_per_step"
+
+    Example:
+        >>> benchmark_length_bucketing(model, [e.texts for e in examples], batch_size=BATCH_SIZE)
+    """
+    import torch
+    from sentence_transformers.losses import MultipleNegativesRankingLoss
+    from sentence_transformers.util import batch_to_device
+
+    pairs = [list(p) for p in pairs]
+    columns = list(zip(*pairs))
+    lengths = np.stack(
+        [np.minimum(pretokenize(col, model.tokenizer, cache_dir, verbose=False).lengths, model.max_seq_length)
+         for col in columns],
+        axis=1,
+    )
+    loss = MultipleNegativesRankingLoss(model)
+    model.train()
+
+    def random_batches():
+        order = list(range(len(pairs)))
+        random.Random(0).shuffle(order)
+        return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+    rows = []
+    for name, batches in (
+        ("random", random_batches()),
+        ("length-bucketed", list(LengthBucketSampler(lengths.sum(axis=1), batch_size))),
+    ):
+        timed = batches[:steps + 1]
+        seconds = 0.0
+        for step, batch in enumerate(timed):
+            features = [
+                batch_to_device(model.tokenize([pairs[i][c] for i in batch]), model.device)
+                for c in range(len(columns))
+            ]
+            start = time.perf_counter()
+            loss(features, torch.zeros(len(batch))).backward()
+            model.zero_grad()
+            if step:  # the first step is a warm-up
+                seconds += time.perf_counter() - start
+        rows.append({
+            "sampler": name,
+            "padding_ratio": padding_ratio(lengths, batches),
+            "ms_per_step": 1000 * seconds / max(len(timed) - 1, 1),
+        })
+
+    if verbose:
+        print(f"{'Sampler':<16} {'Padding':>8} {'ms/step':>9}")
+        print("-" * 35)
+        for r in rows:
+            print(f"{r['sampler']:<16} {r['padding_ratio']:>8.1%} {r['ms_per_step']:>9.1f}")
+        speedup = rows[0]["ms_per_step"] / rows[1]["ms_per_step"] if rows[1]["ms_per_step"] else float("inf")
+        print(f"✓ Length bucketing: {speedup:.2f}x faster per step")
+    return rows